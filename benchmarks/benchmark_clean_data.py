@@ -0,0 +1,125 @@
+"""
+benchmark_clean_data
+Compare the regex clean_data path with the streaming quote-aware cleaner on synthetic Survey123 CSVs.
+Each cleaner runs in its own process so that peak memory is measured separately.
+
+Usage:
+    python benchmarks/benchmark_clean_data.py --size-mb 2048 --size-mb 4096
+"""
+
+import os
+import re
+import sys
+import time
+import random
+import filecmp
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from medna_survey123.survey123_clean_csv import clean_csv_file  # noqa: E402
+
+HEADER = ('ObjectID,GlobalID,Survey DateTime,Site ID,General Location Name,Environmental Notes,'
+          'Latitude,Longitude,EditDate,Editor\n')
+NOTES = ['calm morning, no wind',
+         'heavy rain overnight\nwater slightly turbid',
+         'boat launch closed,\nsampled from dock\n"north" side',
+         '',
+         'ice along shore\n\nthin layer']
+
+
+def make_synthetic_csv(file_path, size_mb, seed=123):
+    """
+    Write a CSV shaped like eDNA_Sampling_v14_0.csv with multi-line quoted notes until it reaches size_mb.
+    """
+    rng = random.Random(seed)
+    target_size = size_mb * 1024 * 1024
+    row_id = 0
+    with open(file_path, mode='w') as file_write:
+        file_write.write(HEADER)
+        written = len(HEADER)
+        while written < target_size:
+            rows = []
+            for _ in range(1000):
+                row_id += 1
+                notes = rng.choice(NOTES).replace('"', '""')
+                rows.append('{0},{{{0:08d}-aaaa-bbbb-cccc-dddddddddddd}},6/{1}/2021 2:30:00 PM,eSB_L0{2},'
+                            '"Sebago Lake, {2}","{3}",43.{4},-70.{4},6/{1}/2021 3:00:00 PM,fielduser\n'
+                            .format(row_id, rng.randint(1, 28), rng.randint(1, 9), notes, rng.randint(1000, 9999)))
+            chunk = ''.join(rows)
+            file_write.write(chunk)
+            written += len(chunk)
+
+
+def clean_regex(input_file, output_file):
+    """
+    Previous clean_data implementation, kept here for comparison.
+    """
+    with open(input_file, mode='r', errors='ignore') as file_read:
+        with open(output_file, mode='w') as file_write:
+            content = file_read.read()
+            content_new = re.sub(r'"[^"]*(?:""[^"]*)*"', lambda m: m.group(0).replace("\n", " "), content)
+            file_write.write(content_new)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def _run_cleaner(method, input_file, output_file, queue):
+    cleaner = clean_regex if method == 'regex' else clean_csv_file
+    start = time.perf_counter()
+    cleaner(input_file, output_file)
+    queue.put((time.perf_counter() - start, peak_rss_mb()))
+
+
+def run_cleaner(method, input_file, output_file):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_cleaner, args=(method, input_file, output_file, queue))
+    process.start()
+    elapsed, peak = queue.get()
+    process.join()
+    return elapsed, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--size-mb', type=int, action='append',
+                        help='Size of a synthetic CSV in MB. May be repeated. Default is 2048.')
+    parser.add_argument('--work-dir', default=None, help='Directory for the synthetic and cleaned CSVs.')
+    parser.add_argument('--skip-regex', action='store_true',
+                        help='Only run the streaming cleaner, e.g., when the regex path would not fit in memory.')
+    args = parser.parse_args()
+    sizes = args.size_mb or [2048]
+
+    work_dir = args.work_dir or tempfile.mkdtemp(prefix='benchmark_clean_data_')
+    print("{:>10} {:>10} {:>10} {:>10} {:>12}".format('size_mb', 'method', 'seconds', 'mb_per_s', 'peak_rss_mb'))
+    for size_mb in sizes:
+        input_file = os.path.join(work_dir, 'synthetic_{}mb.csv'.format(size_mb))
+        if not os.path.exists(input_file):
+            make_synthetic_csv(input_file, size_mb)
+        methods = ['stream'] if args.skip_regex else ['regex', 'stream']
+        outputs = {}
+        for method in methods:
+            output_file = os.path.join(work_dir, 'synthetic_{}mb_{}.csv'.format(size_mb, method))
+            elapsed, peak = run_cleaner(method, input_file, output_file)
+            outputs[method] = output_file
+            print("{:>10} {:>10} {:>10.2f} {:>10.1f} {:>12.1f}".format(size_mb, method, elapsed,
+                                                                        size_mb / elapsed, peak))
+        if len(outputs) == 2:
+            identical = filecmp.cmp(outputs['regex'], outputs['stream'], shallow=False)
+            print("{:>10} outputs identical: {}".format(size_mb, identical))
+        for output_file in outputs.values():
+            os.remove(output_file)
+
+
+if __name__ == '__main__':
+    main()
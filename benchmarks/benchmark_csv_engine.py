@@ -0,0 +1,66 @@
+"""
+benchmark_csv_engine
+Compare pandas' C parser with pyarrow's multithreaded CSV reader on the five Survey123 tables, both reading only
+the columns of the schema registry. Each table and engine runs in its own process so that peak memory is
+measured separately.
+
+Usage:
+    python benchmarks/benchmark_csv_engine.py --input-dir data/01_Original/
+    python benchmarks/benchmark_csv_engine.py --synthetic-rows 200000
+"""
+
+import os
+import sys
+import time
+import argparse
+import tempfile
+import multiprocessing
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from medna_survey123.survey123_schema import get_table_schema, CSV_ENGINES  # noqa: E402
+from benchmark_schema_parse import TABLE_FILES, make_synthetic_table, peak_rss_mb  # noqa: E402
+
+
+def _run_engine(engine, table_name, file_path, queue):
+    start = time.perf_counter()
+    table_df = get_table_schema(table_name).read_csv(file_path, engine=engine)
+    elapsed = time.perf_counter() - start
+    string_columns = sum(dtype.name.startswith('string') for dtype in table_df.dtypes)
+    queue.put((elapsed, peak_rss_mb(), table_df.memory_usage(deep=True).sum() / (1024 * 1024), string_columns))
+
+
+def run_engine(engine, table_name, file_path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_engine, args=(engine, table_name, file_path, queue))
+    process.start()
+    result = queue.get()
+    process.join()
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input-dir', default=None,
+                        help='Directory of the cleaned CSVs, e.g., MAIN_INPUT_STRIP_DIR.')
+    parser.add_argument('--synthetic-rows', type=int, default=100000,
+                        help='Rows of each synthetic table, used when --input-dir is not given. Default is 100000.')
+    args = parser.parse_args()
+
+    input_dir = args.input_dir
+    if input_dir is None:
+        input_dir = tempfile.mkdtemp(prefix='benchmark_csv_engine_')
+        for table_name, file_name in TABLE_FILES.items():
+            make_synthetic_table(os.path.join(input_dir, file_name), table_name, args.synthetic_rows)
+
+    print("{:>16} {:>8} {:>10} {:>12} {:>10} {:>12}".format('table', 'engine', 'seconds', 'peak_rss_mb',
+                                                             'frame_mb', 'arrow_text'))
+    for table_name, file_name in TABLE_FILES.items():
+        file_path = os.path.join(input_dir, file_name)
+        for engine in CSV_ENGINES:
+            elapsed, peak, frame_mb, string_columns = run_engine(engine, table_name, file_path)
+            print("{:>16} {:>8} {:>10.2f} {:>12.1f} {:>10.1f} {:>12}".format(table_name, engine, elapsed, peak,
+                                                                              frame_mb, string_columns))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,123 @@
+"""
+benchmark_schema_parse
+Compare reading every column of the five Survey123 tables and then subsetting and renaming them, with reading only
+the columns of the schema registry, with their dtypes, in one read_csv. Each table and method runs in its own
+process so that peak memory is measured separately.
+
+Usage:
+    python benchmarks/benchmark_schema_parse.py --input-dir data/01_Original/
+    python benchmarks/benchmark_schema_parse.py --synthetic-rows 200000
+"""
+
+import os
+import sys
+import time
+import random
+import argparse
+import tempfile
+import multiprocessing
+import pandas as pd
+
+sys.path.insert(0, os.path.abspath(os.path.join(os.path.dirname(__file__), '..')))
+from medna_survey123.survey123_schema import get_table_schema, SCHEMA_FLOAT, SCHEMA_INFER, \
+    SCHEMA_DATETIME  # noqa: E402
+
+# cleaned CSV of each table within input-dir, as in settings
+TABLE_FILES = {'survey': 'eDNA_Sampling_v14_0.csv',
+               'rep_crew': 'rep_crew_1.csv',
+               'rep_envmeas': 'rep_envmeas_2.csv',
+               'rep_collection': 'rep_collection_3.csv',
+               'rep_filter': 'rep_filter_4.csv'}
+# columns of the export that no subset keeps, e.g., hidden and calculated questions
+SYNTHETIC_UNUSED_COLUMNS = 40
+
+
+def make_synthetic_table(file_path, table_name, rows, seed=123):
+    """
+    Write a CSV with the schema's source columns of table_name plus unused columns, like a Survey123 export.
+    """
+    rng = random.Random(seed)
+    schema = get_table_schema(table_name)
+    unused = ['Unused Question {0}'.format(number) for number in range(SYNTHETIC_UNUSED_COLUMNS)]
+    values = []
+    for source, target, dtype in schema.columns:
+        if dtype == SCHEMA_FLOAT:
+            values.append(lambda: '{0:.6f}'.format(rng.uniform(-70, 45)))
+        elif dtype == SCHEMA_INFER:
+            values.append(lambda: rng.choice(['', '{0:.2f}'.format(rng.uniform(0, 100))]))
+        elif dtype == SCHEMA_DATETIME:
+            values.append(lambda: '6/{0}/2021 2:30:00 PM'.format(rng.randint(1, 28)))
+        else:
+            values.append(lambda: rng.choice(['', 'eSB_L01', 'calm morning, no wind', 'fielduser']))
+    frame = {source: [value() for _ in range(rows)] for (source, target, dtype), value in zip(schema.columns, values)}
+    for column in unused:
+        frame[column] = [rng.choice(['', 'yes', 'no', 'not applicable']) for _ in range(rows)]
+    pd.DataFrame(frame).to_csv(file_path, index=False)
+
+
+def peak_rss_mb():
+    try:
+        import resource
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is bytes on macOS and kilobytes on linux
+        return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+    except ImportError:
+        import psutil
+        return psutil.Process().memory_info().peak_wset / (1024 * 1024)
+
+
+def read_all_columns(table_name, file_path):
+    """
+    Previous subset_*_dataset implementation, kept here for comparison.
+    """
+    schema = get_table_schema(table_name)
+    table_df = pd.read_csv(file_path, index_col=False)
+    table_sub = table_df[schema.usecols].copy()
+    return table_sub.rename(columns=schema.rename)
+
+
+def read_schema_columns(table_name, file_path):
+    return get_table_schema(table_name).read_csv(file_path)
+
+
+def _run_reader(method, table_name, file_path, queue):
+    reader = read_all_columns if method == 'all' else read_schema_columns
+    start = time.perf_counter()
+    table_df = reader(table_name, file_path)
+    elapsed = time.perf_counter() - start
+    queue.put((elapsed, peak_rss_mb(), table_df.memory_usage(deep=True).sum() / (1024 * 1024)))
+
+
+def run_reader(method, table_name, file_path):
+    queue = multiprocessing.Queue()
+    process = multiprocessing.Process(target=_run_reader, args=(method, table_name, file_path, queue))
+    process.start()
+    elapsed, peak, frame_mb = queue.get()
+    process.join()
+    return elapsed, peak, frame_mb
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--input-dir', default=None,
+                        help='Directory of the cleaned CSVs, e.g., MAIN_INPUT_STRIP_DIR.')
+    parser.add_argument('--synthetic-rows', type=int, default=100000,
+                        help='Rows of each synthetic table, used when --input-dir is not given. Default is 100000.')
+    args = parser.parse_args()
+
+    input_dir = args.input_dir
+    if input_dir is None:
+        input_dir = tempfile.mkdtemp(prefix='benchmark_schema_parse_')
+        for table_name, file_name in TABLE_FILES.items():
+            make_synthetic_table(os.path.join(input_dir, file_name), table_name, args.synthetic_rows)
+
+    print("{:>16} {:>8} {:>10} {:>12} {:>10}".format('table', 'method', 'seconds', 'peak_rss_mb', 'frame_mb'))
+    for table_name, file_name in TABLE_FILES.items():
+        file_path = os.path.join(input_dir, file_name)
+        for method in ('all', 'schema'):
+            elapsed, peak, frame_mb = run_reader(method, table_name, file_path)
+            print("{:>16} {:>8} {:>10.2f} {:>12.1f} {:>10.1f}".format(table_name, method, elapsed, peak, frame_mb))
+
+
+if __name__ == '__main__':
+    main()
@@ -4,20 +4,41 @@ Download from ArcGIS Online, clean and join tables, and upload data to google sh
 Created By: mkimble
 """
 
-import re, os, arcpy, glob
+import io, os, glob
 from shutil import copy2
-from distutils.dir_util import copy_tree
 from . import settings
-from arcgis.gis import GIS, Item
 from datetime import date
 import pandas as pd
 import numpy as np
 from .logger_settings import api_logger
+from .survey123_clean_csv import CleanedCSVReader, clean_csv_file, clean_csv_files
+from .survey123_delta_sync import FeatureServiceDeltaSync
+from .survey123_fingerprint import FingerprintManifest, fingerprint_zip
+from .survey123_stage_graph import StageGraph
+from .survey123_session import AGOLTokenCache, AGOLSession
+from .survey123_export_jobs import ExportJobManager, EXPORT_DEADLINE
+from .survey123_attachment_writer import AttachmentWriter, ATTACHMENT_WRITERS, ATTACHMENT_QUEUE_DEPTH
+from .survey123_attachment_manifest import AttachmentManifest, ATTACHMENT_ID_FIELD, ATTACHMENT_SIZE_FIELD, \
+    ATTACHMENT_ID_BATCH_SIZE
+from .survey123_sync import DirectorySync
+from .survey123_fgdb_backend import get_fgdb_reader
+from .survey123_attachment_store import AttachmentStore
+from .survey123_derivatives import DerivativeBuilder
+from .survey123_attachment_archive import AttachmentArchive
+from .survey123_attachment_index import AttachmentSampleIndex, build_attachment_index, REP_IMG_TABLE, \
+    GLOBALID_FIELD, PARENT_GLOBALID_FIELD, REL_GLOBALID_FIELD
+from .survey123_photo_metadata import extract_photo_metadata, join_photo_survey
+from .survey123_attachment_process import AttachmentProcess
+from .survey123_schema import get_table_schema
+from .survey123_table_store import TableStore
+from .survey123_dtype_plan import apply_dtype_plan
+from .survey123_projects import ProjectCodeTranslator
 # https://developers.arcgis.com/labs/python/download-data/
 # https://community.esri.com/t5/python-questions/using-python-to-download-survey123-survey-in-excel/td-p/724556
 # Python Standard Library Modules
 # from pathlib import Path
 from zipfile import ZipFile
+from concurrent.futures import as_completed
 # for google sheets upload
 import gspread
 from oauth2client.service_account import ServiceAccountCredentials
@@ -29,33 +50,265 @@ from googleapiclient.errors import HttpError
 
 def run_download_upload(formats, download=True, upload=True, overwrite=True,
                         extract_attachments=True, join_tables=True,
-                        backup=True, attachments_backup=True):
+                        backup=True, attachments_backup=True, parallel_clean=False, incremental=False,
+                        skip_unchanged=False, in_memory=False, stage_graph=False, targets=None, max_workers=4,
+                        concurrent_export=False, export_deadline=EXPORT_DEADLINE, segmented_download=False,
+                        incremental_attachments=False, attachments_backend='auto', dedup_attachments=False,
+                        build_derivatives=False, archive_attachments=None, attachment_index=False,
+                        photo_metadata=False, attachments_process=False, table_store=None, csv_engine='c',
+                        dtype_plan=False, schema_fallback_version=settings.SURVEY123_SCHEMA_FALLBACK,
+                        survey_project_filename=settings.SURVEY_PROJECT_FILENAME):
     """
      run download and upload
     """
+    # one worker process for arcpy attachment extraction, so that the CSV path never imports arcpy
+    attachment_process = AttachmentProcess() if attachments_process else None
     try:
         api_logger.info("[START] run_download_upload")
+        if stage_graph or targets:
+            # these change how a whole format is downloaded and processed, which the graph splits into stages.
+            # The graph already logs in once and downloads the formats side by side, as concurrent_export does.
+            unsupported = [name for name, value in [('incremental', incremental), ('skip_unchanged', skip_unchanged),
+                                                    ('in_memory', in_memory), ('concurrent_export', concurrent_export),
+                                                    ('attachments_process', attachments_process)] if value]
+            if unsupported:
+                raise ValueError("stage_graph does not support " + ", ".join(unsupported))
+            # run as a graph of stages so that independent stages run side by side
+            graph = build_stage_graph(formats, download=download, upload=upload, overwrite=overwrite,
+                                      extract_attachments=extract_attachments, join_tables=join_tables,
+                                      backup=backup, attachments_backup=attachments_backup,
+                                      parallel_clean=parallel_clean, max_workers=max_workers,
+                                      export_deadline=export_deadline, segmented_download=segmented_download,
+                                      incremental_attachments=incremental_attachments,
+                                      attachments_backend=attachments_backend, dedup_attachments=dedup_attachments,
+                                      build_derivatives=build_derivatives, archive_attachments=archive_attachments,
+                                      attachment_index=attachment_index, photo_metadata=photo_metadata,
+                                      table_store=table_store, csv_engine=csv_engine, dtype_plan=dtype_plan,
+                                      schema_fallback_version=schema_fallback_version,
+                                      survey_project_filename=survey_project_filename)
+            graph.run(targets)
+            api_logger.info("[END] run_download_upload")
+            return
+        # stages skipped because the export was unchanged since the last successful run
+        stage_skips = {}
+        # formats downloaded by this run, to finish their attachments once the CSVs are uploaded
+        download_results = []
 
         # if download is true, then call DownloadCleanJoinData to download from AGOL
         if download:
-            for fmt in formats:
-                download_result = DownloadCleanJoinData(fmt, overwrite, extract_attachments, join_tables,
-                                                        backup, attachments_backup)
+            # every format shares one AGOL session, logged in once up front if any format is exported
+            agol_session = None
+            download_results = [DownloadCleanJoinData(fmt, overwrite, extract_attachments, join_tables,
+                                                      backup, attachments_backup, parallel_clean,
+                                                      incremental=incremental, skip_unchanged=skip_unchanged,
+                                                      in_memory=in_memory, agol_session=agol_session,
+                                                      export_deadline=export_deadline,
+                                                      segmented_download=segmented_download,
+                                                      incremental_attachments=incremental_attachments,
+                                                      attachments_backend=attachments_backend,
+                                                      dedup_attachments=dedup_attachments,
+                                                      build_derivatives=build_derivatives,
+                                                      archive_attachments=archive_attachments,
+                                                      attachment_index=attachment_index,
+                                                      photo_metadata=photo_metadata,
+                                                      attachment_process=attachment_process,
+                                                      table_store=table_store,
+                                                      csv_engine=csv_engine,
+                                                      dtype_plan=dtype_plan,
+                                                      schema_fallback_version=schema_fallback_version,
+                                                      survey_project_filename=survey_project_filename)
+                                for fmt in formats]
+            if attachment_process is not None:
+                # start the FGDB first so that its attachments are extracted while the CSVs are cleaned and uploaded
+                download_results.sort(key=lambda download_result: download_result.download_format != 'File Geodatabase')
+            # submit every export as a background job, so that each format is processed while the exports after
+            # it are still building. With concurrent_export every export builds at the same time and each format
+            # is processed as soon as its zip is downloaded, otherwise one export builds at a time and formats
+            # are processed in order.
+            export_results = [download_result for download_result in download_results
+                              if download_result.needs_export()]
+            export_futures = {}
+            if export_results:
+                agol_session = agol_login()
+                export_job_manager = ExportJobManager(agol_session, settings.SURVEY123_ITEM_ID,
+                                                      deadline=export_deadline,
+                                                      max_workers=len(export_results) if concurrent_export else 1,
+                                                      segmented_download=segmented_download)
+                export_futures = {download_result.submit_export(export_job_manager): download_result
+                                  for download_result in export_results}
+                try:
+                    for export_future in as_completed(export_futures) if concurrent_export else list(export_futures):
+                        download_result = export_futures[export_future]
+                        download_result.agol_session = agol_session
+                        download_result.prefetched_file_path = export_future.result()
+                        download_result.download_data()
+                        stage_skips.update(download_result.stage_skips)
+                finally:
+                    export_job_manager.shutdown()
+            # formats without an export, e.g., incremental CSV or a zip already downloaded today. download_results
+            # keeps every format, so that each is finished below.
+            remaining_results = [download_result for download_result in download_results
+                                 if download_result not in export_futures.values()]
+            for download_result in remaining_results:
+                download_result.agol_session = download_result.agol_session or agol_session
                 download_result.download_data()
-            if backup:
-                download_result.backup_upload_data()
+                agol_session = download_result.agol_session
+                stage_skips.update(download_result.stage_skips)
+            # the uploaded CSVs are subset and joined from the CSV format
+            upload_result = next((download_result for download_result in download_results
+                                  if download_result.download_format == 'CSV'), None)
+            if backup and 'backup_upload_data' in stage_skips:
+                api_logger.info("run_download_upload: skipping backup_upload_data, " + stage_skips['backup_upload_data'])
+            elif backup and upload_result is None:
+                api_logger.info("run_download_upload: skipping backup_upload_data, CSV was not downloaded")
+            elif backup:
+                upload_result.backup_upload_data()
         # if upload is true, then call UploadData to upload to Google Sheets
         if upload:
             for fmt in formats:
-                if fmt == 'CSV':
+                if fmt == 'CSV' and 'upload_data' in stage_skips:
+                    api_logger.info("run_download_upload: skipping upload_data, " + stage_skips['upload_data'])
+                elif fmt == 'CSV':
                     upload = UploadData()
                     upload.upload_data()
                     # Use google API to call createSummarySpreadsheets from AppScripts
                     # this can only work if using a non-service account. Cannot use maine.edu to call AppScripts.
                     # upload.call_appscripts_api()
+        # wait for the attachment process, then index the attachments against the CSVs cleaned meanwhile
+        for download_result in download_results:
+            download_result.finish_attachments()
+        # only now that backup, upload and attachments have succeeded, so a failed run is retried by the next run
+        for download_result in download_results:
+            download_result.record_fingerprints()
         api_logger.info("[END] run_download_upload")
     except Exception as err:
         raise RuntimeError("** Error: run_download_upload Failed (" + str(err) + ")")
+    finally:
+        if attachment_process is not None:
+            attachment_process.shutdown()
+
+
+def agol_login(agol_username=settings.AGOL_USERNAME, agol_pass=settings.AGOL_PASS, token_cache_file=None):
+    """
+    Log in to ArcGIS Online with a token from the on-disk token cache, so that a password login only happens
+    when there is no cached token or it is about to expire. The returned AGOLSession can be shared by each
+    DownloadCleanJoinData, and opens a new GIS with a refreshed token once the token is about to expire.
+    :param token_cache_file: Filepath of the JSON token cache. Defaults to MAIN_INPUT_DIR.
+    """
+    token_cache = AGOLTokenCache(token_cache_file or settings.MAIN_INPUT_DIR + "agol_token_cache.json")
+    agol_session = AGOLSession(token_cache, agol_username, agol_pass)
+    agol_session.gis()
+    api_logger.info("agol_login: token cache hits {hits}, misses {misses}, refreshes {refreshes}".format(
+        **token_cache.stats))
+    return agol_session
+
+
+def build_stage_graph(formats, download=True, upload=True, overwrite=True,
+                      extract_attachments=True, join_tables=True,
+                      backup=True, attachments_backup=True, parallel_clean=False, max_workers=4,
+                      export_deadline=EXPORT_DEADLINE, segmented_download=False, incremental_attachments=False,
+                      attachments_backend='auto', dedup_attachments=False, build_derivatives=False,
+                      archive_attachments=None, attachment_index=False, photo_metadata=False, table_store=None,
+                      csv_engine='c', dtype_plan=False, schema_fallback_version=settings.SURVEY123_SCHEMA_FALLBACK,
+                      survey_project_filename=settings.SURVEY_PROJECT_FILENAME):
+    """
+    Model run_download_upload as a graph of stages with declared inputs and outputs. Stages are named after
+    what they produce, e.g., download_csv, clean_data, subset_filter, clean_filter_join, upload_clean_filter_join,
+    so that a single target such as clean_filter_join can be run with only the stages it depends on.
+    Options are passed to each DownloadCleanJoinData as in run_download_upload.
+    """
+    graph = StageGraph(max_workers=max_workers)
+    if download:
+        # one AGOL session is shared by the download of every format
+        graph.add_stage('agol_login', agol_login)
+    for fmt in formats:
+        download_result = DownloadCleanJoinData(fmt, overwrite, extract_attachments, join_tables,
+                                                backup, attachments_backup, parallel_clean,
+                                                export_deadline=export_deadline,
+                                                segmented_download=segmented_download,
+                                                incremental_attachments=incremental_attachments,
+                                                attachments_backend=attachments_backend,
+                                                dedup_attachments=dedup_attachments,
+                                                build_derivatives=build_derivatives,
+                                                archive_attachments=archive_attachments,
+                                                attachment_index=attachment_index,
+                                                photo_metadata=photo_metadata,
+                                                table_store=table_store,
+                                                csv_engine=csv_engine,
+                                                dtype_plan=dtype_plan,
+                                                schema_fallback_version=schema_fallback_version,
+                                                survey_project_filename=survey_project_filename)
+        fmt_name = download_result.export_file_path()[0].lower()
+        if download:
+            graph.add_stage('download_' + fmt_name, download_result.download_zip, inputs=['agol_login'])
+            graph.add_stage('unzip_' + fmt_name, download_result.unzip_export, inputs=['download_' + fmt_name])
+        if fmt_name == 'fgdb' and download and extract_attachments:
+            graph.add_stage('extract_attachments',
+                            lambda fgdb_filename, dr=download_result: dr.extract_attachments_fgdb(
+                                fgdb_filename, index_attachments=False),
+                            inputs=['unzip_fgdb'])
+            if attachment_index or photo_metadata:
+                # resolve attachments to samples once the subsets of this run are written
+                subset_stages = ['subset_survey', 'subset_collection', 'subset_filter'] \
+                    if 'CSV' in formats and join_tables else []
+                graph.add_stage('attachment_index',
+                                lambda attachment_tables, *_, dr=download_result: dr.index_attachment_tables(
+                                    *attachment_tables),
+                                inputs=['extract_attachments'] + subset_stages)
+            if build_derivatives:
+                graph.add_stage('attachment_derivatives', lambda _, dr=download_result: dr.build_attachment_derivatives(),
+                                inputs=['extract_attachments'])
+        if fmt_name != 'csv':
+            continue
+        if download:
+            graph.add_stage('clean_data', lambda _, dr=download_result: dr.clean_data(), inputs=['unzip_csv'])
+        clean_inputs = ['clean_data'] if download else []
+        if join_tables:
+            graph.add_stage('subset_survey', lambda *_, dr=download_result: dr.subset_survey_dataset(),
+                            inputs=clean_inputs)
+            graph.add_stage('subset_crew', lambda *_, dr=download_result: dr.subset_crew_dataset(),
+                            inputs=clean_inputs)
+            graph.add_stage('subset_envmeas', lambda *_, dr=download_result: dr.subset_envmeas_dataset(),
+                            inputs=clean_inputs)
+            graph.add_stage('subset_collection', lambda *_, dr=download_result: dr.subset_collection_dataset(),
+                            inputs=clean_inputs)
+            graph.add_stage('subset_filter', lambda *_, dr=download_result: dr.subset_filter_dataset(),
+                            inputs=clean_inputs)
+            graph.add_stage('survey_crew_join', download_result.join_survey_crew,
+                            inputs=['subset_survey', 'subset_crew'])
+            graph.add_stage('survey_envmeas_join', download_result.join_survey_envmeas,
+                            inputs=['subset_survey', 'subset_envmeas'])
+            graph.add_stage('survey_collection_merge', download_result.merge_survey_collection,
+                            inputs=['subset_survey', 'subset_collection'])
+            graph.add_stage('survey_collection_join',
+                            lambda merge, dr=download_result: dict(zip(['survey_collection_join', 'clean_subcore_join'],
+                                                                       dr.join_survey_collection(merge))),
+                            inputs=['survey_collection_merge'],
+                            outputs=['survey_collection_join', 'clean_subcore_join'])
+            graph.add_stage('clean_filter_join', download_result.join_clean_filter,
+                            inputs=['subset_filter', 'survey_collection_merge'])
+            # outputs in the order of UploadData.upload_list
+            output_stages = ['subset_survey', 'survey_crew_join', 'survey_envmeas_join',
+                             'survey_collection_join', 'clean_filter_join', 'clean_subcore_join']
+        else:
+            output_stages = clean_inputs
+        if download and backup:
+            graph.add_stage('backup_upload_data', lambda *_, dr=download_result: dr.backup_upload_data(),
+                            inputs=output_stages)
+        if upload:
+            upload_result = UploadData()
+            graph.add_stage('open_spreadsheet', upload_result.open_spreadsheet)
+            if join_tables:
+                upload_inputs = [[output_stage] for output_stage in output_stages]
+            else:
+                upload_inputs = [clean_inputs] * len(upload_result.upload_list())
+            for upload_file, inputs in zip(upload_result.upload_list(), upload_inputs):
+                sheet_name = os.path.splitext(os.path.basename(upload_file))[0]
+                graph.add_stage('upload_' + sheet_name,
+                                lambda spreadsheet, *_, uf=upload_file, ur=upload_result: ur.upload_sheet(
+                                    spreadsheet[0], spreadsheet[1], uf),
+                                inputs=['open_spreadsheet'] + inputs)
+    return graph
 
 
 class DownloadCleanJoinData:
@@ -66,6 +319,15 @@ class DownloadCleanJoinData:
     :param join_tables: Boolean. If true, join and save cleaned original data to CSV.
     :param backup: Boolean. If true, save copy of zips downloaded from AGOL to desired backup location.
     :param attachments_backup: Boolean. If true, save copy of attachments extracted from FGDB to desired backup location.
+    :param parallel_clean: Boolean. If true, clean downloaded CSVs concurrently in a process pool.
+    :param clean_max_workers: Maximum number of processes for parallel_clean. Defaults to the number of CPUs.
+    :param incremental: Boolean. If true and CSV, fetch only rows edited since the last run instead of exporting.
+    :param watermark_file: Filepath of the EditDate high-water marks for incremental. Defaults to main_input_dir.
+    :param skip_unchanged: Boolean. If true, skip clean, join, backup, and upload when the export is unchanged.
+    :param fingerprint_file: Filepath of the export fingerprint manifest for skip_unchanged. Defaults to main_input_dir.
+    :param in_memory: Boolean. If true and CSV, parse cleaned tables straight from the zip and join in memory.
+    :param in_memory_side_output: Boolean. If true and in_memory, also write the cleaned CSVs to main_input_strip_dir.
+    :param agol_session: Optional AGOLSession to share between instances. Logs in on first use if not provided.
     :param main_input_dir: Primary directory for AGOL downloads.
     :param main_input_strip_dir: Primary directory for saving cleaned original data.
     :param survey123_item_id: Item ID of the file geodatabase
@@ -85,8 +347,12 @@ class DownloadCleanJoinData:
     :param rep_filter: Filepath to cleaned rep_filter_4.csv (strip /n within "")
     :param survey_projects: Expects python dictionary. Used to convert coded project values to label.
     :param survey_sub_filename: Filename for eDNA_Sampling_v14_0 subset CSV.
+    :param survey_project_filename: Filename for the survey to project bridge of the eDNA_Sampling_v14_0 subset.
     :param survey_collection_join_filename: Filename for eDNA_Sampling_v14_0 and rep_collection_3 joined CSV.
     :param clean_filter_join_filename: Filepath for eDNA_Sampling_v14_0, rep_collection_3, and rep_filter_4 joined CSV.
+    :param photo_metadata_file: Filepath of the photo EXIF cache for photo_metadata. Defaults to main_input_dir.
+    :param photo_survey_join_file: Filepath of the photos joined to surveys for photo_metadata, which
+    PhotoSpatialIndex.read queries. Defaults to main_output_dir.
     """
     def __init__(self, download_format,
                  overwrite=False,
@@ -94,6 +360,37 @@ class DownloadCleanJoinData:
                  join_tables=True,
                  backup=True,
                  attachments_backup=True,
+                 parallel_clean=False,
+                 clean_max_workers=None,
+                 incremental=False,
+                 watermark_file=None,
+                 skip_unchanged=False,
+                 fingerprint_file=None,
+                 in_memory=False,
+                 in_memory_side_output=False,
+                 agol_session=None,
+                 export_deadline=EXPORT_DEADLINE,
+                 segmented_download=False,
+                 attachment_writers=ATTACHMENT_WRITERS,
+                 attachment_queue_depth=ATTACHMENT_QUEUE_DEPTH,
+                 incremental_attachments=False,
+                 attachments_manifest_file=None,
+                 attachments_backend='auto',
+                 dedup_attachments=False,
+                 attachment_store_dir=None,
+                 build_derivatives=False,
+                 derivatives_dir=None,
+                 archive_attachments=None,
+                 attachment_index=False,
+                 attachment_index_file=None,
+                 photo_metadata=False,
+                 photo_metadata_file=None,
+                 photo_survey_join_file=None,
+                 attachment_process=None,
+                 table_store=None,
+                 csv_engine='c',
+                 dtype_plan=False,
+                 schema_fallback_version=settings.SURVEY123_SCHEMA_FALLBACK,
                  main_input_dir=settings.MAIN_INPUT_DIR,
                  main_input_strip_dir=settings.MAIN_INPUT_STRIP_DIR,
                  survey123_item_id=settings.SURVEY123_ITEM_ID,
@@ -114,6 +411,7 @@ class DownloadCleanJoinData:
                  rep_filter=settings.REP_FILTER,
                  survey_projects=settings.SURVEY_PROJECTS,
                  survey_sub_filename=settings.SURVEY_SUB_FILENAME,
+                 survey_project_filename=settings.SURVEY_PROJECT_FILENAME,
                  crew_sub_filename=settings.CREW_SUB_FILENAME,
                  envmeas_sub_filename=settings.ENVMEAS_SUB_FILENAME,
                  collection_sub_filename=settings.COLLECTION_SUB_FILENAME,
@@ -141,8 +439,37 @@ class DownloadCleanJoinData:
         self.attachments_field = attachments_field
         # Attachments dir
         self.attachments_dir = attachments_dir
+        # Attachment writer threads and maximum number of blobs waiting to be written
+        self.attachment_writers = attachment_writers
+        self.attachment_queue_depth = attachment_queue_depth
+        # Extract only new or changed attachments boolean and manifest of extracted attachments
+        self.incremental_attachments = incremental_attachments
+        self.attachments_manifest_file = attachments_manifest_file or main_input_dir + "attachments_manifest.json"
+        # Read the attachments table with 'arcpy', 'gdal', or whichever can be imported with 'auto'
+        self.attachments_backend = attachments_backend
+        # Store each unique attachment once and hardlink attachment names to it boolean, and store dir
+        self.dedup_attachments = dedup_attachments
+        self.attachment_store_dir = attachment_store_dir or main_input_dir + "attachment_store/"
+        # Build thumbnails and web versions of attachments boolean and dir
+        self.build_derivatives = build_derivatives
+        self.derivatives_dir = derivatives_dir or main_input_dir + "attachment_derivatives/"
+        # Back up attachments into one tar per 'month' or per 'run' instead of file by file, or None
+        self.archive_attachments = archive_attachments
+        # Index attachments by survey, collection and filter barcode boolean and Parquet index filepath
+        self.attachment_index = attachment_index
+        self.attachment_index_file = attachment_index_file or main_output_dir + "attachment_index.parquet"
+        # Read EXIF of photos and join to surveys boolean, EXIF cache, and joined output
+        self.photo_metadata = photo_metadata
+        self.photo_metadata_file = photo_metadata_file or main_input_dir + "photo_metadata.parquet"
+        self.photo_survey_join_file = photo_survey_join_file or main_output_dir + "photo_survey_join.parquet"
+        # AttachmentProcess to extract attachments in, or None to extract within download_data, and its Future
+        self.attachment_process = attachment_process
+        self.attachments_future = None
+        self.pending_fingerprints = None
         # Output dir
         self.main_output_dir = main_output_dir
+        # Write subset and joined tables to main_output_dir as 'parquet' or 'feather', or None for CSV only
+        self.table_store = TableStore(main_output_dir, table_store) if table_store else None
         # Backup data and backup attachments boolean
         self.backup = backup
         self.attachments_backup = attachments_backup
@@ -150,6 +477,26 @@ class DownloadCleanJoinData:
         self.zip_backup_dirs = zip_backup_dirs
         self.upload_data_backup_dirs = upload_data_backup_dirs
         self.attachments_backup_dirs = attachments_backup_dirs
+        # Clean CSVs in parallel boolean
+        self.parallel_clean = parallel_clean
+        self.clean_max_workers = clean_max_workers
+        # Incremental sync boolean and EditDate watermarks
+        self.incremental = incremental
+        self.watermark_file = watermark_file or main_input_dir + "delta_sync_watermarks.json"
+        # Skip unchanged exports boolean, fingerprints of the last successful run, and stages skipped by this run
+        self.skip_unchanged = skip_unchanged
+        self.fingerprint_file = fingerprint_file or main_input_dir + "export_fingerprints.json"
+        self.stage_skips = {}
+        # Parse zip members in memory boolean and optional cleaned CSV side output
+        self.in_memory = in_memory
+        self.in_memory_side_output = in_memory_side_output
+        # shared AGOL session and zip downloaded ahead of download_data by prefetch_export
+        self.agol_session = agol_session
+        self.prefetched_file_path = None
+        # seconds an AGOL export may take to queue and build before it is abandoned
+        self.export_deadline = export_deadline
+        # Download exports with resumable range requests and verify them before clean boolean
+        self.segmented_download = segmented_download
         # Cleaned original data (strip /n within "")
         self.survey_data = survey_data
         self.rep_crew = rep_crew
@@ -157,8 +504,17 @@ class DownloadCleanJoinData:
         self.rep_collection = rep_collection
         self.rep_filter = rep_filter
         self.survey_projects = survey_projects
+        # project codes to labels, memoized per distinct project_ids value, and survey to project bridge filename
+        self.project_translator = ProjectCodeTranslator(survey_projects)
+        self.survey_project_filename = survey_project_filename
         # Join data boolean
         self.join_tables = join_tables
+        # Parse cleaned CSVs with pandas' 'c' parser or with 'pyarrow' into Arrow backed strings
+        self.csv_engine = csv_engine
+        # Categorical low cardinality fields and downcast measurements in the subset tables, kept through join_data
+        self.dtype_plan = dtype_plan
+        # Registered schema version to read with when survey123_version has no schema, or None to fail instead
+        self.schema_fallback_version = schema_fallback_version
         # subset data
         self.survey_sub_filename = survey_sub_filename
         self.crew_sub_filename = crew_sub_filename
@@ -186,62 +542,212 @@ class DownloadCleanJoinData:
             api_logger.info("[START] download_data")
             # https://support.esri.com/en/technical-article/000018909
             overwrite = self.overwrite
-            fmt = self.download_format
             extract_attachments = self.extract_attachments
             join_tables = self.join_tables
-            fmt_df = self.fmt_df
-            output_dir = self.main_input_dir
-            survey123_version = self.survey123_version
-            survey123_item_id = self.survey123_item_id
-            zip_backup_dirs = self.zip_backup_dirs
             backup = self.backup
 
-            today_date = date.today()
-            today_date_filename = str(today_date.strftime('%Y%m%d'))
-            fmt_name = fmt_df.loc[fmt_df['export_fmt'] == fmt, 'name_fmt'].values[0]
-            output_file_name = 'S123_' + survey123_item_id + '_' + fmt_name + '_' + survey123_version + '_' + today_date_filename + '.zip'
-            output_file_path = output_dir+output_file_name
+            fmt_name, output_file_name, output_file_path = self.export_file_path()
             file_exists = os.path.exists(output_file_path.strip())
-            if overwrite or not file_exists:
-                # if overwrite is true or if the file does not exist
-                agol_gis = GIS(username=self.agol_username,
-                               password=self.agol_pass)
-                # sm = SurveyManager(agol_gis, baseurl=None)
-                # data_item = sm.get(self.survey123_item_id)
-                data_item = Item(agol_gis, self.survey123_item_id)
-                # if str, convert to list so that str does not iterate through each letter
-                result = data_item.export(title=data_item.title, export_format=fmt)
-                # survey123_data_item = Survey(result, sm, baseurl=None)
-                if data_item is None:
-                    api_logger.info("download_data: No data received")
-                else:
-                    api_logger.info("download_data: Downloading data: "+output_dir+", format: "+fmt)
-                    # Download the data
-                    result.download(save_path=output_dir, file_name=output_file_name)
-                    if backup:
-                        for dir_backup in zip_backup_dirs:
-                            api_logger.info(
-                                "download_data: backing up [" + output_file_name + "] to [" + dir_backup + "]")
-                            copy2(output_file_path, dir_backup)
-                    api_logger.info("download_data: unzipping "+output_file_name)
-                    zip_file = ZipFile(output_file_path)
-                    zip_file.extractall(path=output_dir)
-                    if fmt_name == 'FGDB' and extract_attachments:
-                        fgdb_filename = list(set([os.path.dirname(zfile) for zfile in zip_file.namelist()]))[0]
-                        api_logger.info("download_data: Extracting attachments " + fgdb_filename)
-                        self.extract_attachments_fgdb(fgdb_filename)
-                    if fmt_name == 'CSV':
-                        self.clean_data()
-                    if fmt_name == 'CSV' and join_tables:
-                        self.join_data()
+            if fmt_name == 'CSV' and self.incremental:
+                # fetch rows edited since the last run straight into the cleaned CSVs instead of exporting
+                self.sync_data()
+                if join_tables:
+                    self.join_data()
+            elif self.prefetched_file_path or overwrite or not file_exists:
+                # if the zip was prefetched, overwrite is true, or if the file does not exist
+                if (self.prefetched_file_path or self.download_export()) is not None:
+                    changed_tables = None
+                    if self.skip_unchanged:
+                        # compare the tables within the zip to the last successful run before unzipping
+                        fingerprint_manifest = FingerprintManifest(self.fingerprint_file)
+                        fingerprints = fingerprint_zip(output_file_path)
+                        changed_tables = fingerprint_manifest.changed_members(fmt_name, fingerprints)
+                        api_logger.info("download_data: changed tables " + str(changed_tables))
+                    if changed_tables == []:
+                        reason = "export " + output_file_name + " is unchanged since the last successful run"
+                        self.skip_stage('backup_zip', reason)
+                        self.skip_stage('unzip', reason)
+                        if fmt_name == 'FGDB' and extract_attachments:
+                            self.skip_stage('extract_attachments_fgdb', reason)
+                        if fmt_name == 'CSV':
+                            self.skip_stage('clean_data', reason)
+                            self.skip_stage('join_data', reason)
+                            self.skip_stage('backup_upload_data', reason)
+                            self.skip_stage('upload_data', reason)
+                    elif fmt_name == 'CSV' and self.in_memory:
+                        if backup:
+                            self.backup_zip(output_file_path)
+                        # parse and clean straight from the zip and hand the DataFrames to join_data
+                        tables = self.read_zip_tables(output_file_path)
+                        if join_tables:
+                            self.join_data(tables)
+                    else:
+                        if backup:
+                            self.backup_zip(output_file_path)
+                        fgdb_filename = self.unzip_export(output_file_path)
+                        if fmt_name == 'FGDB' and extract_attachments and self.attachment_process is not None:
+                            api_logger.info("download_data: Extracting attachments in the attachment process " +
+                                            fgdb_filename)
+                            self.attachments_future = self.attachment_process.submit(self, fgdb_filename)
+                        elif fmt_name == 'FGDB' and extract_attachments:
+                            api_logger.info("download_data: Extracting attachments " + fgdb_filename)
+                            self.extract_attachments_fgdb(fgdb_filename)
+                            if self.build_derivatives:
+                                self.build_attachment_derivatives()
+                        if fmt_name == 'CSV':
+                            self.clean_data(changed_tables)
+                        if fmt_name == 'CSV' and join_tables:
+                            self.join_data()
+                    if self.skip_unchanged:
+                        # recorded by record_fingerprints once backup, upload and attachments have succeeded
+                        self.pending_fingerprints = (fingerprint_manifest, fmt_name, fingerprints)
             api_logger.info("[END] download_data")
         except Exception as err:
             raise RuntimeError("** Error: download_data Failed (" + str(err) + ")")
 
-    def extract_attachments_fgdb(self, fgdb_filename):
+    def export_file_path(self):
+        """
+        Name and filepath of today's zip for download_format.
+        :return: format short name, zip filename, and zip filepath
+        """
+        fmt_df = self.fmt_df
+        today_date = date.today()
+        today_date_filename = str(today_date.strftime('%Y%m%d'))
+        fmt_name = fmt_df.loc[fmt_df['export_fmt'] == self.download_format, 'name_fmt'].values[0]
+        output_file_name = 'S123_' + self.survey123_item_id + '_' + fmt_name + '_' + self.survey123_version + '_' + today_date_filename + '.zip'
+        output_file_path = self.main_input_dir + output_file_name
+        return fmt_name, output_file_name, output_file_path
+
+    def get_agol_session(self):
+        """
+        Shared AGOLSession, logging in on first use.
+        """
+        if self.agol_session is None:
+            self.agol_session = agol_login(self.agol_username, self.agol_pass)
+        return self.agol_session
+
+    def prefetch_export(self):
+        """
+        Export and download today's zip ahead of download_data, e.g., concurrently with other formats.
+        download_data then processes the prefetched zip instead of exporting again.
+        :return: filepath of the zip, or None if nothing was downloaded
+        """
+        if self.needs_export():
+            self.prefetched_file_path = self.download_export()
+        return self.prefetched_file_path
+
+    def needs_export(self):
+        """
+        True if download_data would export today's zip, i.e., overwrite is true or the zip does not exist yet.
+        Incremental CSV syncs query the feature service instead of exporting.
+        """
+        fmt_name, output_file_name, output_file_path = self.export_file_path()
+        if fmt_name == 'CSV' and self.incremental:
+            return False
+        return self.overwrite or not os.path.exists(output_file_path.strip())
+
+    def submit_export(self, export_job_manager):
+        """
+        Submit the export of download_format as a background job and return right away, so that other work
+        can continue while AGOL builds the export.
+        :param export_job_manager: ExportJobManager that polls the job and downloads the zip to main_input_dir.
+        :return: Future that resolves to the filepath of the downloaded zip
+        """
+        fmt_name, output_file_name, output_file_path = self.export_file_path()
+        api_logger.info("submit_export: Exporting data: " + self.main_input_dir + ", format: " + self.download_format)
+        return export_job_manager.submit(self.download_format, self.main_input_dir, output_file_name)
+
+    def download_zip(self, agol_session=None):
+        """
+        Download today's zip if overwrite is true or if it does not exist yet, and back it up if backup is true.
+        :param agol_session: Optional AGOLSession to share with other formats.
+        :return: filepath of the zip
+        """
+        self.agol_session = agol_session or self.agol_session
+        fmt_name, output_file_name, output_file_path = self.export_file_path()
+        if self.overwrite or not os.path.exists(output_file_path.strip()):
+            self.download_export()
+            if self.backup:
+                self.backup_zip(output_file_path)
+        return output_file_path
+
+    def download_export(self):
+        """
+        Export download_format from the AGOL feature layer and download the zip to main_input_dir.
+        :return: filepath of the downloaded zip, or None if no data was received
+        """
+        try:
+            api_logger.info("[START] download_export")
+            fmt = self.download_format
+            output_dir = self.main_input_dir
+            fmt_name, output_file_name, output_file_path = self.export_file_path()
+            agol_session = self.get_agol_session()
+            # sm = SurveyManager(agol_gis, baseurl=None)
+            # data_item = sm.get(self.survey123_item_id)
+            # poll the export job with backoff instead of blocking on it, and give up after export_deadline
+            export_job_manager = ExportJobManager(agol_session, self.survey123_item_id,
+                                                  deadline=self.export_deadline, max_workers=1,
+                                                  segmented_download=self.segmented_download)
+            api_logger.info("download_export: Downloading data: "+output_dir+", format: "+fmt)
+            try:
+                output_file_path = self.submit_export(export_job_manager).result()
+            finally:
+                export_job_manager.shutdown()
+            api_logger.info("[END] download_export")
+            return output_file_path
+        except Exception as err:
+            raise RuntimeError("** Error: download_export Failed (" + str(err) + ")")
+
+    def backup_zip(self, output_file_path):
+        """
+        Save a copy of a zip downloaded from AGOL to zip_backup_dirs.
+        """
+        for dir_backup in self.zip_backup_dirs:
+            api_logger.info(
+                "backup_zip: backing up [" + os.path.basename(output_file_path) + "] to [" + dir_backup + "]")
+            copy2(output_file_path, dir_backup)
+
+    def unzip_export(self, output_file_path):
+        """
+        Extract a zip downloaded from AGOL to main_input_dir.
+        :return: name of the first directory within the zip, e.g., the FGDB, or '' if the zip has no directories
+        """
+        api_logger.info("unzip_export: unzipping " + os.path.basename(output_file_path))
+        with ZipFile(output_file_path) as zip_file:
+            zip_file.extractall(path=self.main_input_dir)
+            return list(set([os.path.dirname(zfile) for zfile in zip_file.namelist()]))[0]
+
+    def sync_data(self):
+        """
+        Fetch rows created or edited since the last EditDate high-water mark of each layer from the AGOL
+        feature service and upsert them by GlobalID into the cleaned CSVs read by join_data.
+        """
+        try:
+            api_logger.info("[START] sync_data")
+            agol_session = self.get_agol_session()
+            data_item = agol_session.item(self.survey123_item_id)
+            layer_stores = {'survey': self.survey_data,
+                            'rep_crew': self.rep_crew,
+                            'rep_envmeas': self.rep_envmeas,
+                            'rep_collection': self.rep_collection,
+                            'rep_filter': self.rep_filter}
+            # the AGOL session adds a fresh token to each query
+            delta_sync = FeatureServiceDeltaSync(data_item.url, layer_stores, self.watermark_file,
+                                                 session=agol_session)
+            fetched = delta_sync.sync()
+            api_logger.info("sync_data: fetched " + str(fetched))
+            api_logger.info("[END] sync_data")
+            return fetched
+        except Exception as err:
+            raise RuntimeError("** Error: sync_data Failed (" + str(err) + ")")
+
+    def extract_attachments_fgdb(self, fgdb_filename, index_attachments=True):
         """
         If FGDB and extract_attachments is true, extract attachments. If attachments_backup is true,
         save extracted attachments to attachments_backup_dirs.
+        :param index_attachments: If false, the attachment index and photo metadata are left to the caller,
+        e.g., when extracting within the attachment process before the subset CSVs exist.
+        :return: attachment tables for index_attachment_tables if attachment_index or photo_metadata, else None
         """
         try:
             api_logger.info("[START] extract_attachments_fgdb")
@@ -254,26 +760,221 @@ class DownloadCleanJoinData:
 
             attachments_table = main_input_dir + fgdb_filename + '/rep_img__ATTACH'
             api_logger.info("extract_attachments_fgdb: attachments table " + attachments_table)
-            with arcpy.da.SearchCursor(attachments_table, [blob_field, attachments_field]) as cursor:
-                for row in cursor:
-                    binary_rep = row[0]
-                    file_name = row[1]
+            fgdb_reader = get_fgdb_reader(self.attachments_backend)
+            attachment_store = AttachmentStore(self.attachment_store_dir, attachments_dir) \
+                if self.dedup_attachments else None
+            # stream attachments from the cursor straight into the backup archives as they are extracted
+            archives = [AttachmentArchive(dir_backup, self.archive_attachments)
+                        for dir_backup in attachments_backup_dirs] \
+                if attachments_backup and self.archive_attachments else []
+            try:
+                for archive in archives:
+                    archive.open()
+                if self.incremental_attachments:
+                    self.extract_attachments_incremental(fgdb_reader, attachments_table, attachment_store, archives)
+                else:
+                    attachment_writer = AttachmentWriter(attachments_dir, max_workers=self.attachment_writers,
+                                                         queue_depth=self.attachment_queue_depth,
+                                                         store=attachment_store, sinks=archives)
                     # save to disk
-                    open(attachments_dir + os.sep + file_name, 'wb').write(binary_rep.tobytes())
-            if attachments_backup:
-                for dir_backup in attachments_backup_dirs:
-                    api_logger.info(
-                        "extract_attachments_fgdb: backing up attachments to [" + dir_backup + "]")
-                    copy_tree(attachments_dir, dir_backup)
+                    attachment_writer.write_rows(
+                        fgdb_reader.search(attachments_table, [blob_field, attachments_field]))
+            except Exception:
+                for archive in archives:
+                    archive.abort()
+                raise
+            for archive in archives:
+                archive.close()
+                api_logger.info("extract_attachments_fgdb: archived to [{0}] {1} attachments, {2:.1f} MB, "
+                                "{3} already archived".format(archive.archive_path, archive.stats['appended'],
+                                                              archive.stats['bytes_appended'] / 1048576.0,
+                                                              archive.stats['already_archived']))
+            if attachment_store is not None:
+                attachment_store.prune()
+                attachment_store.save()
+                attachment_store.dedup_report()
+            attachment_tables = None
+            if self.attachment_index or self.photo_metadata:
+                attachment_tables = self.read_attachment_tables(fgdb_reader, main_input_dir + fgdb_filename)
+                if index_attachments:
+                    self.index_attachment_tables(*attachment_tables)
+            if attachments_backup and not archives:
+                api_logger.info(
+                    "extract_attachments_fgdb: backing up attachments to " + str(attachments_backup_dirs))
+                # copy only new or changed attachments, to every backup dir at the same time
+                DirectorySync(attachments_dir, attachments_backup_dirs).sync()
             api_logger.info("[END] extract_attachments_fgdb")
+            return attachment_tables
         except Exception as err:
             raise RuntimeError("** Error: extract_attachments_fgdb Failed (" + str(err) + ")")
 
-    def clean_data(self):
+    def finish_attachments(self):
+        """
+        Wait for attachments submitted to the attachment process, then build the attachment index, photo metadata
+        and derivatives, which need the subset CSVs or no arcpy.
+        """
+        if self.attachments_future is None:
+            return
+        try:
+            api_logger.info("[START] finish_attachments")
+            result = self.attachments_future.result()
+            self.attachments_future = None
+            if result['attachment_tables'] is not None:
+                self.index_attachment_tables(*result['attachment_tables'])
+            if self.build_derivatives:
+                self.build_attachment_derivatives()
+            api_logger.info("[END] finish_attachments")
+        except Exception as err:
+            raise RuntimeError("** Error: finish_attachments Failed (" + str(err) + ")")
+
+    def record_fingerprints(self):
+        """
+        Record the fingerprints of the export downloaded by download_data as the last successful run, so that
+        the next run with skip_unchanged skips it while unchanged. Call once backup, upload and attachments have
+        succeeded, so a run that fails after download is not skipped by the next run.
+        """
+        if self.pending_fingerprints is None:
+            return
+        fingerprint_manifest, fmt_name, fingerprints = self.pending_fingerprints
+        fingerprint_manifest.record_run(fmt_name, fingerprints, self.stage_skips, successful=True)
+        self.pending_fingerprints = None
+        api_logger.info("record_fingerprints: recorded " + fmt_name + " as the last successful run")
+
+    def __getstate__(self):
+        # sent to the attachment process, which needs neither the AGOL session nor the Future
+        state = self.__dict__.copy()
+        state['agol_session'] = None
+        state['attachment_process'] = None
+        state['attachments_future'] = None
+        state['pending_fingerprints'] = None
+        return state
+
+    def read_attachment_tables(self, fgdb_reader, fgdb_path):
+        """
+        Read the ids, names and GlobalIDs of rep_img__ATTACH and rep_img, without the blobs.
+        :param fgdb_reader: Reader from get_fgdb_reader.
+        :param fgdb_path: Filepath of the unzipped file geodatabase.
+        :return: attachments_df and rep_img_df for index_attachment_tables
+        """
+        attachments_df = pd.DataFrame(
+            list(fgdb_reader.search(fgdb_path + '/rep_img__ATTACH',
+                                    [ATTACHMENT_ID_FIELD, self.attachments_field, REL_GLOBALID_FIELD])),
+            columns=['attachment_id', 'att_name', 'rel_global_id'])
+        rep_img_df = pd.DataFrame(
+            list(fgdb_reader.search(fgdb_path + '/' + REP_IMG_TABLE, [GLOBALID_FIELD, PARENT_GLOBALID_FIELD])),
+            columns=['img_global_id', 'img_parent_global_id'])
+        return attachments_df, rep_img_df
+
+    def index_attachment_tables(self, attachments_df, rep_img_df):
+        """
+        Map each attachment to survey_global_id, collection_global_id and filter_barcode through its rep_img row,
+        and save the map to attachment_index_file. If photo_metadata is true, also join photo EXIF to surveys.
+        Collections and filters are read from the subset CSVs, so the CSV format should be downloaded before the
+        File Geodatabase, or the File Geodatabase extracted within the attachment process.
+        """
+        api_logger.info("[START] build_attachment_index")
+        survey_df = self.read_output_table(self.survey_sub_filename, ['survey_global_id'])
+        collection_df = self.read_output_table(self.collection_sub_filename,
+                                               ['collection_global_id', 'collection_ParentGlobalID'])
+        filter_df = self.read_output_table(self.filter_sub_filename,
+                                           ['filter_global_id', 'filter_ParentGlobalID', 'filter_barcode'])
+        if survey_df is not None and collection_df is not None and filter_df is not None:
+            survey_ids = survey_df['survey_global_id']
+        else:
+            api_logger.info("build_attachment_index: subset CSVs not found, attachments are not resolved to samples")
+            survey_ids = pd.Series([], dtype='object')
+            collection_df = pd.DataFrame(columns=['collection_global_id', 'collection_ParentGlobalID'])
+            filter_df = pd.DataFrame(columns=['filter_global_id', 'filter_ParentGlobalID', 'filter_barcode'])
+        index_df = build_attachment_index(attachments_df, rep_img_df, survey_ids, collection_df, filter_df)
+        AttachmentSampleIndex(self.attachment_index_file).write(index_df)
+        api_logger.info("[END] build_attachment_index")
+        if self.photo_metadata:
+            self.build_photo_metadata(index_df)
+        return index_df
+
+    def build_photo_metadata(self, attachment_index_df):
+        """
+        Read the EXIF capture time, GPS and camera of new photos in parallel, join them to survey_sub, and save the
+        join to photo_survey_join_file, which PhotoSpatialIndex.read queries by bounding box or site.
+        :return: DataFrame of the photos joined to survey_sub
+        """
+        api_logger.info("[START] build_photo_metadata")
+        metadata_df = extract_photo_metadata(self.attachments_dir, self.photo_metadata_file)
+        survey_sub_df = self.read_output_table(self.survey_sub_filename,
+                                               ['survey_global_id', 'site_id', 'lat_manual', 'long_manual'])
+        if survey_sub_df is None:
+            api_logger.info("build_photo_metadata: " + self.survey_sub_filename + " not found, photos are not "
+                            "compared to sites")
+            survey_sub_df = pd.DataFrame(columns=['survey_global_id', 'site_id', 'lat_manual', 'long_manual'])
+        photo_join = join_photo_survey(metadata_df, attachment_index_df, survey_sub_df)
+        tmp_file = self.photo_survey_join_file + '.tmp'
+        photo_join.to_parquet(tmp_file, engine='pyarrow', index=False)
+        os.replace(tmp_file, self.photo_survey_join_file)
+        api_logger.info("build_photo_metadata: {0} photos taken further than their site, e.g., {1}".format(
+            photo_join['far_from_site'].sum(), photo_join.loc[photo_join['far_from_site'], 'att_name'].head(5).tolist()))
+        api_logger.info("[END] build_photo_metadata")
+        return photo_join
+
+    def build_attachment_derivatives(self):
+        """
+        Build thumbnails and web versions of new or changed attachments in attachments_dir.
+        """
+        return DerivativeBuilder(self.attachments_dir, self.derivatives_dir).build()
+
+    def extract_attachments_incremental(self, fgdb_reader, attachments_table, attachment_store=None, archives=()):
+        """
+        Write only the attachments that are new or changed since the last run and remove attachments deleted
+        from attachments_table, using the manifest in attachments_manifest_file.
+        :param fgdb_reader: Reader from get_fgdb_reader.
+        :param attachment_store: Optional AttachmentStore to write each unique attachment to once.
+        :param archives: Optional AttachmentArchives to also append the written attachments to.
+        """
+        attachments_field = self.attachments_field
+        attachment_manifest = AttachmentManifest(self.attachments_manifest_file, self.attachments_dir)
+        # compare ids, names and sizes first so that the blobs of unchanged attachments are never read
+        to_write, deleted = attachment_manifest.plan(
+            fgdb_reader.search(attachments_table, [ATTACHMENT_ID_FIELD, attachments_field, ATTACHMENT_SIZE_FIELD]))
+        api_logger.info("extract_attachments_fgdb: {0} new or changed attachments, {1} deleted".format(
+            len(to_write), len(deleted)))
+        written_rows = []
+
+        def blob_rows():
+            for batch_start in range(0, len(to_write), ATTACHMENT_ID_BATCH_SIZE):
+                batch = to_write[batch_start:batch_start + ATTACHMENT_ID_BATCH_SIZE]
+                where_clause = ATTACHMENT_ID_FIELD + " IN (" + ",".join(str(int(i)) for i in batch) + ")"
+                for blob, file_name, attachment_id, size in fgdb_reader.search(
+                        attachments_table, [self.blob_field, attachments_field, ATTACHMENT_ID_FIELD,
+                                            ATTACHMENT_SIZE_FIELD],
+                        where_clause=where_clause):
+                    written_rows.append((attachment_id, file_name, size))
+                    # digests are keyed by attachment ID, as attachments of different rows can share a name
+                    yield blob, file_name, attachment_id
+
+        attachment_writer = AttachmentWriter(self.attachments_dir, max_workers=self.attachment_writers,
+                                             queue_depth=self.attachment_queue_depth, hash_blobs=True,
+                                             store=attachment_store, sinks=archives)
+        attachment_writer.write_rows(blob_rows())
+        for attachment_id, file_name, size in written_rows:
+            attachment_manifest.record(attachment_id, file_name, size, attachment_writer.digests[attachment_id])
+        removed = attachment_manifest.remove_deleted(deleted)
+        attachment_manifest.save()
+        api_logger.info("extract_attachments_fgdb: wrote {0} attachments, removed {1}".format(
+            len(written_rows), removed))
+
+    def skip_stage(self, stage, reason):
+        """
+        Record that stage was skipped and why.
+        """
+        self.stage_skips[stage] = reason
+        api_logger.info("skip_stage: skipping " + stage + ", " + reason)
+
+    def clean_data(self, changed_tables=None):
         """
         Note text fields allow carriage returns, but carriage returns are not stripped from original data.
         These new lines cause issues with reading in CSV data directly from AGOL.
         clean_data finds and replaces carriage returns in text fields with a space to resolve this issue.
+        :param changed_tables: Optional list of CSV filenames that changed since the last successful run.
+        If provided, only these are cleaned unless a cleaned copy does not exist yet.
         """
         # https://stackoverflow.com/questions/38758450/remove-carriage-return-from-text-file/38776444
         # https://stackoverflow.com/questions/17658055/how-can-i-remove-carriage-return-from-a-text-file-with-python#:~:text=Depending%20on%20the%20type%20of,rstrip()%20.&text=Python%20opens%20files%20in%20so,so%20newlines%20are%20always%20%5Cn%20.
@@ -284,102 +985,129 @@ class DownloadCleanJoinData:
 
             # Creates a list of all items within the Input Folder Path.
             file_list = os.listdir(main_input_dir)
+            file_pairs = []
             for file in file_list:
                 original_filename, file_extension = os.path.splitext(file)
                 # Splits all of the items within the InputFolder
                 # based on the File Name and it's Extension and sets them to the variables
                 # TheFileName and TheFileExtension.
-                # Since this is in a for loop, it will go through each file and execute the commands within the for loop
-                # on each individual file based on specified parameters.
                 if file_extension == ".csv":  # the specified parameters are items with the file extension .csv.
                     input_file = main_input_dir + original_filename + file_extension
                     output_file = main_input_strip_dir + original_filename + file_extension
-                    # "if" the file extension is .csv, then the following functions will be executed.
+                    if changed_tables is not None and file not in changed_tables and os.path.exists(output_file):
+                        self.skip_stage('clean_data:' + file, "table is unchanged since the last successful run")
+                        continue
+                    file_pairs.append((input_file, output_file))
+            # If the text fields have carriage returns, then the CSV will have extra
+            # lines. Each file is streamed through a quote-aware cleaner that finds these
+            # carriage returns in text fields and replaces them with a space
+            if self.parallel_clean:
+                # each table is independent, so clean them side by side in a process pool
+                clean_csv_files(file_pairs, max_workers=self.clean_max_workers, logger=api_logger)
+            else:
+                for input_file, output_file in file_pairs:
                     api_logger.info("clean_data: cleaning " + input_file)
-                    # specifying an encoding, e.g., encoding='utf8' will throw errors. Not specifying an encoding
-                    # will also throw errors on different CSV files. Using errors='ignore' to bypass unknown characters
-                    # but could lead to some data-loss for those unknown characters.
-                    with open(input_file, mode='r', errors='ignore') as file_read:
-                        with open(output_file, mode='w') as file_write:
-                            content = file_read.read()
-                            # If the text fields have carriage returns, then the CSV will have extra
-                            # lines. regex is used here to find these carriage returns in text fields and
-                            # replace them with a space
-                            content_new = re.sub(r'"[^"]*(?:""[^"]*)*"', lambda m: m.group(0).replace("\n", " "), content)
-                            file_write.write(content_new)
+                    clean_csv_file(input_file, output_file)
                     api_logger.info("clean_data: cleaned " + output_file)
             api_logger.info("[END] clean_data")
         except Exception as err:
             raise RuntimeError("** Error: clean_data Failed (" + str(err) + ")")
 
-    def subset_survey_dataset(self):
+    def read_zip_tables(self, zip_file_path):
+        """
+        Stream each CSV within the AGOL zip through the cleaner straight into pd.read_csv, without
+        extracting to main_input_dir or re-reading from main_input_strip_dir. If in_memory_side_output is
+        true, the cleaned CSVs are also written to main_input_strip_dir as they are parsed.
+        :param zip_file_path: Filepath to a CSV zip downloaded from AGOL.
+        :return: python dictionary of table name to cleaned DataFrame, as read by read_table
+        """
+        try:
+            api_logger.info("[START] read_zip_tables")
+            # match each zip member to a table by the filename of its cleaned CSV
+            table_names = {os.path.basename(self.survey_data): 'survey',
+                           os.path.basename(self.rep_crew): 'rep_crew',
+                           os.path.basename(self.rep_envmeas): 'rep_envmeas',
+                           os.path.basename(self.rep_collection): 'rep_collection',
+                           os.path.basename(self.rep_filter): 'rep_filter'}
+            tables = {}
+            with ZipFile(zip_file_path) as zip_file:
+                for member in zip_file.namelist():
+                    member_filename = os.path.basename(member)
+                    if member_filename not in table_names:
+                        continue
+                    api_logger.info("read_zip_tables: reading " + member)
+                    # same encoding handling as clean_csv_file: default encoding and ignore unknown characters
+                    with io.TextIOWrapper(zip_file.open(member), errors='ignore') as file_read:
+                        if self.in_memory_side_output:
+                            output_file = self.main_input_strip_dir + member_filename
+                            with open(output_file, mode='w') as side_output:
+                                table_df = self.read_table(table_names[member_filename],
+                                                           CleanedCSVReader(file_read, side_output))
+                            api_logger.info("read_zip_tables: cleaned " + output_file)
+                        else:
+                            table_df = self.read_table(table_names[member_filename], CleanedCSVReader(file_read))
+                    tables[table_names[member_filename]] = table_df
+            # a renamed table, e.g., after a new survey version, would otherwise be joined from a stale cleaned CSV
+            missing_files = [member_filename for member_filename, table_name in table_names.items()
+                             if table_name not in tables]
+            if missing_files:
+                raise ValueError(os.path.basename(zip_file_path) + " has no " + ", ".join(missing_files))
+            api_logger.info("[END] read_zip_tables")
+            return tables
+        except Exception as err:
+            raise RuntimeError("** Error: read_zip_tables Failed (" + str(err) + ")")
+
+    def write_table(self, table_df, filename, sheets=False):
+        """
+        Write a subset or joined table to the table store, and to CSV if there is no table store or if the table
+        is uploaded to Google Sheets.
+        :param filename: Filename of the table without extension, e.g., survey_crew_join_filename.
+        :param sheets: True if UploadData uploads the table's CSV.
+        """
+        if self.table_store is not None:
+            self.table_store.write(filename, table_df)
+        if self.table_store is None or sheets:
+            table_df.to_csv(self.main_output_dir + filename + ".csv", encoding='utf-8')
+
+    def read_output_table(self, filename, columns):
+        """
+        Read columns of a subset or joined table from the table store, or from its CSV.
+        :return: DataFrame, or None if the table has not been written
+        """
+        if self.table_store is not None and self.table_store.exists(filename):
+            return self.table_store.read(filename, columns=columns)
+        output_file = self.main_output_dir + filename + ".csv"
+        if os.path.exists(output_file):
+            return pd.read_csv(output_file, usecols=columns)
+        return None
+
+    def read_table(self, table_name, file_path_or_buffer):
+        """
+        Read only the columns of table_name kept by the schema of survey123_version, with their dtypes and
+        target names, e.g., survey_global_id instead of GlobalID, with csv_engine.
+        :param table_name: survey, rep_crew, rep_envmeas, rep_collection, or rep_filter
+        :param file_path_or_buffer: Filepath of a cleaned CSV, or a file object, e.g., a CleanedCSVReader.
+        """
+        schema = get_table_schema(table_name, self.survey123_version, fallback_version=self.schema_fallback_version)
+        return schema.read_csv(file_path_or_buffer, engine=self.csv_engine)
+
+    def subset_survey_dataset(self, survey_data_df=None):
         try:
             api_logger.info("[START] subset_survey_data")
-            projects_dict = self.survey_projects
-            # read in CSVs as df
-            survey_data_df = pd.read_csv(self.survey_data, index_col=False)
-
-            # grab specific fields from the csv
-            survey_sub = survey_data_df[['GlobalID', 'Survey DateTime', 'Affiliated Projects', 'Supervisor',
-                                         'username', 'Recorder First Name',
-                                         'Recorder Last Name', 'Site ID', 'Other Site ID', 'General Location Name',
-                                         'Latitude', 'Longitude', 'gps_cap_lat', 'gps_cap_long',
-                                         'gps_cap_alt', 'gps_cap_horacc', 'gps_cap_vertacc',
-                                         'Arrival DateTime', 'Water Turbidity', 'Precipitation',
-                                         'Wind Speed', 'Cloud Cover', 'Biome', 'Other Biome',
-                                         'Feature', 'Other Feature', 'Material', 'Other Material',
-                                         'Environmental Notes', 'Measurement Mode', 'Boat Type',
-                                         'Bottom Depth', 'Measurements Taken', 'Designated Sub-Corer',
-                                         'Designated Filterer', 'Survey Complete', 'QA Editor',
-                                         'QA DateTime', 'QA Initials', 'x', 'y', 
-                                         'EditDate', 'Editor', 'CreationDate', 'Creator']].copy()
-            # rename fields to remove spaces
-            survey_sub = survey_sub.rename(columns={'GlobalID': 'survey_global_id',
-                                                    'Survey DateTime': 'survey_datetime',
-                                                    'Supervisor': 'supervisor',
-                                                    'Affiliated Projects': 'project_ids',
-                                                    'Recorder First Name': 'recorder_first_name',
-                                                    'Recorder Last Name': 'recorder_last_name',
-                                                    'Site ID': 'site_id',
-                                                    'Other Site ID': 'other_site_id',
-                                                    'General Location Name': 'general_location_name',
-                                                    'Latitude': 'lat_manual',
-                                                    'Longitude': 'long_manual',
-                                                    'Arrival DateTime': 'arrival_datetime', 
-                                                    'Water Turbidity': 'env_obs_turbidity', 
-                                                    'Precipitation': 'env_obs_precip',
-                                                    'Wind Speed': 'env_obs_wind_speed', 
-                                                    'Cloud Cover': 'env_obs_cloud_cover', 
-                                                    'Biome': 'env_biome', 
-                                                    'Other Biome': 'env_biome_other',
-                                                    'Feature': 'env_feature', 
-                                                    'Other Feature': 'env_feature_other', 
-                                                    'Material': 'env_material', 
-                                                    'Other Material': 'env_material_other', 
-                                                    'Environmental Notes': 'env_notes', 
-                                                    'Measurement Mode': 'env_measure_mode', 
-                                                    'Boat Type': 'env_boat_type',
-                                                    'Bottom Depth': 'env_bottom_depth', 
-                                                    'Measurements Taken': 'measurements_taken', 
-                                                    'Designated Sub-Corer': 'core_subcorer',
-                                                    'Designated Filterer': 'water_filterer', 
-                                                    'Survey Complete': 'survey_complete', 
-                                                    'QA Editor': 'qa_editor',
-                                                    'QA DateTime': 'qa_datetime', 
-                                                    'QA Initials': 'qa_initial', 
-                                                    'CreationDate': 'survey_create_datetime',
-                                                    'Creator': 'survey_creator',
-                                                    'EditDate': 'survey_edit_datetime',
-                                                    'Editor': 'survey_editor'
-                                                    })
+            # read in CSVs as df, only the fields of the schema and renamed to remove spaces
+            if survey_data_df is None:
+                survey_data_df = self.read_table('survey', self.survey_data)
+            survey_sub = survey_data_df
+
             # format date and add month and year columns
             survey_sub['survey_datetime'] = pd.to_datetime(survey_sub.survey_datetime)
             survey_sub['survey_month'] = survey_sub['survey_datetime'].dt.strftime('%m')
             survey_sub['survey_year'] = survey_sub['survey_datetime'].dt.strftime('%Y')
             survey_sub['survey_date'] = survey_sub['survey_datetime'].dt.strftime('%m/%d/%Y')
 
-            # replace project codes with project names
-            survey_sub['project_ids'] = survey_sub['project_ids'].replace(projects_dict, regex=True)
+            # one row per survey and project code, then replace project codes with project names
+            survey_project_bridge = self.project_translator.bridge(survey_sub)
+            survey_sub['project_ids'] = self.project_translator.translate(survey_sub['project_ids'])
 
             # convert to category for more efficient indexing
             survey_sub['site_id'] = survey_sub['site_id'].astype('category')
@@ -387,6 +1115,8 @@ class DownloadCleanJoinData:
             survey_sub['system_type'] = survey_sub['site_id'].str[4]
             # if the site_id was other, change system type to other
             survey_sub.loc[survey_sub['site_id'].str.lower() == 'other', 'system_type'] = 'other'
+            if self.dtype_plan:
+                survey_sub = apply_dtype_plan('survey', survey_sub)
 
             # if lat_manual or long_manual are NaN, blank, or 0, replace contents of cell with
             # gps_cap_lat or gps_cap_long
@@ -425,292 +1155,135 @@ class DownloadCleanJoinData:
 
             # write eDNA_Sampling_v14_sub to csv
             api_logger.info("subset_survey_dataset: To CSV " + self.survey_sub_filename)
-            output_file = self.main_output_dir + self.survey_sub_filename + ".csv"
-            survey_sub_output.to_csv(output_file, encoding='utf-8')
+            self.write_table(survey_sub_output, self.survey_sub_filename, sheets=True)
+            api_logger.info("subset_survey_dataset: To CSV " + self.survey_project_filename)
+            self.write_table(survey_project_bridge, self.survey_project_filename)
             api_logger.info("[END] subset_survey_dataset")
 
             return survey_sub
         except Exception as err:
             raise RuntimeError("** Error: subset_survey_data Failed (" + str(err) + ")")
 
-    def subset_crew_dataset(self):
+    def subset_crew_dataset(self, rep_crew_df=None):
         try:
             api_logger.info("[START] subset_crew_dataset")
-            # read in CSVs as df
-            rep_crew_df = pd.read_csv(self.rep_crew, index_col=False)
-            rep_crew_sub = rep_crew_df[['GlobalID', 'ParentGlobalID',
-                                        'Crew First Name', 'Crew Last Name',
-                                        'EditDate', 'Editor', 'CreationDate', 'Creator']].copy()
-            # rename
-            rep_crew_sub = rep_crew_sub.rename(columns={'GlobalID': 'crew_global_id',
-                                                        'ParentGlobalID': 'crew_ParentGlobalID',
-                                                        'Crew First Name': 'crew_fname',
-                                                        'Crew Last Name': 'crew_lname',
-                                                        'CreationDate': 'crew_create_datetime',
-                                                        'Creator': 'crew_creator',
-                                                        'EditDate': 'crew_edit_datetime',
-                                                        'Editor': 'crew_editor'})
+            # read in CSVs as df, only the fields of the schema and renamed
+            if rep_crew_df is None:
+                rep_crew_df = self.read_table('rep_crew', self.rep_crew)
+            rep_crew_sub = rep_crew_df
+            if self.dtype_plan:
+                rep_crew_sub = apply_dtype_plan('rep_crew', rep_crew_sub)
 
             # write crew_sub to csv
             api_logger.info("subset_crew_dataset: To CSV " + self.crew_sub_filename)
-            output_file = self.main_output_dir + self.crew_sub_filename + ".csv"
-            rep_crew_sub.to_csv(output_file, encoding='utf-8')
+            self.write_table(rep_crew_sub, self.crew_sub_filename)
             api_logger.info("[END] subset_crew_dataset")
 
             return rep_crew_sub
         except Exception as err:
             raise RuntimeError("** Error: subset_crew_dataset Failed (" + str(err) + ")")
 
-    def subset_envmeas_dataset(self):
+    def subset_envmeas_dataset(self, rep_envmeas_df=None):
         try:
             api_logger.info("[START] subset_envmeas_dataset")
-            # read in CSVs as df
-            rep_envmeas_df = pd.read_csv(self.rep_envmeas, index_col=False)
-
-            # subset
-            rep_envmeas_sub = rep_envmeas_df[['GlobalID', 'ParentGlobalID', 'Measurement DateTime',
-                                              'Measurement Depth', 'Environmental Instrument',
-                                              'CTD Filename', 'CTD Notes',
-                                              'YSI Filename', 'YSI Model', 'YSI Serial Number', 'YSI Notes',
-                                              'Secchi Depth', 'Secchi Notes',
-                                              'Niskin Number', 'Niskin Notes',
-                                              'Other Instruments', 'Environmental Measurements',
-                                              'Flow Rate', 'Water Temp', 'Salinity', 'pH Scale',
-                                              'PAR1', 'PAR2', 'Turbidity', 'Conductivity', 'Dissolved Oxygen',
-                                              'Pheophytin', 'Chlorophyll a', 'Nitrate and Nitrite', 'Nitrite',
-                                              'Ammonium', 'Phosphate', 'Bottom Substrate', 'Lab DateTime',
-                                              'Measurement Notes',
-                                              'EditDate', 'Editor', 'CreationDate', 'Creator']].copy()
-            # rename
-            rep_envmeas_sub = rep_envmeas_sub.rename(columns={'GlobalID': 'envmeas_global_id',
-                                                              'ParentGlobalID': 'envmeas_ParentGlobalID',
-                                                              'Measurement DateTime': 'envmeas_datetime',
-                                                              'Measurement Depth': 'envmeas_depth',
-                                                              'Environmental Instrument': 'envmeas_instrument',
-                                                              'CTD Filename': 'ctd_filename',
-                                                              'CTD Notes': 'ctd_notes',
-                                                              'YSI Filename': 'ysi_filename',
-                                                              'YSI Model': 'ysi_model',
-                                                              'YSI Serial Number': 'ysi_serial_number',
-                                                              'YSI Notes': 'ysi_notes',
-                                                              'Secchi Depth': 'secchi_depth',
-                                                              'Secchi Notes': 'secchi_notes',
-                                                              'Niskin Number': 'niskin_number',
-                                                              'Niskin Notes': 'niskin_notes',
-                                                              'Other Instruments': 'other_instruments',
-                                                              'Environmental Measurements': 'env_measurements',
-                                                              'Flow Rate': 'flow_rate',
-                                                              'Water Temp': 'water_temp',
-                                                              'Salinity': 'salinity',
-                                                              'pH Scale': 'ph',
-                                                              'PAR1': 'par1',
-                                                              'PAR2': 'par2',
-                                                              'Turbidity': 'turbidity',
-                                                              'Conductivity': 'conductivity',
-                                                              'Dissolved Oxygen': 'do',
-                                                              'Pheophytin': 'pheophytin',
-                                                              'Chlorophyll a': 'chla',
-                                                              'Nitrate and Nitrite': 'no3no2',
-                                                              'Nitrite': 'no2',
-                                                              'Ammonium': 'nh4',
-                                                              'Phosphate': 'phosphate',
-                                                              'Bottom Substrate': 'bottom_substrate',
-                                                              'Lab DateTime': 'lab_date',
-                                                              'Measurement Notes': 'envmeas_notes',
-                                                              'CreationDate': 'envmeas_create_datetime',
-                                                              'Creator': 'envmeas_creator',
-                                                              'EditDate': 'envmeas_edit_datetime',
-                                                              'Editor': 'envmeas_editor'
-                                                              })
+            # read in CSVs as df, only the fields of the schema and renamed
+            if rep_envmeas_df is None:
+                rep_envmeas_df = self.read_table('rep_envmeas', self.rep_envmeas)
+            rep_envmeas_sub = rep_envmeas_df
+            if self.dtype_plan:
+                rep_envmeas_sub = apply_dtype_plan('rep_envmeas', rep_envmeas_sub)
 
             # write envmeas_sub to csv
             api_logger.info("subset_envmeas_dataset: To CSV " + self.envmeas_sub_filename)
-            output_file = self.main_output_dir + self.envmeas_sub_filename + ".csv"
-            rep_envmeas_sub.to_csv(output_file, encoding='utf-8')
+            self.write_table(rep_envmeas_sub, self.envmeas_sub_filename)
             api_logger.info("[END] subset_envmeas_dataset")
 
             return rep_envmeas_sub
         except Exception as err:
             raise RuntimeError("** Error: subset_envmeas_dataset Failed (" + str(err) + ")")
 
-    def subset_collection_dataset(self):
+    def subset_collection_dataset(self, rep_collection_df=None):
         try:
             api_logger.info("[START] subset_collection_data")
-            # read in CSVs as df
-            rep_collection_df = pd.read_csv(self.rep_collection, index_col=False)
-
-            # subset
-            rep_collection_sub = rep_collection_df[['GlobalID',
-                                                    'ParentGlobalID',
-                                                    'Collection Type',
-                                                    'Water Collection DateTime',
-                                                    'Water Vessel Label',
-                                                    'Water Control',
-                                                    'Water Control Type',
-                                                    'Water Collection Mode',
-                                                    'Niskin Number',
-                                                    'Niskin Volume',
-                                                    'Water Depth',
-                                                    'Water Vessel Volume',
-                                                    'Water Vessel Material',
-                                                    'Water Vessel Color',
-                                                    'Was Filtered',
-                                                    'Water Collection Notes',
-                                                    'Core DateTime Start',
-                                                    'Core DateTime End',
-                                                    'Core Label',
-                                                    'Core Control',
-                                                    'Core Method',
-                                                    'Other Core Method',
-                                                    'Depth Core Collected',
-                                                    'Length of Core',
-                                                    'Corer Diameter',
-                                                    'Core Notes',
-                                                    'Subcores Taken',
-                                                    'Subcore DateTime Start',
-                                                    'Subcore DateTime End',
-                                                    'Sub-Corer First Name',
-                                                    'Sub-Corer Last Name',
-                                                    'Subcore Protocol',
-                                                    'Other Protocol',
-                                                    'Sub-Core Method',
-                                                    'Other Sub-Core Method',
-                                                    'Min Subcore Barcode',
-                                                    'Max Subcore Barcode',
-                                                    'Number of Sub-Cores',
-                                                    'Length of Sub-Core',
-                                                    'Sub-Core Diameter',
-                                                    'Sub-Core Consistency Layer',
-                                                    'Purpose of Other Cores',
-                                                    'EditDate', 'Editor', 'CreationDate', 'Creator']].copy()
-            # rename
-            rep_collection_sub = rep_collection_sub.rename(columns={'GlobalID': 'collection_global_id',
-                                                                    'ParentGlobalID': 'collection_ParentGlobalID',
-                                                                    'Collection Type': 'collection_type',
-                                                                    'Water Collection DateTime': 'water_collect_datetime',
-                                                                    'Water Control': 'water_control',
-                                                                    'Water Control Type': 'water_control_type',
-                                                                    'Water Collection Mode': 'water_collect_mode',
-                                                                    'Niskin Number': 'water_niskin_number',
-                                                                    'Niskin Volume': 'water_niskin_vol',
-                                                                    'Water Depth': 'water_depth',
-                                                                    'Water Vessel Volume': 'water_vessel_vol',
-                                                                    'Water Vessel Material': 'water_vessel_material',
-                                                                    'Water Vessel Color': 'water_vessel_color',
-                                                                    'Was Filtered': 'was_filtered',
-                                                                    'Water Vessel Label': 'water_vessel_label',
-                                                                    'Water Collection Notes': 'water_collect_notes',
-                                                                    'Core DateTime Start': 'core_datetime_start',
-                                                                    'Core DateTime End': 'core_datetime_end',
-                                                                    'Core Label': 'core_label',
-                                                                    'Core Control': 'core_control',
-                                                                    'Core Method': 'core_method',
-                                                                    'Other Core Method': 'core_method_other',
-                                                                    'Depth Core Collected': 'depth_core_collected',
-                                                                    'Length of Core': 'core_length',
-                                                                    'Corer Diameter': 'core_diameter',
-                                                                    'Core Notes': 'core_notes',
-                                                                    'Subcores Taken': 'subcores_taken',
-                                                                    'Subcore DateTime Start': 'subcore_datetime_start',
-                                                                    'Subcore DateTime End': 'subcore_datetime_end',
-                                                                    'Sub-Corer First Name': 'subcore_fname',
-                                                                    'Sub-Corer Last Name': 'subcore_lname',
-                                                                    'Subcore Protocol': 'subcore_protocol',
-                                                                    'Other Protocol': 'subcore_protocol_other',
-                                                                    'Sub-Core Method': 'subcore_method',
-                                                                    'Other Sub-Core Method': 'subcore_method_other',
-                                                                    'Min Subcore Barcode': 'min_subcore_barcode',
-                                                                    'Max Subcore Barcode': 'max_subcore_barcode',
-                                                                    'Number of Sub-Cores': 'number_subcores',
-                                                                    'Length of Sub-Core': 'subcore_length',
-                                                                    'Sub-Core Diameter': 'subcore_diameter',
-                                                                    'Sub-Core Consistency Layer': 'subcore_consistency_layer',
-                                                                    'Purpose of Other Cores': 'purpose_other_cores',
-                                                                    'CreationDate': 'collection_create_datetime',
-                                                                    'Creator': 'collection_creator',
-                                                                    'EditDate': 'collection_edit_datetime',
-                                                                    'Editor': 'collection_editor'})
+            # read in CSVs as df, only the fields of the schema and renamed
+            if rep_collection_df is None:
+                rep_collection_df = self.read_table('rep_collection', self.rep_collection)
+            rep_collection_sub = rep_collection_df
+            if self.dtype_plan:
+                rep_collection_sub = apply_dtype_plan('rep_collection', rep_collection_sub)
 
             # write collection_sub to csv
             api_logger.info("subset_collection_dataset: To CSV " + self.collection_sub_filename)
-            output_file = self.main_output_dir + self.collection_sub_filename + ".csv"
-            rep_collection_sub.to_csv(output_file, encoding='utf-8')
+            self.write_table(rep_collection_sub, self.collection_sub_filename)
             api_logger.info("[END] subset_collection_dataset")
 
             return rep_collection_sub
         except Exception as err:
             raise RuntimeError("** Error: subset_collection_data Failed (" + str(err) + ")")
 
-    def subset_filter_dataset(self):
+    def subset_filter_dataset(self, rep_filter_df=None):
         try:
             api_logger.info("[START] subset_filter_dataset")
-            # read in CSVs as df
-            rep_filter_df = pd.read_csv(self.rep_filter, index_col=False)
-            # subset
-            rep_filter_sub = rep_filter_df[['GlobalID', 'ParentGlobalID', 'Is Prefilter', 'Filter Location',
-                                            'Filter Sample Label', 'Filterer First Name', 'Filterer Last Name',
-                                            'Filter Barcode', 'Filter DateTime',
-                                            'Filter Protocol', 'Other Protocol',
-                                            'Filter Method', 'Other Filter Method',
-                                            'Water Volume Filtered',
-                                            'Filter Type', 'Other Filter Type',
-                                            'Filter Pore Size', 'Filter Size',
-                                            'Filter Notes',
-                                            'EditDate', 'Editor', 'CreationDate', 'Creator']].copy()
-            # rename
-            rep_filter_sub = rep_filter_sub.rename(columns={'GlobalID': 'filter_global_id',
-                                                            'ParentGlobalID': 'filter_ParentGlobalID',
-                                                            'Filter Location': 'filter_location',
-                                                            'Is Prefilter': 'is_prefilter',
-                                                            'Filterer First Name': 'filter_fname',
-                                                            'Filterer Last Name': 'filter_lname',
-                                                            'Filter Sample Label': 'filter_label',
-                                                            'Filter Barcode': 'filter_barcode',
-                                                            'Filter DateTime': 'filter_datetime',
-                                                            'Filter Protocol': 'filter_protocol',
-                                                            'Other Protocol': 'filter_protocol_other',
-                                                            'Filter Method': 'filter_method',
-                                                            'Other Filter Method': 'filter_method_other',
-                                                            'Water Volume Filtered': 'filter_vol',
-                                                            'Filter Type': 'filter_type',
-                                                            'Other Filter Type': 'filter_type_other',
-                                                            'Filter Pore Size': 'filter_pore',
-                                                            'Filter Size': 'filter_size',
-                                                            'Filter Notes': 'filter_notes',
-                                                            'CreationDate': 'filter_create_datetime',
-                                                            'Creator': 'filter_creator',
-                                                            'EditDate': 'filter_edit_datetime',
-                                                            'Editor': 'filter_editor'})
+            # read in CSVs as df, only the fields of the schema and renamed
+            if rep_filter_df is None:
+                rep_filter_df = self.read_table('rep_filter', self.rep_filter)
+            rep_filter_sub = rep_filter_df
             # change all filter_type to lower case
             rep_filter_sub['filter_type'] = rep_filter_sub['filter_type'].str.lower()
             # reformat date
             rep_filter_sub['filter_datetime'] = pd.to_datetime(rep_filter_sub.filter_datetime)
             # rep_filter_sub['filter_datetime'] = rep_filter_sub['filter_datetime'].dt.strftime('%m/%d/%Y')
             rep_filter_sub['filter_datetime'] = rep_filter_sub['filter_datetime'].dt.strftime('%Y-%m-%d %H:%M:%S.%f')
+            if self.dtype_plan:
+                rep_filter_sub = apply_dtype_plan('rep_filter', rep_filter_sub)
 
             # write collection_sub to csv
             api_logger.info("subset_filter_dataset: To CSV " + self.filter_sub_filename)
-            output_file = self.main_output_dir + self.filter_sub_filename + ".csv"
-            rep_filter_sub.to_csv(output_file, encoding='utf-8')
+            self.write_table(rep_filter_sub, self.filter_sub_filename)
             api_logger.info("[END] subset_filter_dataset")
             return rep_filter_sub
         except Exception as err:
             raise RuntimeError("** Error: subset_filter_dataset Failed (" + str(err) + ")")
 
-    def join_data(self):
+    def join_data(self, tables=None):
         """
         Subset cleaned CSVs to desired headers, join, and export to CSV.
+        :param tables: Optional python dictionary of cleaned DataFrames from read_zip_tables, with all five tables.
+        If not provided, every table is read from the cleaned CSVs.
         """
         try:
             api_logger.info("[START] join_data")
+            if tables is not None:
+                missing_tables = [table_name for table_name in ('survey', 'rep_crew', 'rep_envmeas',
+                                                                'rep_collection', 'rep_filter')
+                                  if table_name not in tables]
+                if missing_tables:
+                    raise ValueError("tables " + ", ".join(missing_tables) + " were not provided")
+            tables = tables or {}
 
             # subset datasets
-            survey_sub = self.subset_survey_dataset()
-            rep_crew_sub = self.subset_crew_dataset()
-            rep_envmeas_sub = self.subset_envmeas_dataset()
-            rep_collection_sub = self.subset_collection_dataset()
-            rep_filter_sub = self.subset_filter_dataset()
+            survey_sub = self.subset_survey_dataset(tables.get('survey'))
+            rep_crew_sub = self.subset_crew_dataset(tables.get('rep_crew'))
+            rep_envmeas_sub = self.subset_envmeas_dataset(tables.get('rep_envmeas'))
+            rep_collection_sub = self.subset_collection_dataset(tables.get('rep_collection'))
+            rep_filter_sub = self.subset_filter_dataset(tables.get('rep_filter'))
+
+            # join subsets and write each join to csv
+            self.join_survey_crew(survey_sub, rep_crew_sub)
+            self.join_survey_envmeas(survey_sub, rep_envmeas_sub)
+            survey_collection_join = self.merge_survey_collection(survey_sub, rep_collection_sub)
+            self.join_survey_collection(survey_collection_join)
+            self.join_clean_filter(rep_filter_sub, survey_collection_join)
+            api_logger.info("[END] join_data")
+        except Exception as err:
+            raise RuntimeError("** Error: join_data Failed (" + str(err) + ")")
 
+    def join_survey_crew(self, survey_sub, rep_crew_sub):
+        """
+        Join eDNA_Sampling_v14_sub to rep_crew_sub and export to CSV.
+        """
+        try:
+            api_logger.info("[START] join_survey_crew")
             # join eDNA_Sampling_v13_sub to rep_crew
             survey_crew_join = pd.merge(rep_crew_sub, survey_sub, how='left',
                                         left_on='crew_ParentGlobalID', right_on='survey_global_id')
@@ -739,10 +1312,19 @@ class DownloadCleanJoinData:
             survey_crew_join_output.dropna(subset=['crew_fname', 'crew_lname'], how='all', inplace=True)
 
             # write survey_envmeas_join to csv
-            api_logger.info("join_data: To CSV " + self.survey_crew_join_filename)
-            output_file = self.main_output_dir + self.survey_crew_join_filename + ".csv"
-            survey_crew_join_output.to_csv(output_file, encoding='utf-8')
+            api_logger.info("join_survey_crew: To CSV " + self.survey_crew_join_filename)
+            self.write_table(survey_crew_join_output, self.survey_crew_join_filename, sheets=True)
+            api_logger.info("[END] join_survey_crew")
+            return survey_crew_join_output
+        except Exception as err:
+            raise RuntimeError("** Error: join_survey_crew Failed (" + str(err) + ")")
 
+    def join_survey_envmeas(self, survey_sub, rep_envmeas_sub):
+        """
+        Join eDNA_Sampling_v14_sub to rep_envmeas_sub and export to CSV.
+        """
+        try:
+            api_logger.info("[START] join_survey_envmeas")
             # join eDNA_Sampling_v13_sub to rep_envmeas
             survey_envmeas_join = pd.merge(rep_envmeas_sub, survey_sub, how='left',
                                            left_on='envmeas_ParentGlobalID', right_on='survey_global_id')
@@ -790,14 +1372,29 @@ class DownloadCleanJoinData:
             survey_envmeas_join_output.dropna(subset=['env_measurements'], how='all', inplace=True)
 
             # write survey_envmeas_join to csv
-            api_logger.info("join_data: To CSV " + self.survey_envmeas_join_filename)
-            output_file = self.main_output_dir + self.survey_envmeas_join_filename + ".csv"
-            survey_envmeas_join_output.to_csv(output_file, encoding='utf-8')
+            api_logger.info("join_survey_envmeas: To CSV " + self.survey_envmeas_join_filename)
+            self.write_table(survey_envmeas_join_output, self.survey_envmeas_join_filename, sheets=True)
+            api_logger.info("[END] join_survey_envmeas")
+            return survey_envmeas_join_output
+        except Exception as err:
+            raise RuntimeError("** Error: join_survey_envmeas Failed (" + str(err) + ")")
 
-            # join eDNA_Sampling_v13_sub to rep_collection & split into subcore_sub
-            survey_collection_join = pd.merge(rep_collection_sub, survey_sub, how='left',
-                                              left_on='collection_ParentGlobalID', right_on='survey_global_id')
+    def merge_survey_collection(self, survey_sub, rep_collection_sub):
+        """
+        Join eDNA_Sampling_v14_sub to rep_collection_sub. The full join is used by join_survey_collection
+        and join_clean_filter.
+        """
+        # join eDNA_Sampling_v13_sub to rep_collection
+        survey_collection_join = pd.merge(rep_collection_sub, survey_sub, how='left',
+                                          left_on='collection_ParentGlobalID', right_on='survey_global_id')
+        return survey_collection_join
 
+    def join_survey_collection(self, survey_collection_join):
+        """
+        Subset survey_collection_join, split into clean_subcore_join, and export both to CSV.
+        """
+        try:
+            api_logger.info("[START] join_survey_collection")
             survey_collection_join_output = survey_collection_join.copy()
             # subset
             survey_collection_join_output = survey_collection_join_output[['survey_global_id', 'survey_datetime',
@@ -878,7 +1475,8 @@ class DownloadCleanJoinData:
                                               columns=survey_subcore_join.columns,
                                               ).astype(survey_subcore_join.dtypes)
 
-            clean_subcore_join['sample_global_id'] = clean_subcore_join['collection_global_id'] + '-SC' + clean_subcore_join.index.astype(str)
+            # Arrow backed strings from csv_engine='pyarrow' do not support + with an object Index
+            clean_subcore_join['sample_global_id'] = clean_subcore_join['collection_global_id'].astype(object) + '-SC' + clean_subcore_join.index.astype(str)
 
             survey_collection_join_output = survey_collection_join_output[['survey_global_id', 'survey_datetime',
                                                                            'survey_date',
@@ -907,15 +1505,23 @@ class DownloadCleanJoinData:
                                                                            'gps_cap_lat', 'gps_cap_long']].copy()
 
             # write survey_collection_join to csv
-            api_logger.info("join_data: To CSV " + self.survey_collection_join_filename)
-            output_file = self.main_output_dir + self.survey_collection_join_filename + ".csv"
-            survey_collection_join_output.to_csv(output_file, encoding='utf-8')
+            api_logger.info("join_survey_collection: To CSV " + self.survey_collection_join_filename)
+            self.write_table(survey_collection_join_output, self.survey_collection_join_filename, sheets=True)
 
             # write clean_subcore_join to csv
-            api_logger.info("join_data: To CSV " + self.clean_subcore_join_filename)
-            output_file = self.main_output_dir + self.clean_subcore_join_filename + ".csv"
-            clean_subcore_join.to_csv(output_file, encoding='utf-8')
+            api_logger.info("join_survey_collection: To CSV " + self.clean_subcore_join_filename)
+            self.write_table(clean_subcore_join, self.clean_subcore_join_filename, sheets=True)
+            api_logger.info("[END] join_survey_collection")
+            return survey_collection_join_output, clean_subcore_join
+        except Exception as err:
+            raise RuntimeError("** Error: join_survey_collection Failed (" + str(err) + ")")
 
+    def join_clean_filter(self, rep_filter_sub, survey_collection_join):
+        """
+        Join rep_filter_sub to survey_collection_join and export to CSV.
+        """
+        try:
+            api_logger.info("[START] join_clean_filter")
             # filter + sample + survey join
             ss_filter_join = pd.merge(rep_filter_sub, survey_collection_join, how='left',
                                       left_on='filter_ParentGlobalID', right_on='collection_global_id')
@@ -944,16 +1550,16 @@ class DownloadCleanJoinData:
             clean_filter_join = clean_filter_join.sort_values(by=['survey_datetime', 'survey_global_id', 'filter_datetime']).reset_index(drop=True)
 
             # write clean_filter_join to csv
-            api_logger.info("join_data: To CSV " + self.clean_filter_join_filename)
-            output_file = self.main_output_dir + self.clean_filter_join_filename+".csv"
-            clean_filter_join.to_csv(output_file, encoding='utf-8')
-            api_logger.info("[END] join_data")
+            api_logger.info("join_clean_filter: To CSV " + self.clean_filter_join_filename)
+            self.write_table(clean_filter_join, self.clean_filter_join_filename, sheets=True)
+            api_logger.info("[END] join_clean_filter")
+            return clean_filter_join
         except Exception as err:
-            raise RuntimeError("** Error: join_data Failed (" + str(err) + ")")
+            raise RuntimeError("** Error: join_clean_filter Failed (" + str(err) + ")")
 
     def backup_upload_data(self):
         """
-        Backup subset, joined, and cleaned CSVs to desired backup dirs
+        Backup subset, joined, and cleaned CSVs and table store tables to desired backup dirs
         """
         try:
             api_logger.info("[START] backup_upload_data")
@@ -961,7 +1567,9 @@ class DownloadCleanJoinData:
             main_output_dir = self.main_output_dir
             for dir_backup in upload_data_backup_dirs:
                 api_logger.info("backup_upload_data: backing up [" + main_output_dir + "] to [" + dir_backup + "]")
-                upload_files = glob.iglob(os.path.join(main_output_dir, "*.csv"))
+                upload_files = glob.glob(os.path.join(main_output_dir, "*.csv"))
+                if self.table_store is not None:
+                    upload_files += glob.glob(self.table_store.table_path('*'))
                 for file in upload_files:
                     if os.path.isfile(file):
                         copy2(file, dir_backup)
@@ -1007,80 +1615,86 @@ class UploadData:
         # https://medium.com/craftsmenltd/from-csv-to-google-sheet-using-python-ef097cb014f9
         try:
             api_logger.info("[START] upload_data")
-            gdrive_private_key = self.gdrive_private_key
-            target_spreadsheet_name = self.target_spreadsheet_name
-            main_output_dir = self.main_output_dir
-            survey_sub_filename = self.survey_sub_filename
-            survey_crew_join_filename = self.survey_crew_join_filename
-            survey_envmeas_join_filename = self.survey_envmeas_join_filename
-            survey_collection_join_filename = self.survey_collection_join_filename
-            clean_filter_join_filename = self.clean_filter_join_filename
-            clean_subcore_join_filename = self.clean_subcore_join_filename
-
-            scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
-                     "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
-            # JSON API file from google drive API
-            credentials = ServiceAccountCredentials.from_json_keyfile_name(gdrive_private_key, scope)
-            client = gspread.authorize(credentials)
-
-            # filepath for joined CSVs to be uploaded
-            survey_sub = main_output_dir + survey_sub_filename + ".csv"
-            survey_crew_join = main_output_dir + survey_crew_join_filename + ".csv"
-            survey_envmeas_join = main_output_dir + survey_envmeas_join_filename + ".csv"
-            survey_collection_join = main_output_dir + survey_collection_join_filename + ".csv"
-            clean_filter = main_output_dir + clean_filter_join_filename + ".csv"
-            clean_subcore = main_output_dir + clean_subcore_join_filename + ".csv"
-
-            # name of target spreadsheet
-            spreadsheet = client.open(target_spreadsheet_name)
-            worksheet_list = spreadsheet.worksheets()
-            upload_list = [survey_sub, survey_crew_join, survey_envmeas_join,
-                           survey_collection_join, clean_filter, clean_subcore]
-
+            spreadsheet, worksheet_list = self.open_spreadsheet()
             # the filename of each CSV will be used to name each sheet within the target spreadsheet.
-            for upload in upload_list:
-                upload_filename, file_extension = os.path.splitext(upload)
-                sheet_name = os.path.basename(upload_filename)
-                for sheet in worksheet_list:
-                    if sheet.title == sheet_name:
-                        sheet_id = sheet.id
-                        api_logger.info("upload_data: sheetName {}, sheetId(GID) {} ".format(sheet.title, sheet.id))
-                api_logger.info("upload_data: Deleting " + sheet_name)
-                # https://stackoverflow.com/questions/60015321/how-to-reset-all-rows-and-column-data-uisng-python-gspread-sheets
-                delete_body = {
-                    'requests': [{
-                        'updateCells': {
-                            'range': {
-                                'sheetId': sheet_id,
-                                'startRowIndex': '1'
-                            },
-                            'fields': '*'
-                        }
-                    }]
-                }
-                spreadsheet.batch_update(body=delete_body)
-                api_logger.info("upload_data: Uploading " + sheet_name)
-                with open(upload, 'r') as csv_file:
-                    contents = csv_file.read()
-                body = {
-                    'requests': [{
-                        'pasteData': {
-                            'coordinate': {
-                                'sheetId': sheet_id,
-                                'rowIndex': '0',  # adapt this if you need different positioning
-                                'columnIndex': '0',  # adapt this if you need different positioning
-                            },
-                            'data': contents,
-                            'type': 'PASTE_NORMAL',
-                            'delimiter': ',',
-                        }
-                    }]
-                }
-                spreadsheet.batch_update(body=body)
+            for upload in self.upload_list():
+                self.upload_sheet(spreadsheet, worksheet_list, upload)
             api_logger.info("[END] upload_data")
         except Exception as err:
             raise RuntimeError("** Error: upload_data Failed (" + str(err) + ")")
 
+    def open_spreadsheet(self):
+        """
+        Authorize with the google drive API and open the target spreadsheet.
+        :return: target spreadsheet and its list of worksheets
+        """
+        scope = ["https://spreadsheets.google.com/feeds", 'https://www.googleapis.com/auth/spreadsheets',
+                 "https://www.googleapis.com/auth/drive.file", "https://www.googleapis.com/auth/drive"]
+        # JSON API file from google drive API
+        credentials = ServiceAccountCredentials.from_json_keyfile_name(self.gdrive_private_key, scope)
+        client = gspread.authorize(credentials)
+        # name of target spreadsheet
+        spreadsheet = client.open(self.target_spreadsheet_name)
+        worksheet_list = spreadsheet.worksheets()
+        return spreadsheet, worksheet_list
+
+    def upload_list(self):
+        """
+        Filepaths for joined CSVs to be uploaded
+        """
+        main_output_dir = self.main_output_dir
+        survey_sub = main_output_dir + self.survey_sub_filename + ".csv"
+        survey_crew_join = main_output_dir + self.survey_crew_join_filename + ".csv"
+        survey_envmeas_join = main_output_dir + self.survey_envmeas_join_filename + ".csv"
+        survey_collection_join = main_output_dir + self.survey_collection_join_filename + ".csv"
+        clean_filter = main_output_dir + self.clean_filter_join_filename + ".csv"
+        clean_subcore = main_output_dir + self.clean_subcore_join_filename + ".csv"
+        return [survey_sub, survey_crew_join, survey_envmeas_join,
+                survey_collection_join, clean_filter, clean_subcore]
+
+    def upload_sheet(self, spreadsheet, worksheet_list, upload):
+        """
+        Replace the contents of the sheet named after the upload CSV with the upload CSV.
+        """
+        upload_filename, file_extension = os.path.splitext(upload)
+        sheet_name = os.path.basename(upload_filename)
+        for sheet in worksheet_list:
+            if sheet.title == sheet_name:
+                sheet_id = sheet.id
+                api_logger.info("upload_data: sheetName {}, sheetId(GID) {} ".format(sheet.title, sheet.id))
+        api_logger.info("upload_data: Deleting " + sheet_name)
+        # https://stackoverflow.com/questions/60015321/how-to-reset-all-rows-and-column-data-uisng-python-gspread-sheets
+        delete_body = {
+            'requests': [{
+                'updateCells': {
+                    'range': {
+                        'sheetId': sheet_id,
+                        'startRowIndex': '1'
+                    },
+                    'fields': '*'
+                }
+            }]
+        }
+        spreadsheet.batch_update(body=delete_body)
+        api_logger.info("upload_data: Uploading " + sheet_name)
+        with open(upload, 'r') as csv_file:
+            contents = csv_file.read()
+        body = {
+            'requests': [{
+                'pasteData': {
+                    'coordinate': {
+                        'sheetId': sheet_id,
+                        'rowIndex': '0',  # adapt this if you need different positioning
+                        'columnIndex': '0',  # adapt this if you need different positioning
+                    },
+                    'data': contents,
+                    'type': 'PASTE_NORMAL',
+                    'delimiter': ',',
+                }
+            }]
+        }
+        spreadsheet.batch_update(body=body)
+
     def call_appscripts_api(self):
         # https://developers.google.com/apps-script/api/how-tos/execute#python
         """Calls google appscripts.
@@ -0,0 +1,139 @@
+"""
+survey123_attachment_archive
+Back up attachments into appendable tar archives with an index for random access to single photos.
+"""
+
+import os
+import glob
+import json
+import tarfile
+import hashlib
+import time
+from datetime import datetime
+
+# size of tar headers and the blocks data is padded to
+TAR_BLOCK_SIZE = tarfile.BLOCKSIZE
+
+
+class MemoryviewReader:
+    """
+    Read-only file object over a blob, so tarfile copies it in chunks instead of it being copied whole to bytes.
+    """
+    def __init__(self, blob):
+        self.blob = memoryview(blob)
+        self.position = 0
+
+    def read(self, size=-1):
+        end = len(self.blob) if size is None or size < 0 else min(self.position + size, len(self.blob))
+        chunk = self.blob[self.position:end].tobytes()
+        self.position = end
+        return chunk
+
+
+class AttachmentArchive:
+    """
+    Append attachments to one uncompressed tar within archive_dir per month, or per run, so a backup is a few large
+    sequential writes instead of one small file per photo. Each archive has an index, <archive>.index.json, of the
+    offset, size and sha256 of each photo, so a single photo can be read with one seek. Photos already within an
+    archive of archive_dir with the same sha256 are not appended again. Appends start at the end offset recorded
+    in the index, so an append interrupted part way is overwritten by the next run.
+    :param archive_dir: Folder of the archives, e.g., an attachment backup dir.
+    :param period: 'month' for one archive per month, or 'run' for one archive per run.
+    """
+    def __init__(self, archive_dir, period='month'):
+        self.archive_dir = archive_dir
+        self.period = period
+        if period == 'month':
+            archive_name = 'attachments_' + datetime.now().strftime('%Y%m') + '.tar'
+        elif period == 'run':
+            archive_name = 'attachments_' + datetime.now().strftime('%Y%m%d_%H%M%S') + '.tar'
+        else:
+            raise ValueError("unknown archive period " + str(period))
+        self.archive_path = os.path.join(archive_dir, archive_name)
+        self.index_path = self.archive_path + '.index.json'
+        self.index = {'end_offset': 0, 'members': {}}
+        self.archived = {}
+        self.tar_file = None
+        self.file_write = None
+        self.stats = {'appended': 0, 'bytes_appended': 0, 'already_archived': 0}
+
+    def open(self):
+        os.makedirs(self.archive_dir, exist_ok=True)
+        # sha256 of every photo in any archive of archive_dir, by name
+        for index_path in sorted(glob.glob(os.path.join(self.archive_dir, 'attachments_*.tar.index.json'))):
+            with open(index_path, mode='r') as file_read:
+                index = json.load(file_read)
+            if index_path == self.index_path:
+                self.index = index
+            for file_name, member in index['members'].items():
+                self.archived[file_name] = member['sha256']
+        self.file_write = open(self.archive_path, mode='r+b' if os.path.exists(self.archive_path) else 'wb')
+        # overwrite the end of archive blocks, and anything written after the last recorded append
+        self.file_write.seek(self.index['end_offset'])
+        self.file_write.truncate()
+        self.tar_file = tarfile.open(fileobj=self.file_write, mode='w', format=tarfile.PAX_FORMAT)
+        return self
+
+    def add(self, blob, file_name):
+        """
+        Append blob as file_name unless it is already archived with the same content.
+        """
+        sha256 = hashlib.sha256(blob).hexdigest()
+        size = memoryview(blob).nbytes
+        if self.archived.get(file_name) == sha256:
+            self.stats['already_archived'] += 1
+            return
+        tar_info = tarfile.TarInfo(name=file_name)
+        tar_info.size = size
+        tar_info.mtime = int(time.time())
+        header_offset = self.tar_file.offset
+        self.tar_file.addfile(tar_info, MemoryviewReader(blob))
+        padded_size = -(-size // TAR_BLOCK_SIZE) * TAR_BLOCK_SIZE
+        data_offset = self.tar_file.offset - padded_size
+        self.index['members'][file_name] = {'header_offset': header_offset,
+                                            'data_offset': data_offset,
+                                            'size': size,
+                                            'sha256': sha256}
+        self.archived[file_name] = sha256
+        self.stats['appended'] += 1
+        self.stats['bytes_appended'] += size
+
+    def close(self):
+        """
+        Finish the archive and save its index.
+        """
+        end_offset = self.tar_file.offset
+        # writes the end of archive blocks, which the next append overwrites
+        self.tar_file.close()
+        self.file_write.close()
+        self.index['end_offset'] = end_offset
+        tmp_file = self.index_path + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(self.index, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.index_path)
+
+    def abort(self):
+        """
+        Drop anything this run appended and close the archive, leaving it as it was after the last run.
+        """
+        if self.file_write is not None and not self.file_write.closed:
+            self.file_write.seek(self.index['end_offset'])
+            self.file_write.truncate()
+            # end of archive blocks
+            self.file_write.write(b'\0' * (2 * TAR_BLOCK_SIZE))
+            self.file_write.close()
+
+
+def read_archived_attachment(archive_dir, file_name):
+    """
+    Read one photo from the most recent archive of archive_dir that has it, with one seek.
+    :return: bytes of the photo
+    """
+    for index_path in sorted(glob.glob(os.path.join(archive_dir, 'attachments_*.tar.index.json')), reverse=True):
+        with open(index_path, mode='r') as file_read:
+            member = json.load(file_read)['members'].get(file_name)
+        if member is not None:
+            with open(index_path[:-len('.index.json')], mode='rb') as file_read:
+                file_read.seek(member['data_offset'])
+                return file_read.read(member['size'])
+    raise KeyError(file_name + " is not archived within " + archive_dir)
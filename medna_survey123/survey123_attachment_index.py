@@ -0,0 +1,94 @@
+"""
+survey123_attachment_index
+Index attachments by the survey, collection and filter they were taken for, saved as Parquet.
+"""
+
+import os
+import pandas as pd
+from .logger_settings import api_logger
+
+# table of the image repeat within the file geodatabase, the parent table of rep_img__ATTACH
+REP_IMG_TABLE = "rep_img"
+# fields of the file geodatabase tables
+GLOBALID_FIELD = "GlobalID"
+PARENT_GLOBALID_FIELD = "ParentGlobalID"
+REL_GLOBALID_FIELD = "REL_GLOBALID"
+# rows per Parquet row group. Rows are sorted by survey, so lookups by sample read only the matching row groups.
+INDEX_ROW_GROUP_SIZE = 10000
+INDEX_COLUMNS = ['attachment_id', 'att_name', 'rel_global_id', 'img_parent_global_id',
+                 'survey_global_id', 'collection_global_id', 'filter_global_id', 'filter_barcode']
+
+
+def normalize_global_id(global_ids):
+    """
+    File geodatabases store GlobalIDs as {UPPERCASE}, CSV exports as lowercase without braces.
+    """
+    return global_ids.astype('string').str.strip('{}').str.lower()
+
+
+def build_attachment_index(attachments_df, rep_img_df, survey_ids, collection_df, filter_df):
+    """
+    Resolve each attachment to its sample. An attachment belongs to a rep_img row by REL_GLOBALID, and the rep_img row
+    belongs to a filter, a collection or a survey by ParentGlobalID. Attachments without a rep_img row are resolved
+    by their REL_GLOBALID directly.
+    :param attachments_df: attachment_id, att_name, rel_global_id
+    :param rep_img_df: img_global_id, img_parent_global_id
+    :param survey_ids: survey_global_id of every survey
+    :param collection_df: collection_global_id, collection_ParentGlobalID
+    :param filter_df: filter_global_id, filter_ParentGlobalID, filter_barcode
+    :return: DataFrame with INDEX_COLUMNS
+    """
+    attachments_df = attachments_df.assign(rel_global_id=normalize_global_id(attachments_df['rel_global_id']))
+    rep_img_df = rep_img_df.assign(img_global_id=normalize_global_id(rep_img_df['img_global_id']),
+                                   img_parent_global_id=normalize_global_id(rep_img_df['img_parent_global_id']))
+    collection_parent = pd.Series(normalize_global_id(collection_df['collection_ParentGlobalID']).values,
+                                  index=normalize_global_id(collection_df['collection_global_id']).values)
+    filter_df = filter_df.assign(filter_global_id=normalize_global_id(filter_df['filter_global_id']),
+                                 filter_ParentGlobalID=normalize_global_id(filter_df['filter_ParentGlobalID']))
+    filter_parent = pd.Series(filter_df['filter_ParentGlobalID'].values, index=filter_df['filter_global_id'].values)
+    filter_barcode = pd.Series(filter_df['filter_barcode'].values, index=filter_df['filter_global_id'].values)
+    survey_ids = set(normalize_global_id(pd.Series(survey_ids)).dropna())
+
+    index_df = attachments_df.merge(rep_img_df, how='left', left_on='rel_global_id', right_on='img_global_id')
+    parent = index_df['img_parent_global_id'].fillna(index_df['rel_global_id'])
+    is_filter = parent.isin(filter_parent.index)
+    index_df['filter_global_id'] = parent.where(is_filter)
+    index_df['filter_barcode'] = index_df['filter_global_id'].map(filter_barcode)
+    collection_global_id = parent.where(parent.isin(collection_parent.index))
+    index_df['collection_global_id'] = collection_global_id.fillna(index_df['filter_global_id'].map(filter_parent))
+    survey_global_id = parent.where(parent.isin(survey_ids))
+    index_df['survey_global_id'] = survey_global_id.fillna(index_df['collection_global_id'].map(collection_parent))
+    index_df = index_df[INDEX_COLUMNS].sort_values(by=['survey_global_id', 'collection_global_id', 'att_name'])
+    return index_df.reset_index(drop=True)
+
+
+class AttachmentSampleIndex:
+    """
+    Parquet file of build_attachment_index, for finding the photos of a survey, collection or filter barcode
+    without scanning attachment folders.
+    :param index_file: Filepath of the Parquet index.
+    """
+    def __init__(self, index_file):
+        self.index_file = index_file
+
+    def write(self, index_df):
+        tmp_file = self.index_file + '.tmp'
+        index_df.to_parquet(tmp_file, engine='pyarrow', index=False, row_group_size=INDEX_ROW_GROUP_SIZE)
+        os.replace(tmp_file, self.index_file)
+        resolved = index_df['survey_global_id'].notna().sum()
+        api_logger.info("attachment_index: {0} attachments, {1} resolved to a survey, {2} to a filter barcode".format(
+            len(index_df), resolved, index_df['filter_barcode'].notna().sum()))
+
+    def lookup(self, survey_global_id=None, collection_global_id=None, filter_barcode=None):
+        """
+        Attachments of a sample. Only the Parquet row groups whose statistics can match are read.
+        :return: DataFrame with INDEX_COLUMNS
+        """
+        filters = []
+        if survey_global_id is not None:
+            filters.append(('survey_global_id', '=', normalize_global_id(pd.Series([survey_global_id]))[0]))
+        if collection_global_id is not None:
+            filters.append(('collection_global_id', '=', normalize_global_id(pd.Series([collection_global_id]))[0]))
+        if filter_barcode is not None:
+            filters.append(('filter_barcode', '=', filter_barcode))
+        return pd.read_parquet(self.index_file, engine='pyarrow', filters=filters or None)
@@ -0,0 +1,76 @@
+"""
+survey123_attachment_manifest
+Manifest of extracted attachments so that each run only writes new or changed attachments.
+"""
+
+import os
+import json
+
+# fields of ESRI attachment tables, e.g., rep_img__ATTACH
+ATTACHMENT_ID_FIELD = "ATTACHMENTID"
+ATTACHMENT_SIZE_FIELD = "DATA_SIZE"
+# attachment ids per where clause when reading the blobs of new or changed attachments
+ATTACHMENT_ID_BATCH_SIZE = 500
+
+
+class AttachmentManifest:
+    """
+    JSON manifest of the attachments written to attachments_dir, keyed by ATTACHMENTID, with the name, size
+    and sha256 of each. Comparing the attachment table to the manifest only needs the ID, name and size
+    fields, so unchanged attachments are skipped without reading their blobs.
+    :param manifest_file: Filepath of the JSON manifest.
+    :param attachments_dir: Folder the attachments are written to.
+    """
+    def __init__(self, manifest_file, attachments_dir):
+        self.manifest_file = manifest_file
+        self.attachments_dir = attachments_dir
+        if os.path.exists(manifest_file):
+            with open(manifest_file, mode='r') as file_read:
+                self.attachments = json.load(file_read)
+        else:
+            self.attachments = {}
+
+    def plan(self, rows):
+        """
+        Compare (attachment id, name, size) rows of the attachment table to the manifest.
+        :return: list of attachment ids to write, and python dictionary of deleted attachment id to entry
+        """
+        to_write = []
+        current = set()
+        for attachment_id, file_name, size in rows:
+            key = str(attachment_id)
+            current.add(key)
+            entry = self.attachments.get(key)
+            if entry is None or entry['name'] != file_name or entry['size'] != size:
+                to_write.append(attachment_id)
+            elif not os.path.exists(os.path.join(self.attachments_dir, file_name)):
+                # removed from disk since the last run
+                to_write.append(attachment_id)
+        deleted = {key: entry for key, entry in self.attachments.items() if key not in current}
+        return to_write, deleted
+
+    def record(self, attachment_id, file_name, size, sha256):
+        self.attachments[str(attachment_id)] = {'name': file_name, 'size': size, 'sha256': sha256}
+
+    def remove_deleted(self, deleted):
+        """
+        Remove attachments deleted from the table from the manifest and from attachments_dir. A file is kept if
+        an attachment that is still in the table has the same name.
+        :return: number of files removed
+        """
+        for key in deleted:
+            self.attachments.pop(key, None)
+        names_in_use = {entry['name'] for entry in self.attachments.values()}
+        removed = 0
+        for entry in deleted.values():
+            file_path = os.path.join(self.attachments_dir, entry['name'])
+            if entry['name'] not in names_in_use and os.path.exists(file_path):
+                os.remove(file_path)
+                removed += 1
+        return removed
+
+    def save(self):
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(self.attachments, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
@@ -0,0 +1,64 @@
+"""
+survey123_attachment_process
+Extract attachments from the file geodatabase in a separate worker process, alongside the CSV pipeline.
+"""
+
+import os
+import time
+import multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from .logger_settings import api_logger
+
+
+def run_attachment_stage(download_clean_join_data, fgdb_filename):
+    """
+    Extract, archive and back up the attachments of fgdb_filename. Runs within the attachment process, which is
+    the only process that imports arcpy and checks out its license.
+    :param download_clean_join_data: DownloadCleanJoinData of the File Geodatabase format.
+    :return: python dictionary of fgdb_filename, the attachment tables for the attachment index, the process id
+    and the seconds taken
+    """
+    start = time.perf_counter()
+    attachment_tables = download_clean_join_data.extract_attachments_fgdb(fgdb_filename, index_attachments=False)
+    return {'fgdb_filename': fgdb_filename,
+            'attachment_tables': attachment_tables,
+            'pid': os.getpid(),
+            'seconds': time.perf_counter() - start}
+
+
+class AttachmentProcess:
+    """
+    One worker process for the arcpy attachment stage. Attachments are extracted while the parent process cleans,
+    joins and uploads the CSVs, and the result is reported back through a Future. The process is started with
+    spawn, as on Windows, so it never inherits the parent's AGOL session or open files. It is started on the
+    first submit, so runs without attachments never start it.
+    """
+    def __init__(self):
+        self.executor = None
+
+    def submit(self, download_clean_join_data, fgdb_filename):
+        """
+        :return: Future that resolves to the result of run_attachment_stage
+        """
+        if self.executor is None:
+            self.executor = ProcessPoolExecutor(max_workers=1, mp_context=multiprocessing.get_context('spawn'))
+        api_logger.info("attachment_process: submitted " + fgdb_filename)
+        future = self.executor.submit(run_attachment_stage, download_clean_join_data, fgdb_filename)
+        future.add_done_callback(self.report)
+        return future
+
+    @staticmethod
+    def report(future):
+        if future.cancelled():
+            api_logger.info("attachment_process: cancelled")
+        elif future.exception() is not None:
+            api_logger.info("attachment_process: failed (" + str(future.exception()) + ")")
+        else:
+            result = future.result()
+            api_logger.info("attachment_process: [{0}] extracted {1} in {2:.2f}s".format(
+                result['pid'], result['fgdb_filename'], result['seconds']))
+
+    def shutdown(self, wait=True):
+        if self.executor is not None:
+            self.executor.shutdown(wait=wait)
+            self.executor = None
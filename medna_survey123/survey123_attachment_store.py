@@ -0,0 +1,113 @@
+"""
+survey123_attachment_store
+Store attachments once per unique content and hardlink their names to the stored copy.
+"""
+
+import os
+import json
+import hashlib
+import threading
+from shutil import copy2
+from .logger_settings import api_logger
+
+
+class AttachmentStore:
+    """
+    Content addressed store of attachments. Each unique blob is written once to
+    store_dir/objects/<first two hex of sha256>/<sha256>, and each attachment name in attachments_dir is a hardlink
+    to it, so photos that are attached more than once take the space of one. Where hardlinks are not supported,
+    e.g., across drives, the name is a copy. index.json within store_dir maps each name to its sha256.
+    :param store_dir: Folder of the store. Must be on the same drive as attachments_dir for hardlinks.
+    :param attachments_dir: Folder of human readable attachment names.
+    """
+    def __init__(self, store_dir, attachments_dir):
+        self.store_dir = store_dir
+        self.objects_dir = os.path.join(store_dir, 'objects')
+        self.index_file = os.path.join(store_dir, 'index.json')
+        self.attachments_dir = attachments_dir
+        self._lock = threading.Lock()
+        os.makedirs(self.objects_dir, exist_ok=True)
+        if os.path.exists(self.index_file):
+            with open(self.index_file, mode='r') as file_read:
+                self.index = json.load(file_read)
+        else:
+            self.index = {}
+        self.stats = {'objects_written': 0, 'objects_reused': 0, 'copies': 0}
+
+    def object_path(self, digest):
+        return os.path.join(self.objects_dir, digest[:2], digest)
+
+    def put(self, blob, file_name):
+        """
+        Store blob unless its content is already stored, and point file_name at it.
+        :return: sha256 hex digest of blob
+        """
+        digest = hashlib.sha256(blob).hexdigest()
+        object_path = self.object_path(digest)
+        # writers of the same blob race to the rename, and either copy is the same content
+        if os.path.exists(object_path):
+            object_action = 'objects_reused'
+        else:
+            os.makedirs(os.path.dirname(object_path), exist_ok=True)
+            tmp_path = object_path + '.' + str(threading.get_ident()) + '.tmp'
+            with open(tmp_path, 'wb') as file_write:
+                file_write.write(blob)
+            os.replace(tmp_path, object_path)
+            object_action = 'objects_written'
+        name_path = os.path.join(self.attachments_dir, file_name)
+        tmp_name_path = name_path + '.' + str(threading.get_ident()) + '.tmp'
+        try:
+            os.link(object_path, tmp_name_path)
+            link_action = None
+        except OSError:
+            copy2(object_path, tmp_name_path)
+            link_action = 'copies'
+        # replace instead of writing into the old name, which may be a hardlink to another object
+        os.replace(tmp_name_path, name_path)
+        with self._lock:
+            self.index[file_name] = digest
+            self.stats[object_action] += 1
+            if link_action:
+                self.stats[link_action] += 1
+        return digest
+
+    def prune(self):
+        """
+        Forget names that were removed from attachments_dir and delete stored objects that no name points to.
+        :return: number of objects deleted
+        """
+        self.index = {file_name: digest for file_name, digest in self.index.items()
+                      if os.path.exists(os.path.join(self.attachments_dir, file_name))}
+        in_use = set(self.index.values())
+        pruned = 0
+        for dir_path, dir_names, file_names in os.walk(self.objects_dir):
+            for digest in file_names:
+                if digest not in in_use:
+                    os.remove(os.path.join(dir_path, digest))
+                    pruned += 1
+        return pruned
+
+    def save(self):
+        tmp_file = self.index_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(self.index, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.index_file)
+
+    def dedup_report(self):
+        """
+        Bytes the attachment names would take as separate files, bytes actually stored, and the difference.
+        """
+        object_sizes = {digest: os.path.getsize(self.object_path(digest)) for digest in set(self.index.values())
+                        if os.path.exists(self.object_path(digest))}
+        stored_bytes = sum(object_sizes.values())
+        logical_bytes = sum(object_sizes.get(digest, 0) for digest in self.index.values())
+        report = {'names': len(self.index),
+                  'objects': len(set(self.index.values())),
+                  'logical_bytes': logical_bytes,
+                  'stored_bytes': stored_bytes,
+                  'saved_bytes': logical_bytes - stored_bytes}
+        api_logger.info("attachment_store: {names} names, {objects} unique objects, "
+                        "{0:.1f} MB stored of {1:.1f} MB, dedup saved {2:.1f} MB".format(
+                            stored_bytes / 1048576.0, logical_bytes / 1048576.0,
+                            report['saved_bytes'] / 1048576.0, **report))
+        return report
@@ -0,0 +1,135 @@
+"""
+survey123_attachment_writer
+Write attachment blobs to disk with a pool of writer threads fed by a bounded queue.
+"""
+
+import os
+import time
+import zlib
+import hashlib
+import queue
+import threading
+from .logger_settings import api_logger
+
+# number of threads writing attachments to disk
+ATTACHMENT_WRITERS = 4
+# attachments read from the cursor but not yet written. Caps memory at roughly this many blobs.
+ATTACHMENT_QUEUE_DEPTH = 32
+
+
+class AttachmentWriter:
+    """
+    The thread that walks the attachments cursor hands each blob to a pool of writer threads through a bounded
+    queue, so reading the next row overlaps with writing the last ones. Blobs are written from the cursor's
+    memoryview without copying them to bytes, and the cursor blocks once queue_depth blobs are waiting.
+    Rows with the same file name always go to the same writer thread, so they are written in cursor order and
+    the last one wins, as if they were written one at a time.
+    :param attachments_dir: Output folder to write attachments to.
+    :param max_workers: Number of writer threads.
+    :param queue_depth: Maximum number of blobs waiting to be written, shared by the queues of the writer threads and
+    the sinks, so memory stays capped at roughly queue_depth blobs however many sinks there are.
+    :param hash_blobs: If true, record the sha256 of each blob in digests, keyed by the third value of its row,
+    e.g., the attachment ID, or by file name if rows have two values.
+    :param store: Optional AttachmentStore to write each blob to once per unique content. Its sha256 is
+    recorded in digests.
+    :param sinks: Optional objects with an add(blob, file_name) method, e.g., AttachmentArchive, that also receive
+    every blob. Each sink is fed by its own thread and a bounded queue with its share of queue_depth.
+    """
+    def __init__(self, attachments_dir,
+                 max_workers=ATTACHMENT_WRITERS,
+                 queue_depth=ATTACHMENT_QUEUE_DEPTH,
+                 hash_blobs=False,
+                 store=None,
+                 sinks=()):
+        self.attachments_dir = attachments_dir
+        self.max_workers = max_workers
+        self.queue_depth = queue_depth
+        self.hash_blobs = hash_blobs
+        self.store = store
+        self.sinks = list(sinks)
+        self.digests = {}
+        self.written = 0
+        self.bytes_written = 0
+        self._lock = threading.Lock()
+        self._errors = []
+
+    def write_rows(self, rows):
+        """
+        Write each (blob, file_name) row, e.g., the rows of an arcpy.da.SearchCursor over [blob_field, name_field].
+        Rows may have a third value, e.g., the attachment ID, that digests are keyed by.
+        :return: number of attachments written
+        """
+        # one queue per writer, so that a file name is only ever written by one thread. Writer and sink queues
+        # split queue_depth between them, so together they never hold more than queue_depth blobs.
+        queue_share = max(1, self.queue_depth // (self.max_workers + len(self.sinks)))
+        write_queues = [queue.Queue(maxsize=queue_share) for _ in range(self.max_workers)]
+        writers = [threading.Thread(target=self._write_worker, args=(write_queue,), daemon=True)
+                   for write_queue in write_queues]
+        sink_queues = [queue.Queue(maxsize=queue_share) for _ in self.sinks]
+        writers += [threading.Thread(target=self._sink_worker, args=(sink, sink_queue), daemon=True)
+                    for sink, sink_queue in zip(self.sinks, sink_queues)]
+        for writer in writers:
+            writer.start()
+        start = time.perf_counter()
+        try:
+            for row in rows:
+                if self._errors:
+                    break
+                blob, file_name = row[0], row[1]
+                write_queues[zlib.crc32(str(file_name).encode()) % self.max_workers].put(row)
+                for sink_queue in sink_queues:
+                    sink_queue.put((blob, file_name))
+        finally:
+            # one sentinel per writer so each exits after its queue drains
+            for write_queue in write_queues:
+                write_queue.put(None)
+            for sink_queue in sink_queues:
+                sink_queue.put(None)
+            for writer in writers:
+                writer.join()
+        seconds = time.perf_counter() - start
+        if self._errors:
+            raise self._errors[0]
+        api_logger.info("write_attachments: {0} attachments, {1:.1f} MB in {2:.2f}s, {3:.1f} attachments/s".format(
+            self.written, self.bytes_written / 1048576.0, seconds, self.written / seconds if seconds else 0.0))
+        return self.written
+
+    def _sink_worker(self, sink, sink_queue):
+        while True:
+            item = sink_queue.get()
+            if item is None:
+                return
+            if self._errors:
+                continue
+            try:
+                sink.add(*item)
+            except Exception as err:
+                self._errors.append(err)
+
+    def _write_worker(self, write_queue):
+        while True:
+            item = write_queue.get()
+            if item is None:
+                return
+            if self._errors:
+                continue
+            blob, file_name = item[0], item[1]
+            digest_key = item[2] if len(item) > 2 else file_name
+            try:
+                if self.store is not None:
+                    digest = self.store.put(blob, file_name)
+                else:
+                    file_path = os.path.join(self.attachments_dir, file_name)
+                    tmp_path = file_path + '.' + str(threading.get_ident()) + '.tmp'
+                    with open(tmp_path, 'wb') as file_write:
+                        file_write.write(blob)
+                    # replace instead of writing into the old file, which may be a hardlink into an AttachmentStore
+                    os.replace(tmp_path, file_path)
+                    digest = hashlib.sha256(blob).hexdigest() if self.hash_blobs else None
+                with self._lock:
+                    if digest:
+                        self.digests[digest_key] = digest
+                    self.written += 1
+                    self.bytes_written += memoryview(blob).nbytes
+            except Exception as err:
+                self._errors.append(err)
@@ -4,9 +4,10 @@ Extract attachments from ESRI file geodatabase
 Created By: mkimble
 """
 
-import os, arcpy
 from . import settings
 from .logger_settings import api_logger
+from .survey123_attachment_writer import AttachmentWriter, ATTACHMENT_WRITERS, ATTACHMENT_QUEUE_DEPTH
+from .survey123_fgdb_backend import get_fgdb_reader
 
 
 class DownloadAttachmentsFGDB:
@@ -16,25 +17,33 @@ class DownloadAttachmentsFGDB:
    BLOB_FIELD: Field name of Blob data type field in attachment table
    ATTACHMENTS_FIELD: Field name in attachment table that contains attachment name
    ATTACHMENTS_FOLDER: Output folder to export attachments to
+   ATTACHMENT_WRITERS: Number of threads writing attachments to disk
+   ATTACHMENT_QUEUE_DEPTH: Maximum number of attachments read but not yet written
+   BACKEND: Read the attachment table with 'arcpy', 'gdal', or whichever can be imported with 'auto'
    """
    def __init__(self, ATTACHMENTS_TABLE=settings.ATTACHMENTS_TABLE,
                 BLOB_FIELD = settings.BLOB_FIELD,
                 ATTACHMENTS_FIELD = settings.ATTACHMENTS_FIELD,
-                ATTACHMENTS_FOLDER = settings.ATTACHMENTS_FOLDER):
+                ATTACHMENTS_FOLDER = settings.ATTACHMENTS_FOLDER,
+                ATTACHMENT_WRITERS = ATTACHMENT_WRITERS,
+                ATTACHMENT_QUEUE_DEPTH = ATTACHMENT_QUEUE_DEPTH,
+                BACKEND = 'auto'):
       self.ATTACHMENTS_TABLE = ATTACHMENTS_TABLE
       self.BLOB_FIELD = BLOB_FIELD
       self.ATTACHMENTS_FIELD = ATTACHMENTS_FIELD
       self.ATTACHMENTS_FOLDER = ATTACHMENTS_FOLDER
+      self.ATTACHMENT_WRITERS = ATTACHMENT_WRITERS
+      self.ATTACHMENT_QUEUE_DEPTH = ATTACHMENT_QUEUE_DEPTH
+      self.BACKEND = BACKEND
 
    def extract_attachments(self):
       try:
          api_logger.info("[START] extract_attachments")
-         with arcpy.da.SearchCursor(self.ATTACHMENTS_TABLE, [self.BLOB_FIELD, self.ATTACHMENTS_FIELD]) as cursor:
-            for row in cursor:
-               binary_rep = row[0]
-               file_name = row[1]
-               # save to disk
-               open(self.ATTACHMENTS_FOLDER + os.sep + file_name, 'wb').write(binary_rep.tobytes())
+         attachment_writer = AttachmentWriter(self.ATTACHMENTS_FOLDER, max_workers=self.ATTACHMENT_WRITERS,
+                                              queue_depth=self.ATTACHMENT_QUEUE_DEPTH)
+         fgdb_reader = get_fgdb_reader(self.BACKEND)
+         # save to disk
+         attachment_writer.write_rows(fgdb_reader.search(self.ATTACHMENTS_TABLE, [self.BLOB_FIELD, self.ATTACHMENTS_FIELD]))
          api_logger.info("[END] extract_attachments")
       except Exception as err:
          raise RuntimeError("** Error: extract_attachments Failed (" + str(err) + ")")
@@ -0,0 +1,153 @@
+"""
+survey123_clean_csv
+Stream Survey123 CSV exports through a quote-aware cleaner that replaces new lines within text fields.
+"""
+
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# read size for each buffer passed through the cleaner, in characters
+CLEAN_CHUNK_SIZE = 1024 * 1024
+
+
+def clean_quoted_newlines(file_read, file_write, chunk_size=CLEAN_CHUNK_SIZE):
+    """
+    Read file_read in chunks of chunk_size and write each chunk to file_write with new lines inside
+    double quoted text fields replaced by a space. Whether the cleaner is inside a quoted field is
+    carried from one chunk to the next, so a text field may span any number of buffers.
+    Escaped quotes ("") toggle the quote state twice and are left as is. Peak memory is set by
+    chunk_size and not by the size of the file.
+    :param file_read: File object opened for reading in text mode.
+    :param file_write: File object opened for writing in text mode.
+    :param chunk_size: Number of characters to read at a time.
+    :return: Number of characters written.
+    """
+    in_quotes = False
+    chars_written = 0
+    while True:
+        chunk = file_read.read(chunk_size)
+        if not chunk:
+            break
+        chunk, in_quotes = clean_chunk(chunk, in_quotes)
+        file_write.write(chunk)
+        chars_written += len(chunk)
+    return chars_written
+
+
+def clean_chunk(chunk, in_quotes):
+    """
+    Replace new lines inside double quoted text fields of chunk with a space.
+    :param chunk: Text read from a CSV.
+    :param in_quotes: Boolean. True if the text before chunk ended inside of a quoted field.
+    :return: cleaned chunk, and whether chunk ended inside of a quoted field
+    """
+    if '"' not in chunk:
+        # the chunk is entirely inside or entirely outside of a text field
+        if in_quotes:
+            chunk = chunk.replace("\n", " ")
+        return chunk, in_quotes
+    parts = chunk.split('"')
+    # parts alternate between outside and inside a quoted field. The first part is inside
+    # of a quoted field only if the previous chunk ended inside of one.
+    first_quoted = 0 if in_quotes else 1
+    parts[first_quoted::2] = [part.replace("\n", " ") for part in parts[first_quoted::2]]
+    # an odd number of quotes flips the state carried to the next chunk
+    if (len(parts) - 1) % 2:
+        in_quotes = not in_quotes
+    return '"'.join(parts), in_quotes
+
+
+class CleanedCSVReader:
+    """
+    Read-only file-like wrapper that cleans text as it is read, so a CSV can be streamed through the
+    cleaner straight into pd.read_csv. Cleaned text may also be written to side_output as it is read.
+    :param file_read: File object opened for reading in text mode.
+    :param side_output: Optional file object opened for writing in text mode.
+    :param chunk_size: Number of characters to read at a time when size is not given.
+    """
+    def __init__(self, file_read, side_output=None, chunk_size=CLEAN_CHUNK_SIZE):
+        self.file_read = file_read
+        self.side_output = side_output
+        self.chunk_size = chunk_size
+        self.in_quotes = False
+
+    def read(self, size=-1):
+        if size is None or size < 0:
+            size = self.chunk_size
+        chunk = self.file_read.read(size)
+        if chunk:
+            chunk, self.in_quotes = clean_chunk(chunk, self.in_quotes)
+            if self.side_output is not None:
+                self.side_output.write(chunk)
+        return chunk
+
+    def __iter__(self):
+        # pandas checks for read and __iter__ to decide if the object is file-like
+        return iter(lambda: self.read(), '')
+
+
+def clean_csv_file(input_file, output_file, chunk_size=CLEAN_CHUNK_SIZE):
+    """
+    Clean input_file and save to output_file with clean_quoted_newlines.
+    :param input_file: Filepath to a CSV downloaded from AGOL.
+    :param output_file: Filepath to save the cleaned CSV.
+    :param chunk_size: Number of characters to read at a time.
+    :return: Number of characters written.
+    """
+    # specifying an encoding, e.g., encoding='utf8' will throw errors. Not specifying an encoding
+    # will also throw errors on different CSV files. Using errors='ignore' to bypass unknown characters
+    # but could lead to some data-loss for those unknown characters.
+    with open(input_file, mode='r', errors='ignore') as file_read:
+        with open(output_file, mode='w') as file_write:
+            return clean_quoted_newlines(file_read, file_write, chunk_size)
+
+
+def _clean_csv_worker(input_file, output_file, chunk_size):
+    """
+    Clean one CSV within a worker process. Log messages are returned to the parent process
+    instead of written from the worker so that the log file is only written by one process.
+    """
+    start = time.perf_counter()
+    chars_written = clean_csv_file(input_file, output_file, chunk_size)
+    seconds = time.perf_counter() - start
+    messages = ["clean_data: cleaning " + input_file,
+                "clean_data: cleaned " + output_file]
+    return {'input_file': input_file, 'output_file': output_file,
+            'chars_written': chars_written, 'seconds': seconds, 'messages': messages}
+
+
+def clean_csv_files(file_pairs, max_workers=None, chunk_size=CLEAN_CHUNK_SIZE, logger=None):
+    """
+    Clean each (input_file, output_file) pair concurrently in a bounded process pool. Logs from each
+    file are written in the order of file_pairs once that file and every file before it are done,
+    followed by a per-file timing report.
+    :param file_pairs: List of (input_file, output_file) tuples.
+    :param max_workers: Maximum number of worker processes. Defaults to the number of CPUs.
+    :param chunk_size: Number of characters to read at a time.
+    :param logger: Logger for merged worker logs and the timing report.
+    :return: List of per-file result dicts in the order of file_pairs.
+    """
+    if not file_pairs:
+        return []
+    max_workers = min(len(file_pairs), max_workers or os.cpu_count() or 1)
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        futures = [executor.submit(_clean_csv_worker, input_file, output_file, chunk_size)
+                   for input_file, output_file in file_pairs]
+        results = []
+        for future in futures:
+            result = future.result()
+            if logger:
+                for message in result['messages']:
+                    logger.info(message)
+            results.append(result)
+    wall_seconds = time.perf_counter() - start
+    if logger:
+        for result in results:
+            logger.info("clean_data: timing {0:.2f}s {1:.1f} MB/s {2}".format(
+                result['seconds'], result['chars_written'] / (1024 * 1024) / max(result['seconds'], 1e-9),
+                os.path.basename(result['input_file'])))
+        logger.info("clean_data: {0} files, {1} workers, wall {2:.2f}s, sum of files {3:.2f}s".format(
+            len(results), max_workers, wall_seconds, sum(result['seconds'] for result in results)))
+    return results
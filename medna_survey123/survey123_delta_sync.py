@@ -0,0 +1,196 @@
+"""
+survey123_delta_sync
+Incrementally sync Survey123 layers from the AGOL feature service using an EditDate high-water mark.
+"""
+
+import os
+import json
+from datetime import datetime, timezone
+import requests
+import pandas as pd
+from .logger_settings import api_logger
+
+# layer ids within the Survey123 feature service. These match the suffix of each table in the CSV export,
+# e.g., rep_envmeas_2.csv is layer 2.
+SURVEY123_LAYER_IDS = {'survey': 0, 'rep_crew': 1, 'rep_envmeas': 2, 'rep_collection': 3, 'rep_filter': 4}
+# number of features requested per page. AGOL caps this with the layer's maxRecordCount.
+DELTA_SYNC_PAGE_SIZE = 2000
+# EditDate is not unique, so pages are also ordered by ObjectID. Otherwise rows sharing an edit time may come back
+# in a different order on each page and offset paging skips or repeats them.
+DELTA_SYNC_ORDER_BY = 'EditDate ASC, ObjectID ASC'
+
+
+def format_export_date(value_ms):
+    """
+    Format a date in epoch milliseconds like the dates of the CSV export, e.g., 6/1/2021 2:30:00 PM, with the
+    month, day and hour not zero padded.
+    """
+    if pd.isna(value_ms):
+        return value_ms
+    date = pd.Timestamp(int(value_ms), unit='ms')
+    return '{0}/{1}/{2} {3}:{4:02d}:{5:02d} {6}'.format(date.month, date.day, date.year, date.hour % 12 or 12,
+                                                        date.minute, date.second, 'AM' if date.hour < 12 else 'PM')
+
+
+class FeatureServiceDeltaSync:
+    """
+    Fetch only rows that were created or edited since the last run and upsert them by GlobalID into the
+    local store. The local store is the cleaned CSV of each layer, in the same format as the CSV export,
+    so the subset and join stages read from it unchanged. Deleted features are not removed from the store.
+    A full CSV export replaces the store, including the rows upserted here. The export already holds those rows,
+    and the watermarks are kept, so the next sync refetches the rows edited since the last sync and the upsert
+    drops the duplicates. Only a full export removes deleted features.
+    :param feature_service_url: REST url of the Survey123 feature service, e.g., https://.../FeatureServer
+    :param layer_stores: Expects python dictionary of layer name to filepath of the cleaned CSV for that layer.
+    :param watermark_file: Filepath of the JSON file that holds the EditDate high-water mark of each layer.
+    :param token: AGOL token. Optional for public services and local stand-ins.
+    :param layer_ids: Expects python dictionary of layer name to layer id within the feature service.
+    :param page_size: Number of features to request per page.
+    :param session: requests.Session to reuse for each query.
+    """
+    def __init__(self, feature_service_url, layer_stores, watermark_file,
+                 token=None,
+                 layer_ids=SURVEY123_LAYER_IDS,
+                 page_size=DELTA_SYNC_PAGE_SIZE,
+                 session=None):
+        self.feature_service_url = feature_service_url.rstrip('/')
+        self.layer_stores = layer_stores
+        self.watermark_file = watermark_file
+        self.token = token
+        self.layer_ids = layer_ids
+        self.page_size = page_size
+        self.session = session or requests.Session()
+
+    def read_watermarks(self):
+        """
+        EditDate high-water mark of each layer in epoch milliseconds
+        """
+        if os.path.exists(self.watermark_file):
+            with open(self.watermark_file, mode='r') as file_read:
+                return json.load(file_read)
+        return {}
+
+    def write_watermarks(self, watermarks):
+        # write to a temp file and then replace so that a failed run cannot leave a partial watermark file
+        tmp_file = self.watermark_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(watermarks, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.watermark_file)
+
+    def query_layer(self, layer_id, since_ms=None):
+        """
+        Query every feature of layer_id with an EditDate at or after since_ms, one page at a time.
+        :return: fields and features from the query endpoint
+        """
+        if since_ms is None:
+            where = '1=1'
+        else:
+            since = datetime.fromtimestamp(since_ms / 1000.0, tz=timezone.utc)
+            # >= so that edits sharing the watermark's timestamp are not missed; upsert drops the duplicates
+            where = "EditDate >= TIMESTAMP '" + since.strftime('%Y-%m-%d %H:%M:%S') + "'"
+        query_url = self.feature_service_url + '/' + str(layer_id) + '/query'
+        fields = []
+        features = []
+        offset = 0
+        while True:
+            params = {'where': where,
+                      'outFields': '*',
+                      'returnGeometry': 'true',
+                      'outSR': 4326,
+                      'orderByFields': DELTA_SYNC_ORDER_BY,
+                      'resultOffset': offset,
+                      'resultRecordCount': self.page_size,
+                      'f': 'json'}
+            if self.token:
+                params['token'] = self.token
+            response = self.session.post(query_url, data=params)
+            response.raise_for_status()
+            result = response.json()
+            if 'error' in result:
+                raise RuntimeError("query " + query_url + " failed: " + str(result['error']))
+            fields = result.get('fields', fields)
+            page = result.get('features', [])
+            features.extend(page)
+            offset += len(page)
+            if not page or not result.get('exceededTransferLimit', False):
+                break
+        return fields, features
+
+    @staticmethod
+    def features_to_df(fields, features):
+        """
+        Convert query features to a DataFrame shaped like the CSV export: columns named by field alias,
+        dates formatted as text, GlobalIDs without braces, point geometry as x and y, and no new lines
+        within text fields.
+        """
+        rows = []
+        for feature in features:
+            row = dict(feature.get('attributes', {}))
+            geometry = feature.get('geometry')
+            if geometry and 'x' in geometry:
+                row['x'] = geometry['x']
+                row['y'] = geometry['y']
+            rows.append(row)
+        df = pd.DataFrame(rows)
+        edit_date_ms = df['EditDate'] if 'EditDate' in df else pd.Series(dtype='float64')
+        aliases = {}
+        for field in fields:
+            name = field['name']
+            if name not in df:
+                continue
+            if field.get('type') == 'esriFieldTypeDate':
+                df[name] = df[name].map(format_export_date)
+            elif field.get('type') in ('esriFieldTypeGlobalID', 'esriFieldTypeGUID'):
+                df[name] = df[name].str.strip('{}').str.lower()
+            elif field.get('type') == 'esriFieldTypeString':
+                df[name] = df[name].str.replace('\r', ' ', regex=False).str.replace('\n', ' ', regex=False)
+            aliases[name] = field.get('alias') or name
+        df = df.rename(columns=aliases)
+        return df, edit_date_ms
+
+    @staticmethod
+    def upsert(store_file, df):
+        """
+        Upsert df into the CSV at store_file by GlobalID. Rows in df replace rows with the same GlobalID.
+        """
+        if os.path.exists(store_file):
+            store_df = pd.read_csv(store_file, index_col=False)
+            store_df = pd.concat([store_df, df], ignore_index=True, sort=False)
+        else:
+            store_df = df
+        store_df = store_df.drop_duplicates(subset=['GlobalID'], keep='last')
+        tmp_file = store_file + '.tmp'
+        store_df.to_csv(tmp_file, index=False, encoding='utf-8')
+        os.replace(tmp_file, store_file)
+        return len(store_df)
+
+    def sync(self):
+        """
+        Fetch and upsert the delta of each layer, then advance each layer's watermark.
+        :return: python dictionary of layer name to number of rows fetched
+        """
+        try:
+            api_logger.info("[START] sync")
+            watermarks = self.read_watermarks()
+            fetched = {}
+            for layer_name, store_file in self.layer_stores.items():
+                layer_id = self.layer_ids[layer_name]
+                # without a local store there is nothing to upsert into, so fetch the whole layer
+                since_ms = watermarks.get(layer_name) if os.path.exists(store_file) else None
+                fields, features = self.query_layer(layer_id, since_ms)
+                fetched[layer_name] = len(features)
+                api_logger.info("sync: " + layer_name + " fetched " + str(len(features)) +
+                                " rows edited since " + str(since_ms))
+                if not features:
+                    continue
+                df, edit_date_ms = self.features_to_df(fields, features)
+                store_rows = self.upsert(store_file, df)
+                api_logger.info("sync: " + layer_name + " store " + store_file + " has " + str(store_rows) + " rows")
+                if edit_date_ms.notna().any():
+                    watermarks[layer_name] = int(max(edit_date_ms.max(), since_ms or 0))
+                # advance watermarks as each layer is stored so a failure later does not refetch this layer
+                self.write_watermarks(watermarks)
+            api_logger.info("[END] sync")
+            return fetched
+        except Exception as err:
+            raise RuntimeError("** Error: sync Failed (" + str(err) + ")")
@@ -0,0 +1,150 @@
+"""
+survey123_derivatives
+Build thumbnails and compressed web versions of extracted attachments in a process pool.
+"""
+
+import os
+import json
+import time
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
+from PIL import Image, ImageOps
+from .logger_settings import api_logger
+
+# longest side of thumbnails and web versions, in pixels
+THUMBNAIL_SIZE = 256
+WEB_SIZE = 1600
+# JPEG quality of thumbnails and web versions
+THUMBNAIL_QUALITY = 75
+WEB_QUALITY = 80
+# attachments with these extensions are images
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.gif', '.bmp', '.tif', '.tiff')
+
+
+def derivative_name(file_name):
+    # derivatives are always JPEG
+    return file_name if file_name.lower().endswith(('.jpg', '.jpeg')) else file_name + '.jpg'
+
+
+def save_jpeg(image, output_path, quality):
+    tmp_path = output_path + '.' + str(os.getpid()) + '.tmp'
+    image.save(tmp_path, format='JPEG', quality=quality, optimize=True)
+    os.replace(tmp_path, output_path)
+
+
+def build_derivatives(source_path, thumbnail_path, web_path, cached_sha256=None,
+                      thumbnail_size=THUMBNAIL_SIZE, web_size=WEB_SIZE,
+                      thumbnail_quality=THUMBNAIL_QUALITY, web_quality=WEB_QUALITY):
+    """
+    Thumbnail and web version of one image. Runs within a worker process.
+    :return: sha256 of the source and True if derivatives were built, or False if the source matched cached_sha256
+    """
+    with open(source_path, mode='rb') as file_read:
+        sha256 = hashlib.sha256(file_read.read()).hexdigest()
+    if sha256 == cached_sha256 and os.path.exists(thumbnail_path) and os.path.exists(web_path):
+        return sha256, False
+    with Image.open(source_path) as image:
+        # apply the camera's rotation, which is otherwise lost when EXIF is dropped
+        image = ImageOps.exif_transpose(image).convert('RGB')
+        web_image = image.copy()
+        web_image.thumbnail((web_size, web_size), Image.LANCZOS)
+        save_jpeg(web_image, web_path, web_quality)
+        # downscale the thumbnail from the web version, which is much faster than from the original
+        web_image.thumbnail((thumbnail_size, thumbnail_size), Image.LANCZOS)
+        save_jpeg(web_image, thumbnail_path, thumbnail_quality)
+    return sha256, True
+
+
+class DerivativeBuilder:
+    """
+    Build a thumbnail and a web version of each image in attachments_dir into derivatives_dir/thumbnails and
+    derivatives_dir/web. A cache of the size, modified time and sha256 of each source skips attachments seen on
+    earlier runs without reading them. Sources whose size or modified time changed are hashed, and their
+    derivatives are only rebuilt if the hash changed. Derivatives of removed attachments are deleted.
+    :param attachments_dir: Folder of extracted attachments.
+    :param derivatives_dir: Folder to write thumbnails and web versions to.
+    :param cache_file: Filepath of the JSON derivative cache. Defaults to derivatives_dir/derivatives_cache.json
+    :param max_workers: Number of worker processes. Defaults to the number of processors.
+    """
+    def __init__(self, attachments_dir, derivatives_dir,
+                 cache_file=None,
+                 max_workers=None):
+        self.attachments_dir = attachments_dir
+        self.derivatives_dir = derivatives_dir
+        self.thumbnails_dir = os.path.join(derivatives_dir, 'thumbnails')
+        self.web_dir = os.path.join(derivatives_dir, 'web')
+        self.cache_file = cache_file or os.path.join(derivatives_dir, 'derivatives_cache.json')
+        self.max_workers = max_workers
+
+    def read_cache(self):
+        if os.path.exists(self.cache_file):
+            with open(self.cache_file, mode='r') as file_read:
+                return json.load(file_read)
+        return {}
+
+    def write_cache(self, cache):
+        tmp_file = self.cache_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(cache, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.cache_file)
+
+    def build(self):
+        """
+        :return: number of attachments whose derivatives were built
+        """
+        try:
+            api_logger.info("[START] build_derivatives")
+            start = time.perf_counter()
+            os.makedirs(self.thumbnails_dir, exist_ok=True)
+            os.makedirs(self.web_dir, exist_ok=True)
+            cache = self.read_cache()
+            file_names = [file_name for file_name in os.listdir(self.attachments_dir)
+                          if file_name.lower().endswith(IMAGE_EXTENSIONS)]
+            pending = {}
+            for file_name in file_names:
+                file_stat = os.stat(os.path.join(self.attachments_dir, file_name))
+                entry = cache.get(file_name)
+                if entry is not None and entry['size'] == file_stat.st_size and \
+                        entry['mtime'] == int(file_stat.st_mtime):
+                    continue
+                pending[file_name] = (file_stat, entry['sha256'] if entry else None)
+            built = 0
+            with ProcessPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = {file_name: executor.submit(build_derivatives,
+                                                      os.path.join(self.attachments_dir, file_name),
+                                                      os.path.join(self.thumbnails_dir, derivative_name(file_name)),
+                                                      os.path.join(self.web_dir, derivative_name(file_name)),
+                                                      cached_sha256)
+                           for file_name, (file_stat, cached_sha256) in pending.items()}
+                for file_name, future in futures.items():
+                    file_stat = pending[file_name][0]
+                    try:
+                        sha256, rebuilt = future.result()
+                    except Exception as err:
+                        # leave it out of the cache so it is tried again on the next run
+                        api_logger.info("build_derivatives: skipping " + file_name + " (" + str(err) + ")")
+                        continue
+                    cache[file_name] = {'size': file_stat.st_size, 'mtime': int(file_stat.st_mtime), 'sha256': sha256}
+                    built += rebuilt
+            removed = self.remove_stale(cache, set(file_names))
+            self.write_cache(cache)
+            api_logger.info("build_derivatives: {0} images, {1} checked, {2} built, {3} removed in {4:.2f}s".format(
+                len(file_names), len(pending), built, removed, time.perf_counter() - start))
+            api_logger.info("[END] build_derivatives")
+            return built
+        except Exception as err:
+            raise RuntimeError("** Error: build_derivatives Failed (" + str(err) + ")")
+
+    def remove_stale(self, cache, file_names):
+        """
+        Delete the derivatives and cache entries of attachments no longer within attachments_dir.
+        """
+        removed = 0
+        for file_name in [file_name for file_name in cache if file_name not in file_names]:
+            del cache[file_name]
+            for output_dir in (self.thumbnails_dir, self.web_dir):
+                output_path = os.path.join(output_dir, derivative_name(file_name))
+                if os.path.exists(output_path):
+                    os.remove(output_path)
+            removed += 1
+        return removed
@@ -0,0 +1,227 @@
+"""
+survey123_download
+Download large export zips with parallel HTTP range requests, resume partial downloads, and verify them.
+"""
+
+import os
+import json
+import time
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from zipfile import ZipFile, BadZipFile
+import requests
+from .logger_settings import api_logger
+
+# bytes fetched by each range request
+DOWNLOAD_SEGMENT_SIZE = 16 * 1024 * 1024
+# bytes read from the response before each write
+DOWNLOAD_CHUNK_SIZE = 1024 * 1024
+# seconds to wait for the server to respond to a request
+DOWNLOAD_TIMEOUT = 60
+# times a dropped or short segment is requested again before the download fails
+DOWNLOAD_SEGMENT_RETRIES = 3
+# seconds to wait before the first retry of a segment, doubled on each retry
+DOWNLOAD_RETRY_WAIT = 1
+
+
+def verify_zip(zip_file_path, expected_size=None):
+    """
+    Check the size of a downloaded zip and the CRC of every member, so that a truncated or corrupt zip fails
+    here instead of part way through clean.
+    :param zip_file_path: Filepath of the zip.
+    :param expected_size: Size in bytes reported by the server, if known.
+    """
+    actual_size = os.path.getsize(zip_file_path)
+    if expected_size is not None and actual_size != expected_size:
+        raise RuntimeError(zip_file_path + " is " + str(actual_size) + " bytes, expected " + str(expected_size))
+    try:
+        with ZipFile(zip_file_path) as zip_file:
+            bad_member = zip_file.testzip()
+    except BadZipFile as err:
+        raise RuntimeError(zip_file_path + " is not a valid zip (" + str(err) + ")")
+    if bad_member is not None:
+        raise RuntimeError(zip_file_path + " failed CRC check at " + bad_member)
+
+
+class ShortSegmentError(RuntimeError):
+    pass
+
+
+class SegmentedDownloader:
+    """
+    Download url in segments with parallel range requests into output_file_path + '.part'. A segment whose
+    connection drops is requested again up to retries times. Completed segments are recorded in
+    output_file_path + '.part.json' with the url, ETag and Last-Modified of the file, so a later call resumes
+    where a failed download left off, but only if it is downloading the same version of the same file. The zip
+    is verified with verify_zip before it is renamed to output_file_path, and the part and state files are
+    deleted if it fails, so the next call starts over. Servers that do not support range requests are
+    downloaded in one stream.
+    :param url: Url of the file, e.g., the data url of an AGOL export item.
+    :param output_file_path: Filepath to save the file to.
+    :param params: Query parameters sent with each request, e.g., the AGOL token.
+    :param segment_size: Bytes fetched by each range request.
+    :param max_workers: Maximum number of range requests at the same time.
+    :param session: requests.Session to reuse for each request.
+    :param retries: Times a dropped or short segment is requested again before the download fails.
+    :param retry_wait: Seconds to wait before the first retry of a segment, doubled on each retry.
+    """
+    def __init__(self, url, output_file_path,
+                 params=None,
+                 segment_size=DOWNLOAD_SEGMENT_SIZE,
+                 max_workers=4,
+                 session=None,
+                 retries=DOWNLOAD_SEGMENT_RETRIES,
+                 retry_wait=DOWNLOAD_RETRY_WAIT):
+        self.url = url
+        self.output_file_path = output_file_path
+        self.part_file = output_file_path + '.part'
+        self.state_file = output_file_path + '.part.json'
+        self.params = params or {}
+        self.segment_size = segment_size
+        self.max_workers = max_workers
+        self.session = session or requests.Session()
+        self.retries = retries
+        self.retry_wait = retry_wait
+        # ETag of the file, sent as If-Range so a file replaced mid download is never stitched from two versions
+        self.etag = None
+        self._state_lock = threading.Lock()
+
+    def probe(self):
+        """
+        Ask for the first byte to learn the size and version of the file and whether the server supports range
+        requests.
+        :return: size in bytes, or None if unknown, True if range requests are supported, and python dictionary
+        of the ETag and Last-Modified of the file, None where the server does not send them
+        """
+        response = self.session.get(self.url, params=self.params, headers={'Range': 'bytes=0-0'},
+                                    stream=True, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            response.raise_for_status()
+            version = {'etag': response.headers.get('ETag'), 'last_modified': response.headers.get('Last-Modified')}
+            content_range = response.headers.get('Content-Range', '')
+            if response.status_code == 206 and '/' in content_range and not content_range.endswith('*'):
+                return int(content_range.rsplit('/', 1)[1]), True, version
+            content_length = response.headers.get('Content-Length')
+            return (int(content_length) if content_length else None), False, version
+        finally:
+            response.close()
+
+    def read_state(self, size, version):
+        """
+        Completed segments of an earlier attempt, if it was downloading the same url and version in the same
+        segments. Without an ETag or Last-Modified the version of the file is unknown, so it is never resumed.
+        """
+        new_state = dict(version, url=self.url, size=size, segment_size=self.segment_size, completed=[])
+        if os.path.exists(self.state_file) and os.path.exists(self.part_file) and any(version.values()):
+            with open(self.state_file, mode='r') as file_read:
+                state = json.load(file_read)
+            if all(state.get(key) == new_state[key] for key in ('url', 'etag', 'last_modified', 'size',
+                                                                 'segment_size')):
+                return state
+        return new_state
+
+    def remove_part(self):
+        for file_path in (self.part_file, self.state_file):
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+    def write_state(self, state):
+        tmp_file = self.state_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(state, file_write)
+        os.replace(tmp_file, self.state_file)
+
+    def download(self):
+        """
+        :return: output_file_path
+        """
+        try:
+            api_logger.info("[START] segmented_download")
+            size, ranges_supported, version = self.probe()
+            if not ranges_supported or not size:
+                api_logger.info("segmented_download: server does not support range requests, downloading in one stream")
+                self.download_stream()
+            else:
+                self.etag = version['etag']
+                state = self.read_state(size, version)
+                if not state['completed']:
+                    # start a new part file at full size so each segment can be written at its own offset
+                    with open(self.part_file, mode='wb') as file_write:
+                        file_write.truncate(size)
+                    self.write_state(state)
+                segments = [(start, min(start + self.segment_size, size) - 1)
+                            for start in range(0, size, self.segment_size)]
+                pending = [segment for segment in segments if segment[0] not in state['completed']]
+                api_logger.info("segmented_download: {0} bytes, {1} of {2} segments already downloaded".format(
+                    size, len(segments) - len(pending), len(segments)))
+                with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                    for _ in executor.map(lambda segment: self.download_segment(segment, state), pending):
+                        pass
+            try:
+                verify_zip(self.part_file, size)
+            except RuntimeError:
+                # the recorded segments hold bad bytes, so resuming from them would fail the same way
+                self.remove_part()
+                raise
+            os.replace(self.part_file, self.output_file_path)
+            if os.path.exists(self.state_file):
+                os.remove(self.state_file)
+            api_logger.info("segmented_download: verified " + self.output_file_path)
+            api_logger.info("[END] segmented_download")
+            return self.output_file_path
+        except Exception as err:
+            raise RuntimeError("** Error: segmented_download Failed (" + str(err) + ")")
+
+    def download_segment(self, segment, state):
+        """
+        Fetch one segment, requesting it again with backoff if its connection drops or it comes up short.
+        """
+        start, end = segment
+        for attempt in range(self.retries + 1):
+            try:
+                return self.fetch_segment(segment, state)
+            except (requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError,
+                    requests.exceptions.Timeout, ShortSegmentError) as err:
+                if attempt == self.retries:
+                    raise
+                wait = self.retry_wait * 2 ** attempt
+                api_logger.info("segmented_download: segment {0}-{1} dropped ({2}), retrying in {3}s".format(
+                    start, end, err, wait))
+                time.sleep(wait)
+
+    def fetch_segment(self, segment, state):
+        start, end = segment
+        headers = {'Range': 'bytes={0}-{1}'.format(start, end)}
+        if self.etag:
+            headers['If-Range'] = self.etag
+        response = self.session.get(self.url, params=self.params, headers=headers, stream=True,
+                                    timeout=DOWNLOAD_TIMEOUT)
+        try:
+            response.raise_for_status()
+            if response.status_code != 206:
+                # also the reply to If-Range once the file has changed since the probe
+                raise RuntimeError("server ignored the range request for bytes {0}-{1}".format(start, end))
+            received = 0
+            with open(self.part_file, mode='r+b') as file_write:
+                file_write.seek(start)
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    file_write.write(chunk)
+                    received += len(chunk)
+        finally:
+            response.close()
+        if received != end - start + 1:
+            raise ShortSegmentError("segment {0}-{1} received {2} bytes".format(start, end, received))
+        # only record the segment once all of its bytes are written, so a resume refetches partial segments
+        with self._state_lock:
+            state['completed'].append(start)
+            self.write_state(state)
+
+    def download_stream(self):
+        response = self.session.get(self.url, params=self.params, stream=True, timeout=DOWNLOAD_TIMEOUT)
+        try:
+            response.raise_for_status()
+            with open(self.part_file, mode='wb') as file_write:
+                for chunk in response.iter_content(chunk_size=DOWNLOAD_CHUNK_SIZE):
+                    file_write.write(chunk)
+        finally:
+            response.close()
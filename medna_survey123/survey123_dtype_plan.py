@@ -0,0 +1,83 @@
+"""
+survey123_dtype_plan
+Categorical and downcast dtypes for the subset tables, which are kept through the merges of join_data.
+"""
+
+import numpy as np
+import pandas as pd
+from .logger_settings import api_logger
+
+# columns are only made categorical when they have at most this many distinct values per row, otherwise the
+# categories take as much memory as the strings
+CATEGORY_MAX_RATIO = 0.5
+# subset table to the columns made categorical and the numeric measurements downcast, by target name
+DTYPE_PLAN = {
+    'survey': {
+        'category': ['project_ids', 'supervisor', 'username', 'recorder_first_name', 'recorder_last_name',
+                     'system_type', 'site_id', 'env_obs_turbidity', 'env_obs_precip', 'env_obs_wind_speed',
+                     'env_obs_cloud_cover', 'env_biome', 'env_feature', 'env_material', 'env_measure_mode',
+                     'env_boat_type', 'measurements_taken', 'core_subcorer', 'water_filterer', 'survey_complete',
+                     'qa_editor', 'survey_editor', 'survey_creator'],
+        'downcast': []},
+    'rep_crew': {
+        'category': ['crew_fname', 'crew_lname', 'crew_editor', 'crew_creator'],
+        'downcast': []},
+    'rep_envmeas': {
+        'category': ['envmeas_instrument', 'ysi_model', 'bottom_substrate', 'envmeas_editor', 'envmeas_creator'],
+        'downcast': ['envmeas_depth', 'secchi_depth', 'niskin_number', 'flow_rate', 'water_temp', 'salinity', 'ph',
+                     'par1', 'par2', 'turbidity', 'conductivity', 'do', 'pheophytin', 'chla', 'no3no2', 'no2',
+                     'nh4', 'phosphate']},
+    'rep_collection': {
+        'category': ['collection_type', 'water_control', 'water_control_type', 'water_collect_mode',
+                     'water_vessel_material', 'water_vessel_color', 'was_filtered', 'core_control', 'core_method',
+                     'subcores_taken', 'subcore_fname', 'subcore_lname', 'subcore_protocol', 'subcore_method',
+                     'collection_editor', 'collection_creator'],
+        'downcast': []},
+    'rep_filter': {
+        'category': ['is_prefilter', 'filter_location', 'filter_fname', 'filter_lname', 'filter_protocol',
+                     'filter_method', 'filter_type', 'filter_editor', 'filter_creator'],
+        'downcast': []},
+}
+
+
+def frame_memory_mb(table_df):
+    return table_df.memory_usage(deep=True).sum() / 1048576.0
+
+
+def downcast_numeric(values):
+    """
+    Smallest integer dtype of whole number columns. Float columns become float32 only if every value is written
+    to CSV the same as before, e.g., 7.1 but not 43.123456, so the CSVs uploaded to Google Sheets are unchanged.
+    """
+    if pd.api.types.is_integer_dtype(values.dtype):
+        return pd.to_numeric(values, downcast='integer')
+    if not pd.api.types.is_float_dtype(values.dtype) or values.dtype == np.float32:
+        return values
+    present = values.dropna()
+    as_float32 = present.astype(np.float32)
+    if np.array_equal(as_float32.astype(str).astype(np.float64).values, present.values):
+        return values.astype(np.float32)
+    return values
+
+
+def apply_dtype_plan(table_name, table_df):
+    """
+    Make the low cardinality columns of table_name categorical and downcast its numeric measurements, and log
+    the memory of table_df before and after.
+    :param table_name: survey, rep_crew, rep_envmeas, rep_collection, or rep_filter
+    :return: table_df with the planned dtypes
+    """
+    plan = DTYPE_PLAN[table_name]
+    memory_before = frame_memory_mb(table_df)
+    for column in plan['category']:
+        if column not in table_df.columns or isinstance(table_df[column].dtype, pd.CategoricalDtype):
+            continue
+        if table_df[column].nunique() <= CATEGORY_MAX_RATIO * len(table_df):
+            table_df[column] = table_df[column].astype('category')
+    for column in plan['downcast']:
+        if column in table_df.columns:
+            table_df[column] = downcast_numeric(table_df[column])
+    memory_after = frame_memory_mb(table_df)
+    api_logger.info("dtype_plan: {0} {1:.2f} MB to {2:.2f} MB ({3:.0%} less)".format(
+        table_name, memory_before, memory_after, 1 - memory_after / memory_before if memory_before else 0))
+    return table_df
@@ -0,0 +1,246 @@
+"""
+survey123_export_jobs
+Submit AGOL export jobs without blocking, poll their status with backoff, and enforce a deadline.
+"""
+
+import os
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from .logger_settings import api_logger
+from .survey123_download import SegmentedDownloader
+
+# first wait between status polls, in seconds
+EXPORT_POLL_INTERVAL = 2
+# polls back off by this factor up to EXPORT_MAX_POLL_INTERVAL
+EXPORT_POLL_BACKOFF = 1.5
+EXPORT_MAX_POLL_INTERVAL = 30
+# seconds an export may take to queue and build before it is abandoned
+EXPORT_DEADLINE = 3600
+# job statuses reported once an export has left the queue and is being built
+EXPORT_BUILDING_STATUSES = ('processing', 'executing', 'partial', 'in progress')
+# saved next to the zip when its segmented download fails, with the export item the next run downloads instead
+# of exporting again
+EXPORT_RESUME_SUFFIX = '.export.json'
+
+
+class ExportTimeoutError(RuntimeError):
+    pass
+
+
+class ExportJob:
+    """
+    State and timings of one export job.
+    """
+    def __init__(self, export_format, save_path, file_name):
+        self.export_format = export_format
+        self.save_path = save_path
+        self.file_name = file_name
+        self.job_id = None
+        self.export_item_id = None
+        self.status = 'not submitted'
+        self.submit_time = None
+        self.build_start_time = None
+        self.build_end_time = None
+        self.download_end_time = None
+
+    @property
+    def queue_seconds(self):
+        if self.submit_time is None:
+            return None
+        return (self.build_start_time or self.build_end_time or time.perf_counter()) - self.submit_time
+
+    @property
+    def build_seconds(self):
+        if self.build_start_time is None:
+            return None
+        return (self.build_end_time or time.perf_counter()) - self.build_start_time
+
+    @property
+    def download_seconds(self):
+        if self.build_end_time is None or self.download_end_time is None:
+            return None
+        return self.download_end_time - self.build_end_time
+
+    def timing_report(self):
+        timings = [('queue', self.queue_seconds), ('build', self.build_seconds), ('download', self.download_seconds)]
+        return self.export_format + " " + self.status + ", " + ", ".join(
+            name + " " + ("{0:.1f}s".format(seconds) if seconds is not None else "n/a") for name, seconds in timings)
+
+
+class ExportJobManager:
+    """
+    Submit exports of a survey item as background jobs. submit returns a Future right away, so other work,
+    e.g., attachment extraction or backups, can continue while AGOL builds the export.
+    :param agol_session: AGOLSession to export, poll, and download with.
+    :param item_id: Item ID of the survey feature layer to export.
+    :param poll_interval: First wait between status polls, in seconds.
+    :param poll_backoff: Factor each wait between polls grows by.
+    :param max_poll_interval: Longest wait between status polls, in seconds.
+    :param deadline: Seconds an export may take to queue and build before ExportTimeoutError is raised. The export
+    item of a job that times out or fails is deleted.
+    :param max_workers: Maximum number of exports to poll and download at the same time.
+    :param segmented_download: If true, download each export with parallel, resumable range requests and
+    verify its size and CRC instead of one streamed request. If the download fails, the export item is kept and
+    saved next to the zip, and the next job of the same item and format downloads it instead of exporting again,
+    so the download resumes from the segments already in the part file.
+    """
+    def __init__(self, agol_session, item_id,
+                 poll_interval=EXPORT_POLL_INTERVAL,
+                 poll_backoff=EXPORT_POLL_BACKOFF,
+                 max_poll_interval=EXPORT_MAX_POLL_INTERVAL,
+                 deadline=EXPORT_DEADLINE,
+                 max_workers=4,
+                 segmented_download=False):
+        self.agol_session = agol_session
+        self.item_id = item_id
+        self.poll_interval = poll_interval
+        self.poll_backoff = poll_backoff
+        self.max_poll_interval = max_poll_interval
+        self.deadline = deadline
+        self.segmented_download = segmented_download
+        self.executor = ThreadPoolExecutor(max_workers=max_workers)
+        self.jobs = []
+
+    def submit(self, export_format, save_path, file_name):
+        """
+        Start an export job for export_format.
+        :return: Future that resolves to the filepath of the zip once it is downloaded to save_path + file_name
+        """
+        job = ExportJob(export_format, save_path, file_name)
+        self.jobs.append(job)
+        return self.executor.submit(self.run_job, job)
+
+    def run_job(self, job):
+        downloading = False
+        try:
+            api_logger.info("[START] export_job " + job.export_format)
+            if not self.resume_export(job):
+                data_item = self.agol_session.item(self.item_id)
+                job.submit_time = time.perf_counter()
+                response = data_item.export(title=data_item.title, export_format=job.export_format, wait=False)
+                job.job_id = response['jobId']
+                job.export_item_id = response['exportItemId']
+                job.status = 'submitted'
+                api_logger.info("export_job: submitted " + job.export_format + " job " + str(job.job_id))
+                self.wait_for_job(job)
+            downloading = True
+            api_logger.info("export_job: downloading " + job.export_format + " to " + job.save_path + job.file_name)
+            if self.segmented_download:
+                self.download_segmented(job)
+            else:
+                export_item = self.agol_session.item(job.export_item_id)
+                export_item.download(save_path=job.save_path, file_name=job.file_name)
+            job.download_end_time = time.perf_counter()
+            api_logger.info("export_job: " + job.timing_report())
+            api_logger.info("[END] export_job " + job.export_format)
+            return job.save_path + job.file_name
+        except Exception as err:
+            api_logger.info("export_job: " + job.timing_report())
+            if downloading and self.segmented_download:
+                self.save_resume_export(job)
+            else:
+                self.delete_export_item(job)
+            raise RuntimeError("** Error: export_job " + job.export_format + " Failed (" + str(err) + ")")
+
+    def resume_export(self, job):
+        """
+        Give job the export item of an earlier job whose segmented download failed, if it exported the same item
+        in the same format and AGOL still reports the export as completed. Otherwise the earlier export item is
+        deleted and a new export is needed.
+        :return: True if job resumes the download of the earlier export item
+        """
+        resume_file = job.save_path + job.file_name + EXPORT_RESUME_SUFFIX
+        if not self.segmented_download or not os.path.exists(resume_file):
+            return False
+        with open(resume_file, mode='r') as file_read:
+            resume = json.load(file_read)
+        os.remove(resume_file)
+        if resume.get('item_id') != self.item_id or resume.get('export_format') != job.export_format:
+            return False
+        job.job_id = resume['job_id']
+        job.export_item_id = resume['export_item_id']
+        try:
+            export_item = self.agol_session.item(job.export_item_id)
+            status = str(export_item.status(job_id=job.job_id, job_type='export').get('status', '')).lower()
+        except Exception as err:
+            status = 'unavailable (' + str(err) + ')'
+        if status != 'completed':
+            api_logger.info("export_job: earlier export item " + job.export_item_id + " is " + status +
+                            ", exporting " + job.export_format + " again")
+            self.delete_export_item(job)
+            job.job_id = None
+            job.export_item_id = None
+            return False
+        job.status = 'resumed'
+        job.build_end_time = time.perf_counter()
+        api_logger.info("export_job: resuming the download of " + job.export_format + " export item " +
+                        job.export_item_id)
+        return True
+
+    def save_resume_export(self, job):
+        """
+        Keep the export item of a job whose segmented download failed, and save it next to the zip for the next
+        job of the same item and format to resume.
+        """
+        resume_file = job.save_path + job.file_name + EXPORT_RESUME_SUFFIX
+        with open(resume_file, mode='w') as file_write:
+            json.dump({'item_id': self.item_id, 'export_format': job.export_format, 'job_id': job.job_id,
+                       'export_item_id': job.export_item_id}, file_write)
+        api_logger.info("export_job: kept export item " + job.export_item_id + " of " + job.export_format +
+                        " to resume its download")
+
+    def delete_export_item(self, job):
+        """
+        Delete the export item of a job that failed or timed out, so abandoned exports do not pile up in the
+        content of the AGOL user. A failed delete is logged, so the error of the job is the one raised.
+        """
+        if job.export_item_id is None:
+            return
+        try:
+            self.agol_session.item(job.export_item_id).delete()
+            api_logger.info("export_job: deleted export item " + job.export_item_id + " of " + job.export_format)
+        except Exception as err:
+            api_logger.info("export_job: could not delete export item " + job.export_item_id + " (" + str(err) + ")")
+
+    def wait_for_job(self, job):
+        """
+        Poll the job status with backoff until it completes, fails, or passes the deadline. The export item is
+        looked up at each poll, so a poll after the token was refreshed uses the new token.
+        """
+        interval = self.poll_interval
+        while True:
+            export_item = self.agol_session.item(job.export_item_id)
+            status_response = export_item.status(job_id=job.job_id, job_type='export')
+            status = str(status_response.get('status', '')).lower()
+            if status != job.status:
+                api_logger.info("export_job: " + job.export_format + " status " + status)
+            job.status = status
+            now = time.perf_counter()
+            if status in EXPORT_BUILDING_STATUSES and job.build_start_time is None:
+                job.build_start_time = now
+            if status == 'completed':
+                job.build_end_time = now
+                if job.build_start_time is None:
+                    job.build_start_time = now
+                return status_response
+            if status == 'failed':
+                raise RuntimeError("export failed: " + str(status_response.get('statusMessage', status_response)))
+            if now - job.submit_time > self.deadline:
+                job.status = 'timed out'
+                raise ExportTimeoutError("export " + str(job.job_id) + " did not complete within " +
+                                         str(self.deadline) + " seconds")
+            time.sleep(interval)
+            interval = min(interval * self.poll_backoff, self.max_poll_interval)
+
+    def download_segmented(self, job):
+        """
+        Download the data of the export item with range requests on the pooled session of the AGOLSession, each
+        with a fresh token.
+        """
+        downloader = SegmentedDownloader(self.agol_session.item_data_url(job.export_item_id),
+                                         job.save_path + job.file_name, session=self.agol_session)
+        return downloader.download()
+
+    def shutdown(self, wait=True):
+        self.executor.shutdown(wait=wait)
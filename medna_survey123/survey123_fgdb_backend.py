@@ -0,0 +1,105 @@
+"""
+survey123_fgdb_backend
+Read file geodatabase tables with arcpy or, where arcpy is not installed, with GDAL's OpenFileGDB driver.
+"""
+
+import os
+import re
+import importlib
+from .logger_settings import api_logger
+
+# backends in the order tried by get_fgdb_reader('auto')
+FGDB_BACKENDS = ('arcpy', 'gdal')
+
+
+def backend_available(backend):
+    module_name = {'arcpy': 'arcpy', 'gdal': 'osgeo.ogr'}[backend]
+    try:
+        importlib.import_module(module_name)
+        return True
+    except ImportError:
+        return False
+
+
+def get_fgdb_reader(backend='auto'):
+    """
+    Choose a reader at runtime. 'auto' uses arcpy when it can be imported, e.g., within ArcGIS Pro, and GDAL otherwise.
+    :param backend: 'auto', 'arcpy' or 'gdal'
+    """
+    if backend == 'auto':
+        for candidate in FGDB_BACKENDS:
+            if backend_available(candidate):
+                backend = candidate
+                break
+        else:
+            raise RuntimeError("reading a file geodatabase needs arcpy or GDAL (osgeo), neither can be imported")
+    api_logger.info("get_fgdb_reader: using " + backend)
+    if backend == 'arcpy':
+        return ArcpyFGDBReader()
+    if backend == 'gdal':
+        return OGRFGDBReader()
+    raise ValueError("unknown file geodatabase backend " + str(backend))
+
+
+class ArcpyFGDBReader:
+    """
+    Read rows with arcpy.da.SearchCursor. Blob fields are returned as memoryview.
+    """
+    name = 'arcpy'
+
+    def search(self, table_path, fields, where_clause=None):
+        """
+        :param table_path: Filepath of the table within the file geodatabase, e.g., .../survey.gdb/rep_img__ATTACH
+        :param fields: Field names to return, in order.
+        :param where_clause: Optional SQL where clause.
+        :return: iterator of row tuples
+        """
+        import arcpy
+        with arcpy.da.SearchCursor(table_path, fields, where_clause=where_clause) as cursor:
+            for row in cursor:
+                yield row
+
+
+class OGRFGDBReader:
+    """
+    Read rows with GDAL/OGR's read only OpenFileGDB driver, which needs no ArcGIS license and runs on Linux.
+    OGR returns the object id field of a table, e.g., ATTACHMENTID, as the feature id, so it is read with GetFID
+    and renamed to FID within where clauses. Blob fields are returned as bytes.
+    """
+    name = 'gdal'
+
+    def search(self, table_path, fields, where_clause=None):
+        from osgeo import ogr
+        ogr.UseExceptions()
+        gdb_path, table_name = os.path.split(table_path.rstrip('/\\'))
+        data_source = ogr.GetDriverByName('OpenFileGDB').Open(gdb_path, 0)
+        if data_source is None:
+            raise RuntimeError("could not open file geodatabase " + gdb_path)
+        layer = data_source.GetLayerByName(table_name)
+        if layer is None:
+            raise RuntimeError("table " + table_name + " not found within " + gdb_path)
+        fid_column = layer.GetFIDColumn()
+        if where_clause:
+            if fid_column:
+                where_clause = re.sub(r'\b' + re.escape(fid_column) + r'\b', 'FID', where_clause)
+            layer.SetAttributeFilter(where_clause)
+        layer_defn = layer.GetLayerDefn()
+        readers = []
+        for field in fields:
+            if fid_column and field.upper() == fid_column.upper():
+                readers.append(lambda feature: feature.GetFID())
+                continue
+            field_index = layer_defn.GetFieldIndex(field)
+            if field_index < 0:
+                raise RuntimeError("field " + field + " not found within " + table_name)
+            if layer_defn.GetFieldDefn(field_index).GetType() == ogr.OFTBinary:
+                readers.append(lambda feature, index=field_index: feature.GetFieldAsBinary(index))
+            else:
+                readers.append(lambda feature, index=field_index: feature.GetField(index))
+        try:
+            for feature in layer:
+                yield tuple(reader(feature) for reader in readers)
+        finally:
+            # close the geodatabase
+            layer = None
+            data_source = None
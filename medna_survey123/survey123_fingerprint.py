@@ -0,0 +1,73 @@
+"""
+survey123_fingerprint
+Fingerprint the tables within AGOL export zips so that unchanged exports can skip clean, join, backup, and upload.
+"""
+
+import os
+import json
+import hashlib
+from datetime import datetime
+from zipfile import ZipFile
+
+# read size when hashing zip members, in bytes
+FINGERPRINT_CHUNK_SIZE = 1024 * 1024
+
+
+def fingerprint_zip(zip_file_path, chunk_size=FINGERPRINT_CHUNK_SIZE):
+    """
+    Hash each member of the zip without extracting it to disk.
+    :param zip_file_path: Filepath to a zip downloaded from AGOL.
+    :return: python dictionary of member name to sha256 hex digest
+    """
+    fingerprints = {}
+    with ZipFile(zip_file_path) as zip_file:
+        for member in zip_file.infolist():
+            if member.is_dir():
+                continue
+            sha256 = hashlib.sha256()
+            with zip_file.open(member) as member_read:
+                for chunk in iter(lambda: member_read.read(chunk_size), b''):
+                    sha256.update(chunk)
+            fingerprints[member.filename] = sha256.hexdigest()
+    return fingerprints
+
+
+class FingerprintManifest:
+    """
+    JSON manifest of the table fingerprints from the last successful run of each export format, and
+    of which stages the latest run of each format skipped and why.
+    :param manifest_file: Filepath of the JSON manifest.
+    """
+    def __init__(self, manifest_file):
+        self.manifest_file = manifest_file
+        if os.path.exists(manifest_file):
+            with open(manifest_file, mode='r') as file_read:
+                self.manifest = json.load(file_read)
+        else:
+            self.manifest = {'successful_runs': {}, 'latest_runs': {}}
+
+    def changed_members(self, fmt_name, fingerprints):
+        """
+        Members that are new or whose fingerprint differs from the last successful run of fmt_name.
+        Members removed since the last successful run also count as changed.
+        """
+        previous = self.manifest['successful_runs'].get(fmt_name, {}).get('fingerprints', {})
+        changed = [member for member, digest in fingerprints.items() if previous.get(member) != digest]
+        changed += [member for member in previous if member not in fingerprints]
+        return sorted(changed)
+
+    def record_run(self, fmt_name, fingerprints, stage_skips, successful):
+        """
+        Save the stages skipped by the latest run of fmt_name, and its fingerprints if the run was successful.
+        """
+        run_datetime = datetime.now().isoformat(timespec='seconds')
+        self.manifest['latest_runs'][fmt_name] = {'datetime': run_datetime,
+                                                  'successful': successful,
+                                                  'skipped_stages': stage_skips}
+        if successful:
+            self.manifest['successful_runs'][fmt_name] = {'datetime': run_datetime,
+                                                          'fingerprints': fingerprints}
+        tmp_file = self.manifest_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(self.manifest, file_write, indent=2, sort_keys=True)
+        os.replace(tmp_file, self.manifest_file)
@@ -0,0 +1,178 @@
+"""
+survey123_photo_metadata
+Read EXIF capture time, GPS and camera of field photos in parallel, join them to surveys, and index them spatially.
+"""
+
+import os
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from PIL import Image
+from .logger_settings import api_logger
+
+# EXIF tags
+EXIF_MAKE = 271
+EXIF_MODEL = 272
+EXIF_DATETIME = 306
+EXIF_DATETIME_ORIGINAL = 36867
+EXIF_GPS_INFO = 34853
+# GPS IFD tags
+GPS_LATITUDE_REF = 1
+GPS_LATITUDE = 2
+GPS_LONGITUDE_REF = 3
+GPS_LONGITUDE = 4
+# photos taken further than this from the survey's lat_manual and long_manual are flagged, in meters
+PHOTO_DISTANCE_THRESHOLD = 500
+# size of each grid cell of PhotoSpatialIndex, in degrees
+SPATIAL_INDEX_CELL_SIZE = 0.01
+# mean radius of the earth, in meters
+EARTH_RADIUS = 6371008.8
+METADATA_COLUMNS = ['att_name', 'file_size', 'file_mtime', 'capture_datetime', 'photo_lat', 'photo_long',
+                    'camera_make', 'camera_model']
+
+
+def dms_to_degrees(dms, ref):
+    degrees = float(dms[0]) + float(dms[1]) / 60.0 + float(dms[2]) / 3600.0
+    return -degrees if ref in ('S', 'W') else degrees
+
+
+def read_photo_metadata(file_path):
+    """
+    EXIF of one photo. Runs within a worker process. Photos without EXIF, or that are not images, return blanks.
+    :return: list of METADATA_COLUMNS values
+    """
+    file_stat = os.stat(file_path)
+    capture_datetime = photo_lat = photo_long = camera_make = camera_model = None
+    try:
+        with Image.open(file_path) as image:
+            # only JPEG and similar formats have _getexif
+            exif = image._getexif() if hasattr(image, '_getexif') else None
+    except Exception:
+        exif = None
+    exif = exif or {}
+    capture = exif.get(EXIF_DATETIME_ORIGINAL) or exif.get(EXIF_DATETIME)
+    if capture:
+        capture_datetime = str(capture).strip('\x00')
+    gps_info = exif.get(EXIF_GPS_INFO)
+    if isinstance(gps_info, dict) and GPS_LATITUDE in gps_info and GPS_LONGITUDE in gps_info:
+        try:
+            photo_lat = dms_to_degrees(gps_info[GPS_LATITUDE], gps_info.get(GPS_LATITUDE_REF, 'N'))
+            photo_long = dms_to_degrees(gps_info[GPS_LONGITUDE], gps_info.get(GPS_LONGITUDE_REF, 'E'))
+        except (TypeError, ValueError, ZeroDivisionError, IndexError):
+            photo_lat = photo_long = None
+    if exif.get(EXIF_MAKE):
+        camera_make = str(exif[EXIF_MAKE]).strip('\x00 ')
+    if exif.get(EXIF_MODEL):
+        camera_model = str(exif[EXIF_MODEL]).strip('\x00 ')
+    return [os.path.basename(file_path), file_stat.st_size, int(file_stat.st_mtime), capture_datetime,
+            photo_lat, photo_long, camera_make, camera_model]
+
+
+def haversine_meters(lat1, long1, lat2, long2):
+    lat1, long1, lat2, long2 = (np.radians(values.astype(float)) for values in (lat1, long1, lat2, long2))
+    a = np.sin((lat2 - lat1) / 2) ** 2 + np.cos(lat1) * np.cos(lat2) * np.sin((long2 - long1) / 2) ** 2
+    return 2 * EARTH_RADIUS * np.arcsin(np.sqrt(a))
+
+
+def extract_photo_metadata(attachments_dir, metadata_file, max_workers=None):
+    """
+    Read the EXIF of photos that are new or changed since the last run, in a process pool, and save the EXIF of
+    every photo in attachments_dir to metadata_file as Parquet.
+    :return: DataFrame with METADATA_COLUMNS
+    """
+    start = time.perf_counter()
+    if os.path.exists(metadata_file):
+        metadata_df = pd.read_parquet(metadata_file, engine='pyarrow')
+    else:
+        metadata_df = pd.DataFrame(columns=METADATA_COLUMNS)
+    seen = {(att_name, file_size, file_mtime) for att_name, file_size, file_mtime in
+            metadata_df[['att_name', 'file_size', 'file_mtime']].itertuples(index=False)}
+    file_names = os.listdir(attachments_dir)
+    pending = []
+    for file_name in file_names:
+        file_stat = os.stat(os.path.join(attachments_dir, file_name))
+        if (file_name, file_stat.st_size, int(file_stat.st_mtime)) not in seen:
+            pending.append(os.path.join(attachments_dir, file_name))
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        rows = list(executor.map(read_photo_metadata, pending, chunksize=32))
+    new_df = pd.DataFrame(rows, columns=METADATA_COLUMNS)
+    # drop photos that were removed or changed, then add what was just read
+    metadata_df = metadata_df[metadata_df['att_name'].isin(file_names) &
+                              ~metadata_df['att_name'].isin(new_df['att_name'])]
+    metadata_df = pd.concat([metadata_df, new_df], ignore_index=True)
+    metadata_df['photo_lat'] = metadata_df['photo_lat'].astype(float)
+    metadata_df['photo_long'] = metadata_df['photo_long'].astype(float)
+    metadata_df['file_size'] = metadata_df['file_size'].astype('int64')
+    metadata_df['file_mtime'] = metadata_df['file_mtime'].astype('int64')
+    tmp_file = metadata_file + '.tmp'
+    metadata_df.to_parquet(tmp_file, engine='pyarrow', index=False)
+    os.replace(tmp_file, metadata_file)
+    api_logger.info("extract_photo_metadata: {0} photos, {1} read, {2} with GPS in {3:.2f}s".format(
+        len(metadata_df), len(pending), metadata_df['photo_lat'].notna().sum(), time.perf_counter() - start))
+    return metadata_df
+
+
+def join_photo_survey(metadata_df, attachment_index_df, survey_sub_df, distance_threshold=PHOTO_DISTANCE_THRESHOLD):
+    """
+    Join photo EXIF to survey_sub through the attachment index, and flag photos taken further than
+    distance_threshold meters from the survey's lat_manual and long_manual.
+    :param metadata_df: from extract_photo_metadata
+    :param attachment_index_df: from survey123_attachment_index.build_attachment_index
+    :param survey_sub_df: survey_global_id, site_id, lat_manual, long_manual
+    """
+    survey_sub_df = survey_sub_df.assign(
+        survey_global_id=survey_sub_df['survey_global_id'].astype('string').str.strip('{}').str.lower())
+    photo_join = metadata_df.merge(attachment_index_df[['att_name', 'attachment_id', 'survey_global_id',
+                                                        'collection_global_id', 'filter_barcode']],
+                                   how='left', on='att_name')
+    photo_join = photo_join.merge(survey_sub_df[['survey_global_id', 'site_id', 'lat_manual', 'long_manual']],
+                                  how='left', on='survey_global_id')
+    photo_join['distance_m'] = haversine_meters(photo_join['photo_lat'], photo_join['photo_long'],
+                                                photo_join['lat_manual'], photo_join['long_manual'])
+    photo_join['far_from_site'] = photo_join['distance_m'] > distance_threshold
+    return photo_join
+
+
+class PhotoSpatialIndex:
+    """
+    Grid index of photo locations. Each photo with GPS is bucketed into a cell_size degree cell, so a bounding box
+    query only checks the photos within the cells it overlaps.
+    :param photo_df: DataFrame with photo_lat and photo_long, e.g., from join_photo_survey.
+    :param cell_size: Size of each grid cell, in degrees.
+    """
+    def __init__(self, photo_df, cell_size=SPATIAL_INDEX_CELL_SIZE):
+        self.photo_df = photo_df.reset_index(drop=True)
+        self.cell_size = cell_size
+        located = self.photo_df[self.photo_df['photo_lat'].notna() & self.photo_df['photo_long'].notna()]
+        cells = zip(np.floor(located['photo_long'] / cell_size).astype(int),
+                    np.floor(located['photo_lat'] / cell_size).astype(int))
+        self.cells = {}
+        for row_index, cell in zip(located.index, cells):
+            self.cells.setdefault(cell, []).append(row_index)
+
+    @classmethod
+    def read(cls, photo_survey_join_file, cell_size=SPATIAL_INDEX_CELL_SIZE):
+        """
+        Index the photos saved to photo_survey_join_file by DownloadCleanJoinData with photo_metadata.
+        """
+        return cls(pd.read_parquet(photo_survey_join_file, engine='pyarrow'), cell_size=cell_size)
+
+    def query_bbox(self, min_long, min_lat, max_long, max_lat):
+        """
+        Photos within the bounding box.
+        """
+        rows = []
+        for cell_x in range(int(math.floor(min_long / self.cell_size)), int(math.floor(max_long / self.cell_size)) + 1):
+            for cell_y in range(int(math.floor(min_lat / self.cell_size)), int(math.floor(max_lat / self.cell_size)) + 1):
+                rows.extend(self.cells.get((cell_x, cell_y), ()))
+        candidates = self.photo_df.loc[sorted(rows)]
+        return candidates[candidates['photo_long'].between(min_long, max_long) &
+                          candidates['photo_lat'].between(min_lat, max_lat)]
+
+    def query_site(self, site_id):
+        """
+        Photos of the surveys at site_id.
+        """
+        return self.photo_df[self.photo_df['site_id'] == site_id]
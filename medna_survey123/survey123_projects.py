@@ -0,0 +1,74 @@
+"""
+survey123_projects
+Translate the multi-select project codes of surveys to project labels, and bridge surveys to their projects.
+"""
+
+import pandas as pd
+from .logger_settings import api_logger
+
+# Survey123 joins the choices of a multi-select question with commas, e.g., prj_medna,prj_theme1
+PROJECT_SEPARATOR = ','
+BRIDGE_COLUMNS = ['survey_global_id', 'project_id', 'project_name']
+
+
+class ProjectCodeTranslator:
+    """
+    Split each distinct project_ids value into its codes once, and map each code to its label by exact match, so
+    codes that share a prefix, e.g., prj_theme1 and prj_theme10, never replace part of each other. Distinct
+    values are memoized, so the cost of a survey table is its number of distinct values, not rows times codes.
+    Codes without a label are kept as is.
+    :param survey_projects: Expects python dictionary of project code to label, e.g., settings.SURVEY_PROJECTS.
+    """
+    def __init__(self, survey_projects, separator=PROJECT_SEPARATOR):
+        self.survey_projects = survey_projects
+        self.separator = separator
+        self.value_codes = {}
+        self.value_labels = {}
+
+    def codes(self, value):
+        """
+        :return: tuple of the project codes of value, in the order they were selected
+        """
+        codes = self.value_codes.get(value)
+        if codes is None:
+            codes = tuple(code.strip() for code in value.split(self.separator) if code.strip())
+            self.value_codes[value] = codes
+        return codes
+
+    def label(self, value):
+        labels = self.value_labels.get(value)
+        if labels is None:
+            labels = self.separator.join(self.survey_projects.get(code, code) for code in self.codes(value))
+            self.value_labels[value] = labels
+        return labels
+
+    def distinct_values(self, project_ids):
+        values = pd.unique(project_ids.dropna().astype(object))
+        return [value for value in values if isinstance(value, str)]
+
+    def translate(self, project_ids):
+        """
+        :param project_ids: Series of comma separated project codes
+        :return: Series of comma separated project labels, with blanks and NaN unchanged
+        """
+        distinct_values = self.distinct_values(project_ids)
+        value_labels = {value: self.label(value) for value in distinct_values}
+        api_logger.info("translate_projects: {0} rows, {1} distinct project values".format(len(project_ids),
+                                                                                         len(distinct_values)))
+        project_ids = project_ids.astype(object)
+        return project_ids.map(value_labels).fillna(project_ids)
+
+    def bridge(self, survey_df):
+        """
+        One row per survey and selected project, to filter surveys by project without matching strings.
+        :param survey_df: DataFrame with survey_global_id and project_ids, before project_ids are translated
+        :return: DataFrame of survey_global_id, project_id, and project_name
+        """
+        value_codes = pd.DataFrame([(value, code) for value in self.distinct_values(survey_df['project_ids'])
+                                    for code in self.codes(value)], columns=['project_ids', 'project_id'])
+        surveys = survey_df[['survey_global_id', 'project_ids']].dropna(subset=['project_ids'])
+        surveys = surveys.assign(project_ids=surveys['project_ids'].astype(object))
+        # a left merge keeps the order of the surveys, and surveys without a project code are dropped after
+        bridge_df = surveys.merge(value_codes, how='left', on='project_ids').dropna(subset=['project_id'])
+        bridge_df['project_name'] = bridge_df['project_id'].map(self.survey_projects).fillna(bridge_df['project_id'])
+        return bridge_df[BRIDGE_COLUMNS].reset_index(drop=True)
@@ -0,0 +1,285 @@
+"""
+survey123_schema
+Registry of the columns kept from each Survey123 table, per survey version, that drives read_csv.
+"""
+
+import time
+import pandas as pd
+from .logger_settings import api_logger
+
+# kinds of columns. Columns that may hold whole numbers are left to read_csv to infer, so that they are written
+# back out to CSV the same as before, e.g., 3 rather than 3.0
+SCHEMA_STRING = 'object'
+SCHEMA_FLOAT = 'float64'
+SCHEMA_DATETIME = 'datetime'
+SCHEMA_INFER = None
+
+# edit tracking fields of every table, with the prefix of their target names
+EDIT_FIELDS = [('EditDate', '{0}_edit_datetime'), ('Editor', '{0}_editor'),
+               ('CreationDate', '{0}_create_datetime'), ('Creator', '{0}_creator')]
+
+
+def edit_columns(prefix):
+    return [(source, target.format(prefix), SCHEMA_STRING) for source, target in EDIT_FIELDS]
+
+
+# CSV parsers: pandas' C parser, or pyarrow's multithreaded CSV reader
+CSV_ENGINES = ('c', 'pyarrow')
+
+
+def arrow_string_dtype():
+    """
+    pandas dtype of Arrow backed strings, or None where pandas is older than 1.3 and only has object strings.
+    """
+    try:
+        return pd.StringDtype('pyarrow')
+    except (TypeError, ValueError, ImportError):
+        return None
+
+
+# version of the schemas read when no survey version is given, e.g., by the benchmarks
+SCHEMA_DEFAULT_VERSION = 'v14'
+# survey version to table name to (source column, target name, dtype), in output order
+SURVEY123_SCHEMAS = {
+    'v14': {
+        'survey': [
+            ('GlobalID', 'survey_global_id', SCHEMA_STRING),
+            ('Survey DateTime', 'survey_datetime', SCHEMA_DATETIME),
+            ('Affiliated Projects', 'project_ids', SCHEMA_STRING),
+            ('Supervisor', 'supervisor', SCHEMA_STRING),
+            ('username', 'username', SCHEMA_STRING),
+            ('Recorder First Name', 'recorder_first_name', SCHEMA_STRING),
+            ('Recorder Last Name', 'recorder_last_name', SCHEMA_STRING),
+            ('Site ID', 'site_id', SCHEMA_STRING),
+            ('Other Site ID', 'other_site_id', SCHEMA_STRING),
+            ('General Location Name', 'general_location_name', SCHEMA_STRING),
+            ('Latitude', 'lat_manual', SCHEMA_FLOAT),
+            ('Longitude', 'long_manual', SCHEMA_FLOAT),
+            ('gps_cap_lat', 'gps_cap_lat', SCHEMA_FLOAT),
+            ('gps_cap_long', 'gps_cap_long', SCHEMA_FLOAT),
+            ('gps_cap_alt', 'gps_cap_alt', SCHEMA_FLOAT),
+            ('gps_cap_horacc', 'gps_cap_horacc', SCHEMA_FLOAT),
+            ('gps_cap_vertacc', 'gps_cap_vertacc', SCHEMA_FLOAT),
+            ('Arrival DateTime', 'arrival_datetime', SCHEMA_STRING),
+            ('Water Turbidity', 'env_obs_turbidity', SCHEMA_STRING),
+            ('Precipitation', 'env_obs_precip', SCHEMA_STRING),
+            ('Wind Speed', 'env_obs_wind_speed', SCHEMA_STRING),
+            ('Cloud Cover', 'env_obs_cloud_cover', SCHEMA_STRING),
+            ('Biome', 'env_biome', SCHEMA_STRING),
+            ('Other Biome', 'env_biome_other', SCHEMA_STRING),
+            ('Feature', 'env_feature', SCHEMA_STRING),
+            ('Other Feature', 'env_feature_other', SCHEMA_STRING),
+            ('Material', 'env_material', SCHEMA_STRING),
+            ('Other Material', 'env_material_other', SCHEMA_STRING),
+            ('Environmental Notes', 'env_notes', SCHEMA_STRING),
+            ('Measurement Mode', 'env_measure_mode', SCHEMA_STRING),
+            ('Boat Type', 'env_boat_type', SCHEMA_STRING),
+            ('Bottom Depth', 'env_bottom_depth', SCHEMA_INFER),
+            ('Measurements Taken', 'measurements_taken', SCHEMA_STRING),
+            ('Designated Sub-Corer', 'core_subcorer', SCHEMA_STRING),
+            ('Designated Filterer', 'water_filterer', SCHEMA_STRING),
+            ('Survey Complete', 'survey_complete', SCHEMA_STRING),
+            ('QA Editor', 'qa_editor', SCHEMA_STRING),
+            ('QA DateTime', 'qa_datetime', SCHEMA_STRING),
+            ('QA Initials', 'qa_initial', SCHEMA_STRING),
+            ('x', 'x', SCHEMA_FLOAT),
+            ('y', 'y', SCHEMA_FLOAT),
+        ] + edit_columns('survey'),
+        'rep_crew': [
+            ('GlobalID', 'crew_global_id', SCHEMA_STRING),
+            ('ParentGlobalID', 'crew_ParentGlobalID', SCHEMA_STRING),
+            ('Crew First Name', 'crew_fname', SCHEMA_STRING),
+            ('Crew Last Name', 'crew_lname', SCHEMA_STRING),
+        ] + edit_columns('crew'),
+        'rep_envmeas': [
+            ('GlobalID', 'envmeas_global_id', SCHEMA_STRING),
+            ('ParentGlobalID', 'envmeas_ParentGlobalID', SCHEMA_STRING),
+            ('Measurement DateTime', 'envmeas_datetime', SCHEMA_STRING),
+            ('Measurement Depth', 'envmeas_depth', SCHEMA_INFER),
+            ('Environmental Instrument', 'envmeas_instrument', SCHEMA_STRING),
+            ('CTD Filename', 'ctd_filename', SCHEMA_STRING),
+            ('CTD Notes', 'ctd_notes', SCHEMA_STRING),
+            ('YSI Filename', 'ysi_filename', SCHEMA_STRING),
+            ('YSI Model', 'ysi_model', SCHEMA_STRING),
+            ('YSI Serial Number', 'ysi_serial_number', SCHEMA_STRING),
+            ('YSI Notes', 'ysi_notes', SCHEMA_STRING),
+            ('Secchi Depth', 'secchi_depth', SCHEMA_INFER),
+            ('Secchi Notes', 'secchi_notes', SCHEMA_STRING),
+            ('Niskin Number', 'niskin_number', SCHEMA_INFER),
+            ('Niskin Notes', 'niskin_notes', SCHEMA_STRING),
+            ('Other Instruments', 'other_instruments', SCHEMA_STRING),
+            ('Environmental Measurements', 'env_measurements', SCHEMA_STRING),
+            ('Flow Rate', 'flow_rate', SCHEMA_INFER),
+            ('Water Temp', 'water_temp', SCHEMA_INFER),
+            ('Salinity', 'salinity', SCHEMA_INFER),
+            ('pH Scale', 'ph', SCHEMA_INFER),
+            ('PAR1', 'par1', SCHEMA_INFER),
+            ('PAR2', 'par2', SCHEMA_INFER),
+            ('Turbidity', 'turbidity', SCHEMA_INFER),
+            ('Conductivity', 'conductivity', SCHEMA_INFER),
+            ('Dissolved Oxygen', 'do', SCHEMA_INFER),
+            ('Pheophytin', 'pheophytin', SCHEMA_INFER),
+            ('Chlorophyll a', 'chla', SCHEMA_INFER),
+            ('Nitrate and Nitrite', 'no3no2', SCHEMA_INFER),
+            ('Nitrite', 'no2', SCHEMA_INFER),
+            ('Ammonium', 'nh4', SCHEMA_INFER),
+            ('Phosphate', 'phosphate', SCHEMA_INFER),
+            ('Bottom Substrate', 'bottom_substrate', SCHEMA_STRING),
+            ('Lab DateTime', 'lab_date', SCHEMA_STRING),
+            ('Measurement Notes', 'envmeas_notes', SCHEMA_STRING),
+        ] + edit_columns('envmeas'),
+        'rep_collection': [
+            ('GlobalID', 'collection_global_id', SCHEMA_STRING),
+            ('ParentGlobalID', 'collection_ParentGlobalID', SCHEMA_STRING),
+            ('Collection Type', 'collection_type', SCHEMA_STRING),
+            ('Water Collection DateTime', 'water_collect_datetime', SCHEMA_STRING),
+            ('Water Vessel Label', 'water_vessel_label', SCHEMA_STRING),
+            ('Water Control', 'water_control', SCHEMA_STRING),
+            ('Water Control Type', 'water_control_type', SCHEMA_STRING),
+            ('Water Collection Mode', 'water_collect_mode', SCHEMA_STRING),
+            ('Niskin Number', 'water_niskin_number', SCHEMA_INFER),
+            ('Niskin Volume', 'water_niskin_vol', SCHEMA_INFER),
+            ('Water Depth', 'water_depth', SCHEMA_INFER),
+            ('Water Vessel Volume', 'water_vessel_vol', SCHEMA_INFER),
+            ('Water Vessel Material', 'water_vessel_material', SCHEMA_STRING),
+            ('Water Vessel Color', 'water_vessel_color', SCHEMA_STRING),
+            ('Was Filtered', 'was_filtered', SCHEMA_STRING),
+            ('Water Collection Notes', 'water_collect_notes', SCHEMA_STRING),
+            ('Core DateTime Start', 'core_datetime_start', SCHEMA_STRING),
+            ('Core DateTime End', 'core_datetime_end', SCHEMA_STRING),
+            ('Core Label', 'core_label', SCHEMA_STRING),
+            ('Core Control', 'core_control', SCHEMA_STRING),
+            ('Core Method', 'core_method', SCHEMA_STRING),
+            ('Other Core Method', 'core_method_other', SCHEMA_STRING),
+            ('Depth Core Collected', 'depth_core_collected', SCHEMA_INFER),
+            ('Length of Core', 'core_length', SCHEMA_INFER),
+            ('Corer Diameter', 'core_diameter', SCHEMA_INFER),
+            ('Core Notes', 'core_notes', SCHEMA_STRING),
+            ('Subcores Taken', 'subcores_taken', SCHEMA_STRING),
+            ('Subcore DateTime Start', 'subcore_datetime_start', SCHEMA_STRING),
+            ('Subcore DateTime End', 'subcore_datetime_end', SCHEMA_STRING),
+            ('Sub-Corer First Name', 'subcore_fname', SCHEMA_STRING),
+            ('Sub-Corer Last Name', 'subcore_lname', SCHEMA_STRING),
+            ('Subcore Protocol', 'subcore_protocol', SCHEMA_STRING),
+            ('Other Protocol', 'subcore_protocol_other', SCHEMA_STRING),
+            ('Sub-Core Method', 'subcore_method', SCHEMA_STRING),
+            ('Other Sub-Core Method', 'subcore_method_other', SCHEMA_STRING),
+            ('Min Subcore Barcode', 'min_subcore_barcode', SCHEMA_STRING),
+            ('Max Subcore Barcode', 'max_subcore_barcode', SCHEMA_STRING),
+            ('Number of Sub-Cores', 'number_subcores', SCHEMA_INFER),
+            ('Length of Sub-Core', 'subcore_length', SCHEMA_INFER),
+            ('Sub-Core Diameter', 'subcore_diameter', SCHEMA_INFER),
+            ('Sub-Core Consistency Layer', 'subcore_consistency_layer', SCHEMA_STRING),
+            ('Purpose of Other Cores', 'purpose_other_cores', SCHEMA_STRING),
+        ] + edit_columns('collection'),
+        'rep_filter': [
+            ('GlobalID', 'filter_global_id', SCHEMA_STRING),
+            ('ParentGlobalID', 'filter_ParentGlobalID', SCHEMA_STRING),
+            ('Is Prefilter', 'is_prefilter', SCHEMA_STRING),
+            ('Filter Location', 'filter_location', SCHEMA_STRING),
+            ('Filter Sample Label', 'filter_label', SCHEMA_STRING),
+            ('Filterer First Name', 'filter_fname', SCHEMA_STRING),
+            ('Filterer Last Name', 'filter_lname', SCHEMA_STRING),
+            ('Filter Barcode', 'filter_barcode', SCHEMA_STRING),
+            ('Filter DateTime', 'filter_datetime', SCHEMA_DATETIME),
+            ('Filter Protocol', 'filter_protocol', SCHEMA_STRING),
+            ('Other Protocol', 'filter_protocol_other', SCHEMA_STRING),
+            ('Filter Method', 'filter_method', SCHEMA_STRING),
+            ('Other Filter Method', 'filter_method_other', SCHEMA_STRING),
+            ('Water Volume Filtered', 'filter_vol', SCHEMA_INFER),
+            ('Filter Type', 'filter_type', SCHEMA_STRING),
+            ('Other Filter Type', 'filter_type_other', SCHEMA_STRING),
+            ('Filter Pore Size', 'filter_pore', SCHEMA_INFER),
+            ('Filter Size', 'filter_size', SCHEMA_INFER),
+            ('Filter Notes', 'filter_notes', SCHEMA_STRING),
+        ] + edit_columns('filter'),
+    },
+}
+
+
+class TableSchema:
+    """
+    Columns kept from one Survey123 table. Reads only those columns, with their dtypes, and renames them to
+    their target names in a single read_csv, instead of parsing and inferring every column of the export.
+    :param table_name: e.g., survey, rep_crew, rep_envmeas, rep_collection, or rep_filter
+    :param columns: list of (source column, target name, dtype), where dtype is SCHEMA_DATETIME for dates parsed
+    while reading or SCHEMA_INFER to let read_csv infer it.
+    """
+    def __init__(self, table_name, columns):
+        self.table_name = table_name
+        self.columns = columns
+        self.usecols = [source for source, target, dtype in columns]
+        self.dtype = {source: dtype for source, target, dtype in columns
+                      if dtype not in (SCHEMA_DATETIME, SCHEMA_INFER)}
+        self.parse_dates = [source for source, target, dtype in columns if dtype == SCHEMA_DATETIME]
+        self.rename = {source: target for source, target, dtype in columns}
+
+    def read_csv(self, file_path_or_buffer, engine='c'):
+        """
+        :param file_path_or_buffer: Filepath of a cleaned CSV, or a file object, e.g., a CleanedCSVReader.
+        :param engine: 'c' or 'pyarrow'. Text file objects are always read with 'c'.
+        :return: DataFrame of the schema's columns, in schema order, with their target names
+        """
+        start = time.perf_counter()
+        if engine not in CSV_ENGINES:
+            raise ValueError("unknown csv engine " + str(engine))
+        if engine == 'pyarrow' and isinstance(file_path_or_buffer, str):
+            table_df = self.read_csv_arrow(file_path_or_buffer)
+        else:
+            engine = 'c'
+            table_df = pd.read_csv(file_path_or_buffer, index_col=False, usecols=self.usecols, dtype=self.dtype,
+                                   parse_dates=self.parse_dates)
+        # usecols keeps the order of the file, which only needs reordering if the survey's questions were moved
+        if list(table_df.columns) != self.usecols:
+            table_df = table_df[self.usecols]
+        table_df.columns = [self.rename[source] for source in table_df.columns]
+        api_logger.info("read_table: {0} {1} rows, {2} columns with {3} in {4:.2f}s".format(
+            self.table_name, len(table_df), len(self.usecols), engine, time.perf_counter() - start))
+        return table_df
+
+    def read_csv_arrow(self, file_path):
+        """
+        Parse with pyarrow's CSV reader on every core. Text columns become Arrow backed strings, which are kept
+        through merges, where pandas supports them, and object strings otherwise.
+        """
+        import pyarrow as pa
+        from pyarrow import csv
+        column_types = {}
+        for source, target, dtype in self.columns:
+            if dtype == SCHEMA_FLOAT:
+                column_types[source] = pa.float64()
+            elif dtype in (SCHEMA_STRING, SCHEMA_DATETIME):
+                # Survey123 dates, e.g., 6/1/2021 2:30:00 PM, are not ISO 8601 so are parsed by pandas below
+                column_types[source] = pa.string()
+        # blanks are nulls, as with the C parser
+        convert_options = csv.ConvertOptions(include_columns=self.usecols, column_types=column_types,
+                                             strings_can_be_null=True)
+        table = csv.read_csv(file_path, read_options=csv.ReadOptions(use_threads=True),
+                             convert_options=convert_options)
+        string_dtype = arrow_string_dtype()
+        types_mapper = {pa.string(): string_dtype}.get if string_dtype is not None else None
+        table_df = table.to_pandas(types_mapper=types_mapper)
+        for source in self.parse_dates:
+            try:
+                table_df[source] = pd.to_datetime(table_df[source])
+            except (ValueError, TypeError):
+                # as with parse_dates, dates that cannot be parsed are left as text
+                pass
+        return table_df
+
+
+def get_table_schema(table_name, survey123_version=SCHEMA_DEFAULT_VERSION, fallback_version=None):
+    """
+    Schema of table_name for survey123_version. A version that is not registered raises ValueError, as its
+    questions may have been added or renamed, unless fallback_version is given.
+    :param fallback_version: Optional registered version to use if survey123_version is not registered.
+    """
+    if survey123_version not in SURVEY123_SCHEMAS:
+        if fallback_version is None or fallback_version not in SURVEY123_SCHEMAS:
+            raise ValueError("no schema for survey version " + str(survey123_version) + ", add it to "
+                             "SURVEY123_SCHEMAS or set schema_fallback_version to one of " +
+                             ", ".join(sorted(SURVEY123_SCHEMAS)))
+        api_logger.warning("get_table_schema: no schema for survey version " + str(survey123_version) +
+                           ", using " + fallback_version)
+        survey123_version = fallback_version
+    return TableSchema(table_name, SURVEY123_SCHEMAS[survey123_version][table_name])
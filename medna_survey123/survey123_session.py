@@ -0,0 +1,176 @@
+"""
+survey123_session
+Cache AGOL tokens on disk across runs, and open arcgis GIS logins with a cached token that is refreshed before
+it expires.
+"""
+
+import os
+import json
+import time
+import threading
+import requests
+from requests.adapters import HTTPAdapter
+from arcgis.gis import GIS, Item
+from .logger_settings import api_logger
+
+# ArcGIS Online portal used to generate tokens
+AGOL_PORTAL_URL = "https://www.arcgis.com"
+# tokens are generated for a referer and are only accepted from requests that send it. The arcgis python API
+# sends "http" unless GIS is given another referer, so AGOLSession passes this value to GIS and sends it on its
+# own requests as well.
+AGOL_TOKEN_REFERER = "http"
+# requested token lifetime, in minutes
+AGOL_TOKEN_EXPIRATION = 120
+# refresh tokens that expire within this many seconds, so that a run never starts with a token about to expire
+AGOL_TOKEN_REFRESH_MARGIN = 1800
+# connections kept open per host by the pooled session
+HTTP_POOL_SIZE = 10
+
+
+class AGOLTokenCache:
+    """
+    Tokens are cached in memory and on disk with their expiry for later runs. Tokens that expire within
+    refresh_margin seconds are refreshed with a new password login before they are used. Each instance has its
+    own pooled requests.Session and hit, miss and refresh counts.
+    :param token_cache_file: Filepath of the JSON token cache. Keep this file private, it holds credentials.
+    :param portal_url: Portal that generates tokens, e.g., https://www.arcgis.com or a local stand-in.
+    :param referer: Referer the token is generated for.
+    :param expiration: Requested token lifetime in minutes.
+    :param refresh_margin: Refresh tokens that expire within this many seconds.
+    """
+    def __init__(self, token_cache_file,
+                 portal_url=AGOL_PORTAL_URL,
+                 referer=AGOL_TOKEN_REFERER,
+                 expiration=AGOL_TOKEN_EXPIRATION,
+                 refresh_margin=AGOL_TOKEN_REFRESH_MARGIN):
+        self.token_cache_file = token_cache_file
+        self.portal_url = portal_url.rstrip('/')
+        self.referer = referer
+        self.expiration = expiration
+        self.refresh_margin = refresh_margin
+        self.stats = {'hits': 0, 'misses': 0, 'refreshes': 0}
+        self.memory_cache = {}
+        self.lock = threading.Lock()
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=HTTP_POOL_SIZE, pool_maxsize=HTTP_POOL_SIZE)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+    def read_cache(self):
+        if os.path.exists(self.token_cache_file):
+            with open(self.token_cache_file, mode='r') as file_read:
+                return json.load(file_read)
+        return {}
+
+    def write_cache(self, cache):
+        tmp_file = self.token_cache_file + '.tmp'
+        with open(tmp_file, mode='w') as file_write:
+            json.dump(cache, file_write, indent=2, sort_keys=True)
+        # only the owner can read cached tokens
+        os.chmod(tmp_file, 0o600)
+        os.replace(tmp_file, self.token_cache_file)
+
+    def is_fresh(self, entry):
+        return entry is not None and entry['expires'] / 1000.0 - self.refresh_margin > time.time()
+
+    def get_token(self, username, password):
+        """
+        Cached token for username, or a new token if there is none or it expires within refresh_margin.
+        """
+        key = self.portal_url + '|' + username
+        with self.lock:
+            entry = self.memory_cache.get(key)
+            if not self.is_fresh(entry):
+                entry = self.read_cache().get(key)
+            if self.is_fresh(entry):
+                self.stats['hits'] += 1
+                self.memory_cache[key] = entry
+                return entry['token']
+            if entry is None:
+                self.stats['misses'] += 1
+            else:
+                self.stats['refreshes'] += 1
+        entry = self.generate_token(username, password)
+        with self.lock:
+            self.memory_cache[key] = entry
+            cache = self.read_cache()
+            cache[key] = entry
+            self.write_cache(cache)
+        return entry['token']
+
+    def generate_token(self, username, password):
+        """
+        Password login to the portal's generateToken endpoint.
+        :return: python dictionary of token and expires in epoch milliseconds
+        """
+        api_logger.info("generate_token: logging in to " + self.portal_url + " as " + username)
+        response = self.session.post(self.portal_url + '/sharing/rest/generateToken',
+                                     data={'username': username,
+                                           'password': password,
+                                           'client': 'referer',
+                                           'referer': self.referer,
+                                           'expiration': self.expiration,
+                                           'f': 'json'})
+        response.raise_for_status()
+        result = response.json()
+        if 'token' not in result:
+            raise RuntimeError("generateToken failed: " + str(result.get('error', result)))
+        return {'token': result['token'], 'expires': int(result['expires'])}
+
+
+class AGOLSession:
+    """
+    Logs in to ArcGIS Online with a token of the token cache. A GIS cannot refresh a token it was given, so gis
+    gets the token from the cache each time and opens a new GIS once the cache has refreshed it. A long run can
+    then outlive any one token. get and post send requests with the token and referer over the pooled session
+    of the token cache, so an AGOLSession can be passed as the session of SegmentedDownloader and
+    FeatureServiceDeltaSync.
+    :param token_cache: AGOLTokenCache of the portal.
+    :param username: AGOL username
+    :param password: AGOL password
+    """
+    def __init__(self, token_cache, username, password):
+        self.token_cache = token_cache
+        self.username = username
+        self.password = password
+        self.lock = threading.Lock()
+        self.agol_gis = None
+        self.gis_token = None
+
+    def token(self):
+        return self.token_cache.get_token(self.username, self.password)
+
+    def gis(self):
+        """
+        arcgis GIS logged in with the cached token, reopened if the token was refreshed since the last call.
+        """
+        token = self.token()
+        with self.lock:
+            if self.agol_gis is None or token != self.gis_token:
+                self.agol_gis = GIS(self.token_cache.portal_url, token=token, referer=self.token_cache.referer)
+                self.gis_token = token
+            return self.agol_gis
+
+    def item(self, item_id):
+        """
+        :return: arcgis Item of item_id, on a GIS with a fresh token
+        """
+        return Item(self.gis(), item_id)
+
+    def item_data_url(self, item_id):
+        return self.token_cache.portal_url + '/sharing/rest/content/items/' + item_id + '/data'
+
+    def request(self, method, url, params=None, data=None, headers=None, **kwargs):
+        # tokens are generated for a referer, which must be sent with every request that uses them
+        headers = dict(headers or {}, Referer=self.token_cache.referer)
+        if isinstance(data, dict):
+            data = dict(data, token=self.token())
+        else:
+            params = dict(params or {}, token=self.token())
+        return self.token_cache.session.request(method, url, params=params, data=data, headers=headers, **kwargs)
+
+    def get(self, url, **kwargs):
+        return self.request('GET', url, **kwargs)
+
+    def post(self, url, **kwargs):
+        return self.request('POST', url, **kwargs)
@@ -0,0 +1,129 @@
+"""
+survey123_stage_graph
+Run pipeline stages as a dependency graph, with independent stages in parallel and per-stage timings.
+"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+from .logger_settings import api_logger
+
+
+class Stage:
+    """
+    :param name: Unique name of the stage.
+    :param func: Called with the value of each input, in order. Returns the value of the output, or a
+    python dictionary of output name to value if the stage has more than one output.
+    :param inputs: Names of the outputs this stage depends on.
+    :param outputs: Names of the outputs this stage produces. Defaults to the name of the stage.
+    """
+    def __init__(self, name, func, inputs=(), outputs=None):
+        self.name = name
+        self.func = func
+        self.inputs = list(inputs)
+        self.outputs = list(outputs) if outputs else [name]
+
+
+class StageGraph:
+    """
+    Graph of stages connected by their declared inputs and outputs. A stage runs as soon as every stage
+    that produces one of its inputs has finished, so stages that do not depend on each other run side by side.
+    :param max_workers: Maximum number of stages to run at the same time.
+    """
+    def __init__(self, max_workers=4):
+        self.max_workers = max_workers
+        self.stages = {}
+        self.producers = {}
+        self.timings = {}
+
+    def add_stage(self, name, func, inputs=(), outputs=None):
+        if name in self.stages:
+            raise ValueError("stage " + name + " already exists")
+        stage = Stage(name, func, inputs, outputs)
+        for output in stage.outputs:
+            if output in self.producers:
+                raise ValueError("output " + output + " is produced by " + self.producers[output])
+            self.producers[output] = name
+        self.stages[name] = stage
+        return stage
+
+    def dependencies(self, name):
+        """
+        Names of the stages that produce the inputs of stage name.
+        """
+        dependencies = set()
+        for stage_input in self.stages[name].inputs:
+            if stage_input not in self.producers:
+                raise ValueError("input " + stage_input + " of stage " + name + " is not produced by any stage")
+            dependencies.add(self.producers[stage_input])
+        return dependencies
+
+    def ancestors(self, targets):
+        """
+        Names of the stages needed to produce targets, including the targets. Targets may be stage or output names.
+        """
+        pending = [self.producers.get(target, target) for target in targets]
+        needed = set()
+        while pending:
+            name = pending.pop()
+            if name not in self.stages:
+                raise ValueError("unknown stage or output " + name)
+            if name in needed:
+                continue
+            needed.add(name)
+            pending.extend(self.dependencies(name))
+        return needed
+
+    def run(self, targets=None):
+        """
+        Run targets and their ancestors, or every stage if targets is None.
+        :return: python dictionary of output name to value
+        """
+        try:
+            api_logger.info("[START] run_stage_graph")
+            needed = self.ancestors(targets) if targets else set(self.stages)
+            remaining = {name: self.dependencies(name) for name in needed}
+            values = {}
+            running = {}
+            self.timings = {}
+            graph_start = time.perf_counter()
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                while remaining or running:
+                    ready = [name for name, dependencies in remaining.items() if not dependencies]
+                    if not ready and not running:
+                        raise RuntimeError("stages " + str(sorted(remaining)) + " have circular dependencies")
+                    for name in ready:
+                        del remaining[name]
+                        stage = self.stages[name]
+                        args = [values[stage_input] for stage_input in stage.inputs]
+                        api_logger.info("run_stage_graph: starting " + name)
+                        running[executor.submit(self._run_stage, stage, args)] = name
+                    done, _ = wait(running, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        name = running.pop(future)
+                        stage = self.stages[name]
+                        # an exception here leaves the executor to finish the stages already running
+                        result, seconds = future.result()
+                        self.timings[name] = seconds
+                        api_logger.info("run_stage_graph: finished {0} in {1:.2f}s".format(name, seconds))
+                        if len(stage.outputs) == 1:
+                            values[stage.outputs[0]] = result
+                        else:
+                            for output in stage.outputs:
+                                values[output] = result[output]
+                        for dependencies in remaining.values():
+                            dependencies.discard(name)
+            graph_seconds = time.perf_counter() - graph_start
+            for name, seconds in sorted(self.timings.items(), key=lambda timing: -timing[1]):
+                api_logger.info("run_stage_graph: timing {0:.2f}s {1}".format(seconds, name))
+            api_logger.info("run_stage_graph: {0} stages, wall {1:.2f}s, sum of stages {2:.2f}s".format(
+                len(self.timings), graph_seconds, sum(self.timings.values())))
+            api_logger.info("[END] run_stage_graph")
+            return values
+        except Exception as err:
+            raise RuntimeError("** Error: run_stage_graph Failed (" + str(err) + ")")
+
+    @staticmethod
+    def _run_stage(stage, args):
+        start = time.perf_counter()
+        result = stage.func(*args)
+        return result, time.perf_counter() - start
@@ -0,0 +1,181 @@
+"""
+survey123_sync
+Sync a folder to backup folders, copying only files that differ, to every target at the same time.
+"""
+
+import os
+import time
+import hashlib
+import threading
+from shutil import copy2
+from concurrent.futures import ThreadPoolExecutor
+from .logger_settings import api_logger
+
+# read size when hashing files, in bytes
+SYNC_HASH_CHUNK_SIZE = 1024 * 1024
+# number of files copied at the same time, across every target
+SYNC_WORKERS = 8
+
+
+def file_sha256(file_path, chunk_size=SYNC_HASH_CHUNK_SIZE):
+    sha256 = hashlib.sha256()
+    with open(file_path, mode='rb') as file_read:
+        for chunk in iter(lambda: file_read.read(chunk_size), b''):
+            sha256.update(chunk)
+    return sha256.hexdigest()
+
+
+def dir_hardlinks(root_dir):
+    """
+    Files below root_dir that have more than one hardlink.
+    :return: python dictionary of path relative to root_dir to (device, inode)
+    """
+    hardlinks = {}
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            file_stat = os.stat(file_path)
+            if file_stat.st_nlink > 1:
+                hardlinks[os.path.relpath(file_path, root_dir)] = (file_stat.st_dev, file_stat.st_ino)
+    return hardlinks
+
+
+def dir_manifest(root_dir):
+    """
+    Size and modified time of every file below root_dir.
+    :return: python dictionary of path relative to root_dir to (size, mtime in whole seconds)
+    """
+    manifest = {}
+    if not os.path.isdir(root_dir):
+        return manifest
+    for dir_path, dir_names, file_names in os.walk(root_dir):
+        for file_name in file_names:
+            file_path = os.path.join(dir_path, file_name)
+            if file_name.endswith('.synctmp'):
+                continue
+            file_stat = os.stat(file_path)
+            manifest[os.path.relpath(file_path, root_dir)] = (file_stat.st_size, int(file_stat.st_mtime))
+    return manifest
+
+
+class DirectorySync:
+    """
+    rsync style one way sync of source_dir to each of target_dirs. A file is skipped when the target has it
+    with the same size and modified time. When only the modified times differ, both files are hashed and the
+    file is skipped if the hashes match. Files are copied to a temp file within the target and renamed into place,
+    so an interrupted sync never leaves a partial file behind. Files removed from source_dir are kept in the targets.
+    Names that are hardlinks to the same file in source_dir, e.g., from an AttachmentStore, are copied once per
+    target and hardlinked there.
+    :param source_dir: Folder to copy from.
+    :param target_dirs: Folders to copy to. Missing folders are created.
+    :param max_workers: Number of files copied at the same time, across every target.
+    :param compare_hash: If false, files with the same size but different modified times are copied without hashing.
+    :param preserve_hardlinks: If false, every hardlinked name is copied as a separate file.
+    """
+    def __init__(self, source_dir, target_dirs,
+                 max_workers=SYNC_WORKERS,
+                 compare_hash=True,
+                 preserve_hardlinks=True):
+        self.source_dir = source_dir
+        self.target_dirs = list(target_dirs)
+        self.max_workers = max_workers
+        self.compare_hash = compare_hash
+        self.preserve_hardlinks = preserve_hardlinks
+        self.stats = {}
+        self._lock = threading.Lock()
+        self._source_digests = {}
+
+    def sync(self):
+        """
+        :return: python dictionary of target dir to files and bytes copied and skipped
+        """
+        try:
+            api_logger.info("[START] sync_dirs")
+            start = time.perf_counter()
+            source_manifest = dir_manifest(self.source_dir)
+            source_hardlinks = dir_hardlinks(self.source_dir) if self.preserve_hardlinks else {}
+            tasks = []
+            for target_dir in self.target_dirs:
+                self.stats[target_dir] = {'files_copied': 0, 'bytes_copied': 0, 'files_skipped': 0, 'bytes_skipped': 0,
+                                          'files_linked': 0, 'bytes_linked': 0}
+                target_manifest = dir_manifest(target_dir)
+                # names to copy, grouped so that hardlinks to the same source file are copied once
+                groups = {}
+                for rel_path, source_entry in source_manifest.items():
+                    target_entry = target_manifest.get(rel_path)
+                    if target_entry == source_entry:
+                        self.record(target_dir, 'skipped', source_entry[0])
+                    else:
+                        groups.setdefault(source_hardlinks.get(rel_path, rel_path), []).append(rel_path)
+                for rel_paths in groups.values():
+                    tasks.append((rel_paths, source_manifest, target_dir, target_manifest))
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                for _ in executor.map(lambda task: self.sync_group(*task), tasks):
+                    pass
+            for target_dir, target_stats in self.stats.items():
+                api_logger.info("sync_dirs: [{0}] copied {1} files, {2:.1f} MB, skipped {3} files, {4:.1f} MB, "
+                                "hardlinked {5} files, {6:.1f} MB".format(
+                                    target_dir, target_stats['files_copied'], target_stats['bytes_copied'] / 1048576.0,
+                                    target_stats['files_skipped'], target_stats['bytes_skipped'] / 1048576.0,
+                                    target_stats['files_linked'], target_stats['bytes_linked'] / 1048576.0))
+            api_logger.info("sync_dirs: {0} targets in {1:.2f}s".format(len(self.target_dirs), time.perf_counter() - start))
+            api_logger.info("[END] sync_dirs")
+            return self.stats
+        except Exception as err:
+            raise RuntimeError("** Error: sync_dirs Failed (" + str(err) + ")")
+
+    def record(self, target_dir, action, size):
+        with self._lock:
+            self.stats[target_dir]['files_' + action] += 1
+            self.stats[target_dir]['bytes_' + action] += size
+
+    def source_digest(self, rel_path):
+        # each source file is hashed at most once, however many targets compare against it
+        with self._lock:
+            digest = self._source_digests.get(rel_path)
+        if digest is None:
+            digest = file_sha256(os.path.join(self.source_dir, rel_path))
+            with self._lock:
+                self._source_digests[rel_path] = digest
+        return digest
+
+    def sync_group(self, rel_paths, source_manifest, target_dir, target_manifest):
+        """
+        Sync the first of rel_paths, then hardlink the rest to it within target_dir.
+        """
+        first_path = rel_paths[0]
+        self.sync_file(first_path, source_manifest[first_path], target_dir, target_manifest.get(first_path))
+        first_target_path = os.path.join(target_dir, first_path)
+        for rel_path in rel_paths[1:]:
+            target_path = os.path.join(target_dir, rel_path)
+            os.makedirs(os.path.dirname(target_path), exist_ok=True)
+            tmp_path = target_path + '.' + str(threading.get_ident()) + '.synctmp'
+            try:
+                os.link(first_target_path, tmp_path)
+                os.replace(tmp_path, target_path)
+                self.record(target_dir, 'linked', source_manifest[rel_path][0])
+            except OSError:
+                # the target does not support hardlinks
+                self.sync_file(rel_path, source_manifest[rel_path], target_dir, target_manifest.get(rel_path))
+            finally:
+                if os.path.exists(tmp_path):
+                    os.remove(tmp_path)
+
+    def sync_file(self, rel_path, source_entry, target_dir, target_entry):
+        source_path = os.path.join(self.source_dir, rel_path)
+        target_path = os.path.join(target_dir, rel_path)
+        if self.compare_hash and target_entry is not None and target_entry[0] == source_entry[0]:
+            if file_sha256(target_path) == self.source_digest(rel_path):
+                # same contents, so match the modified time and skip the copy on later syncs without hashing
+                os.utime(target_path, (os.stat(target_path).st_atime, os.stat(source_path).st_mtime))
+                self.record(target_dir, 'skipped', source_entry[0])
+                return
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        tmp_path = target_path + '.' + str(threading.get_ident()) + '.synctmp'
+        try:
+            copy2(source_path, tmp_path)
+            os.replace(tmp_path, target_path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        self.record(target_dir, 'copied', source_entry[0])
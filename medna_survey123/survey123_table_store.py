@@ -0,0 +1,81 @@
+"""
+survey123_table_store
+Columnar store of the subset and joined tables, as Parquet or Feather, for fast typed reloads.
+"""
+
+import os
+import time
+import pandas as pd
+from .logger_settings import api_logger
+
+# file extension and compression of each store format. Both are read by pyarrow and by the R arrow package.
+TABLE_STORE_EXTENSIONS = {'parquet': '.parquet', 'feather': '.feather'}
+TABLE_STORE_COMPRESSION = {'parquet': 'snappy', 'feather': 'lz4'}
+
+
+def arrow_safe(table_df):
+    """
+    Object columns that mix strings with numbers, e.g., a barcode column with some numeric barcodes, cannot be
+    written as one Arrow type, so they are written as strings. Blanks stay null.
+    """
+    table_df = table_df.copy()
+    for column in table_df.columns[table_df.dtypes == object]:
+        values = table_df[column]
+        table_df[column] = values.where(values.isna(), values.astype(str))
+    return table_df
+
+
+class TableStore:
+    """
+    Write each table to store_dir as Parquet or Feather, with typed columns and compression, so the table can be
+    reloaded without parsing a CSV. Each write goes to a temp file that replaces the table, so readers never see
+    a partial table.
+    :param store_dir: Folder of the tables, e.g., main_output_dir.
+    :param fmt: 'parquet' or 'feather'
+    """
+    def __init__(self, store_dir, fmt='parquet'):
+        if fmt not in TABLE_STORE_EXTENSIONS:
+            raise ValueError("unknown table store format " + str(fmt))
+        self.store_dir = store_dir
+        self.fmt = fmt
+
+    def table_path(self, table_name):
+        return os.path.join(self.store_dir, table_name + TABLE_STORE_EXTENSIONS[self.fmt])
+
+    def exists(self, table_name):
+        return os.path.exists(self.table_path(table_name))
+
+    def write(self, table_name, table_df):
+        """
+        :param table_name: Filename of the table without extension, e.g., survey_crew_join.
+        """
+        import pyarrow
+        start = time.perf_counter()
+        table_path = self.table_path(table_name)
+        tmp_path = table_path + '.tmp'
+        # the index is the row number, as written to the CSVs
+        table_df = table_df.reset_index(drop=True)
+        try:
+            self.write_file(table_df, tmp_path)
+        except (pyarrow.ArrowTypeError, pyarrow.ArrowInvalid):
+            self.write_file(arrow_safe(table_df), tmp_path)
+        os.replace(tmp_path, table_path)
+        api_logger.info("table_store: {0} {1} rows, {2:.1f} MB in {3:.2f}s".format(
+            os.path.basename(table_path), len(table_df), os.path.getsize(table_path) / 1048576.0,
+            time.perf_counter() - start))
+
+    def write_file(self, table_df, file_path):
+        if self.fmt == 'parquet':
+            table_df.to_parquet(file_path, engine='pyarrow', index=False, compression=TABLE_STORE_COMPRESSION['parquet'])
+        else:
+            table_df.to_feather(file_path, compression=TABLE_STORE_COMPRESSION['feather'])
+
+    def read(self, table_name, columns=None):
+        """
+        :param columns: Optional list of columns to read. Only these columns are read from disk.
+        :return: DataFrame with the dtypes it was written with
+        """
+        table_path = self.table_path(table_name)
+        if self.fmt == 'parquet':
+            return pd.read_parquet(table_path, engine='pyarrow', columns=columns)
+        return pd.read_feather(table_path, columns=columns)
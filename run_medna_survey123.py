@@ -7,6 +7,8 @@ from tkinter import *
 #formats = ['File Geodatabase']
 formats = ['CSV']
 
-run_download_upload(formats, download=True, upload=True, overwrite=True,
-                    extract_attachments=True, join_tables=True,
-                    backup=True, attachments_backup=True)
+# guard is required for the process pools used by parallel options on Windows
+if __name__ == '__main__':
+    run_download_upload(formats, download=True, upload=True, overwrite=True,
+                        extract_attachments=True, join_tables=True,
+                        backup=True, attachments_backup=True, parallel_clean=False)
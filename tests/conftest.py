@@ -0,0 +1,29 @@
+"""
+conftest
+Import medna_survey123 from the repository. When medna_survey123/settings.py has not been created, the settings
+template in requirements/ is used, with logs written to a temp dir.
+"""
+
+import os
+import sys
+import tempfile
+import importlib.util
+from importlib.machinery import SourceFileLoader
+
+ROOT_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+sys.path.insert(0, ROOT_DIR)
+
+
+def load_settings_template():
+    if os.path.exists(os.path.join(ROOT_DIR, 'medna_survey123', 'settings.py')):
+        return
+    import medna_survey123
+    loader = SourceFileLoader('medna_survey123.settings', os.path.join(ROOT_DIR, 'requirements', 'settings.py.txt'))
+    settings = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(settings)
+    settings.LOG_FILE_DIR = tempfile.mkdtemp(prefix='medna_logs_') + '/'
+    sys.modules[loader.name] = settings
+    medna_survey123.settings = settings
+
+
+load_settings_template()
@@ -0,0 +1,70 @@
+"""
+fgdb_fixtures
+Build small file geodatabases with an attachment table like rep_img__ATTACH of the survey export, with arcpy or
+with GDAL's OpenFileGDB driver, so the readers of survey123_fgdb_backend can be tested without an AGOL export.
+"""
+
+import os
+import pytest
+
+ATTACH_TABLE = 'rep_img__ATTACH'
+ATTACH_FIELDS = ['ATTACHMENTID', 'REL_GLOBALID', 'CONTENT_TYPE', 'ATT_NAME', 'DATA_SIZE', 'DATA']
+# REL_GLOBALID, CONTENT_TYPE, ATT_NAME and DATA of each attachment. ATTACHMENTID is assigned from 1 in this order.
+# Names repeat across survey rows, as they do in the exports.
+ATTACH_ROWS = [('{6A8C2B1E-0D3F-4C5B-9A7E-1F2D3C4B5A60}', 'image/jpeg', 'photo1.jpg', b'\xff\xd8\xff\xe0 one'),
+               ('{6A8C2B1E-0D3F-4C5B-9A7E-1F2D3C4B5A60}', 'image/jpeg', 'photo2.jpg', b'\xff\xd8\xff\xe0 two' * 64),
+               ('{0B1C2D3E-4F50-6172-8394-A5B6C7D8E9F0}', 'image/jpeg', 'photo1.jpg', b'\xff\xd8\xff\xe0 three'),
+               ('{0B1C2D3E-4F50-6172-8394-A5B6C7D8E9F0}', 'image/png', u'écume.png', b'\x89PNG\r\n\x1a\n')]
+
+
+def build_gdal_fgdb(gdb_path, rows=ATTACH_ROWS):
+    """
+    Write rows to a new file geodatabase with GDAL, which can write them from GDAL 3.6.
+    :return: filepath of the attachment table
+    """
+    gdal = pytest.importorskip('osgeo.gdal')
+    from osgeo import ogr
+    ogr.UseExceptions()
+    driver = ogr.GetDriverByName('OpenFileGDB')
+    if driver is None or driver.GetMetadataItem(gdal.DCAP_CREATE) != 'YES':
+        pytest.skip('GDAL ' + gdal.__version__ + ' cannot write file geodatabases')
+    data_source = driver.CreateDataSource(gdb_path)
+    layer = data_source.CreateLayer(ATTACH_TABLE, geom_type=ogr.wkbNone, options=['FID=ATTACHMENTID'])
+    for field_name, field_type in [('REL_GLOBALID', ogr.OFTString), ('CONTENT_TYPE', ogr.OFTString),
+                                   ('ATT_NAME', ogr.OFTString), ('DATA_SIZE', ogr.OFTInteger),
+                                   ('DATA', ogr.OFTBinary)]:
+        layer.CreateField(ogr.FieldDefn(field_name, field_type))
+    layer_defn = layer.GetLayerDefn()
+    for rel_globalid, content_type, att_name, data in rows:
+        feature = ogr.Feature(layer_defn)
+        feature.SetField('REL_GLOBALID', rel_globalid)
+        feature.SetField('CONTENT_TYPE', content_type)
+        feature.SetField('ATT_NAME', att_name)
+        feature.SetField('DATA_SIZE', len(data))
+        feature.SetFieldBinaryFromHexString(layer_defn.GetFieldIndex('DATA'), data.hex())
+        layer.CreateFeature(feature)
+    # close the geodatabase so that every row is written
+    layer = None
+    data_source = None
+    return os.path.join(gdb_path, ATTACH_TABLE)
+
+
+def build_arcpy_fgdb(gdb_path, rows=ATTACH_ROWS):
+    """
+    Write rows with arcpy to the attachment table of a new table with attachments enabled, as Survey123 does.
+    :return: filepath of the attachment table
+    """
+    arcpy = pytest.importorskip('arcpy')
+    folder, gdb_name = os.path.split(gdb_path)
+    arcpy.management.CreateFileGDB(folder, gdb_name)
+    table_path = os.path.join(gdb_path, ATTACH_TABLE.replace('__ATTACH', ''))
+    arcpy.management.CreateTable(gdb_path, os.path.basename(table_path))
+    arcpy.management.AddGlobalIDs(table_path)
+    arcpy.management.EnableAttachments(table_path)
+    with arcpy.da.InsertCursor(table_path + '__ATTACH', ATTACH_FIELDS[1:]) as cursor:
+        for rel_globalid, content_type, att_name, data in rows:
+            cursor.insertRow((rel_globalid, content_type, att_name, len(data), data))
+    return table_path + '__ATTACH'
+
+
+FGDB_BUILDERS = {'arcpy': build_arcpy_fgdb, 'gdal': build_gdal_fgdb}
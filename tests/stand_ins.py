@@ -0,0 +1,182 @@
+"""
+stand_ins
+Local HTTP stand-ins for the ArcGIS Online endpoints used by medna_survey123, served from a thread.
+"""
+
+import re
+import json
+import time
+import random
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlparse, parse_qs
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """
+    Parse the query string and form body of each request into self.params and record each request on the
+    server, then call self.route(path).
+    """
+    def log_message(self, *args):
+        pass
+
+    def handle_request(self):
+        parsed = urlparse(self.path)
+        params = {key: values[-1] for key, values in parse_qs(parsed.query).items()}
+        length = int(self.headers.get('Content-Length') or 0)
+        if length:
+            params.update({key: values[-1] for key, values in
+                           parse_qs(self.rfile.read(length).decode()).items()})
+        self.params = params
+        self.server.requests.append((self.command, parsed.path, params))
+        self.route(parsed.path)
+
+    do_GET = handle_request
+    do_POST = handle_request
+
+    def send_json(self, result, status=200):
+        body = json.dumps(result).encode()
+        self.send_response(status)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def route(self, path):
+        raise NotImplementedError
+
+
+class FeatureServiceHandler(StandInHandler):
+    """
+    /FeatureServer/<layer id>/query with EditDate >= TIMESTAMP '...' where clauses, orderByFields and resultOffset
+    paging.
+    server.layers maps layer id to (fields, list of feature dicts).
+    """
+    def route(self, path):
+        match = re.match(r'^/FeatureServer/(\d+)/query$', path)
+        if not match:
+            return self.send_json({'error': {'code': 400, 'message': 'unknown path ' + path}})
+        fields, features = self.server.layers[int(match.group(1))]
+        since = re.search(r"EditDate >= TIMESTAMP '([^']+)'", self.params['where'])
+        if since:
+            since_ms = datetime.strptime(since.group(1), '%Y-%m-%d %H:%M:%S').replace(
+                tzinfo=timezone.utc).timestamp() * 1000
+            features = [feature for feature in features if feature['attributes']['EditDate'] >= since_ms]
+        # like a database without a unique sort key, rows that tie on orderByFields come back in any order
+        order_by = [field.split()[0] for field in self.params.get('orderByFields', 'EditDate').split(',')]
+        features = list(features)
+        random.Random(int(self.params.get('resultOffset', 0))).shuffle(features)
+        features = sorted(features, key=lambda feature: [feature['attributes'][field] for field in order_by])
+        offset = int(self.params.get('resultOffset', 0))
+        count = int(self.params.get('resultRecordCount', len(features)))
+        page = features[offset:offset + count]
+        self.send_json({'fields': fields, 'features': page,
+                        'exceededTransferLimit': offset + count < len(features)})
+
+
+class PortalHandler(StandInHandler):
+    """
+    /sharing/rest endpoints of a portal that the arcgis python API calls: generateToken, portal and user
+    properties, item properties, export, export status, delete, and item data. Tokens are valid for
+    server.token_seconds and only for the referer they were generated for.
+    server.items maps item id to item properties, server.statuses lists the statuses an export job reports
+    before completed, and server.export_data is the data of every export item.
+    """
+    def send_bytes(self, body):
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/octet-stream')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def token_error(self):
+        token = self.params.get('token')
+        entry = self.server.tokens.get(token)
+        if entry is None or entry[0] < time.time() * 1000:
+            return 'Invalid token.'
+        if self.headers.get('Referer') != entry[1]:
+            return 'Invalid referer.'
+        return None
+
+    def route(self, path):
+        if path == '/sharing/rest/generateToken':
+            token = 'token' + str(len(self.server.tokens) + 1)
+            expires = int((time.time() + self.server.token_seconds) * 1000)
+            self.server.tokens[token] = (expires, self.params['referer'])
+            return self.send_json({'token': token, 'expires': expires, 'ssl': False})
+        error = self.token_error()
+        if error:
+            return self.send_json({'error': {'code': 498, 'message': error}})
+        if path == '/sharing/rest/portals/self':
+            return self.send_json({'id': 'portal1', 'isPortal': False, 'user': {'username': 'medna'}})
+        if path == '/sharing/rest/community/self':
+            return self.send_json({'username': 'medna'})
+        match = re.match(r'^/sharing/rest/content/items/(\w+)(/data)?$', path)
+        if match and match.group(2):
+            return self.send_bytes(self.server.export_data)
+        if match and match.group(1) in self.server.items:
+            return self.send_json(self.server.items[match.group(1)])
+        if re.match(r'^/sharing/rest/content/users/(\w+)/export$', path):
+            return self.send_json({'jobId': 'job1', 'exportItemId': 'export1', 'type': self.params['exportFormat']})
+        match = re.match(r'^/sharing/rest/content/users/(\w+)/items/(\w+)/(status|delete)$', path)
+        if match and match.group(3) == 'status':
+            status = self.server.statuses.pop(0) if self.server.statuses else 'completed'
+            return self.send_json({'status': status, 'statusMessage': status, 'itemId': match.group(2)})
+        if match and match.group(3) == 'delete':
+            self.server.deleted.append(match.group(2))
+            return self.send_json({'success': True, 'itemId': match.group(2)})
+        return self.send_json({'error': {'code': 400, 'message': 'unknown path ' + path}})
+
+
+class RangeHandler(StandInHandler):
+    """
+    Serve server.data with an ETag and support for Range and If-Range requests, and record the start of each
+    segment in server.ranges. The first server.drops segment requests send half of their bytes and then drop the
+    connection.
+    """
+    def route(self, path):
+        data = self.server.data
+        match = re.match(r'^bytes=(\d+)-(\d+)$', self.headers.get('Range', ''))
+        if_range = self.headers.get('If-Range')
+        if not match or (if_range is not None and if_range != self.server.etag):
+            return self.send_body(200, data)
+        start, end = int(match.group(1)), min(int(match.group(2)), len(data) - 1)
+        drop = False
+        if start != end:
+            self.server.ranges.append(start)
+            with self.server.lock:
+                drop = self.server.drops > 0
+                self.server.drops -= drop
+        self.send_body(206, data[start:end + 1], 'bytes {0}-{1}/{2}'.format(start, end, len(data)), drop)
+
+    def send_body(self, status, body, content_range=None, drop=False):
+        self.send_response(status)
+        self.send_header('Content-Length', str(len(body)))
+        self.send_header('ETag', self.server.etag)
+        if content_range:
+            self.send_header('Content-Range', content_range)
+        self.end_headers()
+        self.wfile.write(body[:len(body) // 2] if drop else body)
+        self.close_connection = True
+
+
+@contextmanager
+def serve(handler_class, **state):
+    """
+    Serve handler_class on a free localhost port. Keyword arguments are set as attributes of the server.
+    :return: base url of the server, and the server
+    """
+    server = ThreadingHTTPServer(('127.0.0.1', 0), handler_class)
+    server.requests = []
+    server.lock = threading.Lock()
+    for name, value in state.items():
+        setattr(server, name, value)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    try:
+        yield 'http://127.0.0.1:{0}'.format(server.server_address[1]), server
+    finally:
+        server.shutdown()
+        server.server_close()
@@ -0,0 +1,59 @@
+import time
+import hashlib
+import threading
+from medna_survey123.survey123_attachment_writer import AttachmentWriter
+
+
+def test_duplicate_names_keep_the_last_row(tmp_path):
+    # 20 attachment ids share 5 names, as ATT_NAME is not unique across survey rows
+    rows = [(('photo {0}'.format(attachment_id)).encode(), 'photo{0}.jpg'.format(attachment_id % 5), attachment_id)
+            for attachment_id in range(20)]
+    for _ in range(10):
+        attachment_writer = AttachmentWriter(str(tmp_path), max_workers=4, queue_depth=4, hash_blobs=True)
+        assert attachment_writer.write_rows(iter(rows)) == 20
+        for name_index in range(5):
+            assert (tmp_path / 'photo{0}.jpg'.format(name_index)).read_bytes() == \
+                'photo {0}'.format(15 + name_index).encode()
+    # digests are keyed by attachment id, so none are lost to a later row with the same name
+    assert attachment_writer.digests == {attachment_id: hashlib.sha256(blob).hexdigest()
+                                         for blob, file_name, attachment_id in rows}
+
+
+def test_rows_without_ids_are_keyed_by_file_name(tmp_path):
+    attachment_writer = AttachmentWriter(str(tmp_path), max_workers=2, hash_blobs=True)
+    attachment_writer.write_rows([(memoryview(b'a'), 'a.jpg'), (b'b', 'b.jpg')])
+    assert sorted(attachment_writer.digests) == ['a.jpg', 'b.jpg']
+    assert (tmp_path / 'a.jpg').read_bytes() == b'a'
+
+
+class BlockedSink:
+    def __init__(self):
+        self.release = threading.Event()
+        self.added = []
+
+    def add(self, blob, file_name):
+        self.release.wait()
+        self.added.append(file_name)
+
+
+def test_sinks_share_the_queue_depth(tmp_path):
+    sinks = [BlockedSink(), BlockedSink()]
+    read = []
+
+    def rows():
+        for index in range(100):
+            read.append(index)
+            yield b'blob', 'photo{0}.jpg'.format(index)
+
+    attachment_writer = AttachmentWriter(str(tmp_path), max_workers=2, queue_depth=8, sinks=sinks)
+    thread = threading.Thread(target=attachment_writer.write_rows, args=(rows(),))
+    thread.start()
+    time.sleep(0.5)
+    read_while_blocked = len(read)
+    for sink in sinks:
+        sink.release.set()
+    thread.join(10)
+    # each sink queue holds 8 // (2 writers + 2 sinks) blobs, so the cursor stops well within queue_depth even
+    # with the blobs held by the blocked sinks and the one it is trying to queue
+    assert read_while_blocked <= 8
+    assert [len(sink.added) for sink in sinks] == [100, 100]
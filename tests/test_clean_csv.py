@@ -0,0 +1,53 @@
+import io
+import pandas as pd
+import pytest
+from medna_survey123.survey123_clean_csv import clean_chunk, clean_quoted_newlines, CleanedCSVReader, \
+    clean_csv_file, clean_csv_files
+
+EXPORT = ('GlobalID,Notes,Site ID\n'
+          'a1,"calm morning\nno wind",eSB_L01\n'
+          'a2,"said ""hi""\nand left",eSB_L02\n'
+          'a3,,other\n')
+CLEANED = ('GlobalID,Notes,Site ID\n'
+           'a1,"calm morning no wind",eSB_L01\n'
+           'a2,"said ""hi"" and left",eSB_L02\n'
+           'a3,,other\n')
+
+
+def test_clean_chunk_carries_quote_state():
+    chunk, in_quotes = clean_chunk('a,"open\n', False)
+    assert (chunk, in_quotes) == ('a,"open ', True)
+    chunk, in_quotes = clean_chunk('still\ninside', in_quotes)
+    assert (chunk, in_quotes) == ('still inside', True)
+    chunk, in_quotes = clean_chunk('",b\nc', in_quotes)
+    assert (chunk, in_quotes) == ('",b\nc', False)
+
+
+@pytest.mark.parametrize('chunk_size', [1, 2, 3, 7, 64, 1024])
+def test_clean_quoted_newlines_any_chunk_size(chunk_size):
+    file_write = io.StringIO()
+    chars_written = clean_quoted_newlines(io.StringIO(EXPORT), file_write, chunk_size=chunk_size)
+    assert file_write.getvalue() == CLEANED
+    assert chars_written == len(CLEANED)
+
+
+def test_cleaned_csv_reader_into_read_csv():
+    side_output = io.StringIO()
+    table_df = pd.read_csv(CleanedCSVReader(io.StringIO(EXPORT), side_output=side_output, chunk_size=5))
+    assert table_df['Notes'].tolist()[:2] == ['calm morning no wind', 'said "hi" and left']
+    assert side_output.getvalue() == CLEANED
+
+
+def test_clean_csv_files_in_order(tmp_path):
+    file_pairs = []
+    for number in range(3):
+        input_file = tmp_path / 'export_{0}.csv'.format(number)
+        input_file.write_text(EXPORT)
+        file_pairs.append((str(input_file), str(tmp_path / 'clean_{0}.csv'.format(number))))
+    results = clean_csv_files(file_pairs, max_workers=2, chunk_size=4)
+    assert [result['output_file'] for result in results] == [output_file for _, output_file in file_pairs]
+    for _, output_file in file_pairs:
+        with open(output_file) as file_read:
+            assert file_read.read() == CLEANED
+    clean_csv_file(file_pairs[0][0], str(tmp_path / 'single.csv'))
+    assert (tmp_path / 'single.csv').read_text() == CLEANED
@@ -0,0 +1,70 @@
+import json
+import pandas as pd
+from medna_survey123.survey123_delta_sync import FeatureServiceDeltaSync, format_export_date, DELTA_SYNC_ORDER_BY
+from stand_ins import FeatureServiceHandler, serve
+
+FIELDS = [{'name': 'ObjectID', 'alias': 'ObjectID', 'type': 'esriFieldTypeOID'},
+          {'name': 'GlobalID', 'alias': 'GlobalID', 'type': 'esriFieldTypeGlobalID'},
+          {'name': 'site_id', 'alias': 'Site ID', 'type': 'esriFieldTypeString'},
+          {'name': 'survey_datetime', 'alias': 'Survey DateTime', 'type': 'esriFieldTypeDate'},
+          {'name': 'EditDate', 'alias': 'EditDate', 'type': 'esriFieldTypeDate'}]
+# 6/1/2021 2:30:00 PM UTC
+SURVEY_MS = 1622557800000
+
+
+def feature(global_id, site_id, edit_ms, object_id=None):
+    if object_id is None:
+        object_id = int(global_id[1:])
+    return {'attributes': {'ObjectID': object_id, 'GlobalID': '{' + global_id.upper() + '}', 'site_id': site_id,
+                           'survey_datetime': SURVEY_MS, 'EditDate': edit_ms},
+            'geometry': {'x': -69.5, 'y': 44.1}}
+
+
+def test_format_export_date():
+    assert format_export_date(SURVEY_MS) == '6/1/2021 2:30:00 PM'
+    assert format_export_date(1609459205000) == '1/1/2021 12:00:05 AM'
+    assert pd.isna(format_export_date(float('nan')))
+
+
+def test_sync_fetches_only_edits_since_watermark(tmp_path):
+    features = [feature('a1', 'eSB_L01', 1622560000000), feature('a2', 'eSB_L02', 1622560005000),
+                feature('a3', 'eSB_L03\nnote', 1622560010000)]
+    store_file = str(tmp_path / 'eDNA_Sampling_v14_0.csv')
+    watermark_file = str(tmp_path / 'watermarks.json')
+    with serve(FeatureServiceHandler, layers={0: (FIELDS, features)}) as (url, server):
+        delta_sync = FeatureServiceDeltaSync(url + '/FeatureServer', {'survey': store_file}, watermark_file,
+                                             page_size=2)
+        assert delta_sync.sync() == {'survey': 3}
+        store_df = pd.read_csv(store_file)
+        assert store_df['GlobalID'].tolist() == ['a1', 'a2', 'a3']
+        assert store_df['Site ID'].tolist() == ['eSB_L01', 'eSB_L02', 'eSB_L03 note']
+        assert store_df['Survey DateTime'].unique().tolist() == ['6/1/2021 2:30:00 PM']
+        assert store_df[['x', 'y']].iloc[0].tolist() == [-69.5, 44.1]
+        # two pages of two
+        assert [params['resultOffset'] for _, _, params in server.requests] == ['0', '2']
+        with open(watermark_file) as file_read:
+            assert json.load(file_read) == {'survey': 1622560010000}
+
+        # edit a2 and add a4
+        features[1] = feature('a2', 'eSB_L09', 1622570000000)
+        features.append(feature('a4', 'eSB_L04', 1622570001000))
+        server.requests.clear()
+        assert delta_sync.sync() == {'survey': 3}
+        assert "EditDate >= TIMESTAMP '2021-06-01 15:06:50'" == server.requests[0][2]['where']
+        store_df = pd.read_csv(store_file)
+        assert store_df['GlobalID'].tolist() == ['a1', 'a3', 'a2', 'a4']
+        assert store_df.set_index('GlobalID').loc['a2', 'Site ID'] == 'eSB_L09'
+        with open(watermark_file) as file_read:
+            assert json.load(file_read) == {'survey': 1622570001000}
+
+
+def test_sync_pages_rows_sharing_an_edit_date(tmp_path):
+    # a batch of edits applied at once shares one EditDate, so only ObjectID keeps the pages stable
+    features = [feature('a' + str(index), 'eSB_L' + str(index), 1622560000000) for index in range(1, 8)]
+    store_file = str(tmp_path / 'eDNA_Sampling_v14_0.csv')
+    with serve(FeatureServiceHandler, layers={0: (FIELDS, features)}) as (url, server):
+        delta_sync = FeatureServiceDeltaSync(url + '/FeatureServer', {'survey': store_file},
+                                             str(tmp_path / 'watermarks.json'), page_size=2)
+        assert delta_sync.sync() == {'survey': 7}
+        assert {params['orderByFields'] for _, _, params in server.requests} == {DELTA_SYNC_ORDER_BY}
+        assert pd.read_csv(store_file)['GlobalID'].tolist() == ['a' + str(index) for index in range(1, 8)]
@@ -0,0 +1,71 @@
+import io
+import json
+import random
+from zipfile import ZipFile, ZIP_STORED
+import pytest
+from medna_survey123.survey123_download import SegmentedDownloader
+from stand_ins import RangeHandler, serve
+
+SEGMENT_SIZE = 8192
+
+
+def export_zip():
+    zip_bytes = io.BytesIO()
+    with ZipFile(zip_bytes, mode='w', compression=ZIP_STORED) as zip_file:
+        zip_file.writestr('eDNA_Sampling_v14_0.csv', random.Random(0).randbytes(5 * SEGMENT_SIZE))
+    return zip_bytes.getvalue()
+
+
+def range_server(data, drops=0):
+    return serve(RangeHandler, data=data, etag='"v1"', drops=drops, ranges=[])
+
+
+def downloader(url, tmp_path, **kwargs):
+    return SegmentedDownloader(url + '/data', str(tmp_path / 'export.zip'), segment_size=SEGMENT_SIZE,
+                               max_workers=2, retry_wait=0, **kwargs)
+
+
+def test_dropped_segments_are_retried(tmp_path):
+    data = export_zip()
+    with range_server(data, drops=3) as (url, server):
+        downloader(url, tmp_path).download()
+        # every segment, and the three dropped segments again
+        assert len(server.ranges) == len(range(0, len(data), SEGMENT_SIZE)) + 3
+    assert (tmp_path / 'export.zip').read_bytes() == data
+    assert not (tmp_path / 'export.zip.part').exists()
+    assert not (tmp_path / 'export.zip.part.json').exists()
+
+
+def test_segments_dropped_too_often_fail_and_keep_state(tmp_path):
+    with range_server(export_zip(), drops=100) as (url, server):
+        with pytest.raises(RuntimeError):
+            downloader(url, tmp_path, retries=1).download()
+    state = json.loads((tmp_path / 'export.zip.part.json').read_text())
+    assert (state['url'], state['etag']) == (url + '/data', '"v1"')
+
+
+@pytest.mark.parametrize('earlier_state, resumed', [({}, True), ({'etag': '"v0"'}, False),
+                                                   ({'url': 'http://127.0.0.1/other/data'}, False)])
+def test_resume_only_the_same_url_and_version(tmp_path, earlier_state, resumed):
+    data = export_zip()
+    with range_server(data) as (url, server):
+        # an earlier attempt that downloaded the first segment
+        state = dict({'url': url + '/data', 'etag': '"v1"', 'last_modified': None, 'size': len(data),
+                      'segment_size': SEGMENT_SIZE, 'completed': [0]}, **earlier_state)
+        (tmp_path / 'export.zip.part.json').write_text(json.dumps(state))
+        (tmp_path / 'export.zip.part').write_bytes(data[:SEGMENT_SIZE].ljust(len(data), b'\0'))
+        downloader(url, tmp_path).download()
+        assert (0 not in server.ranges) == resumed
+    assert (tmp_path / 'export.zip').read_bytes() == data
+
+
+def test_crc_mismatch_removes_part_and_state(tmp_path):
+    data = bytearray(export_zip())
+    # flip a byte within the stored member, so the size is right but the CRC is not
+    data[100] ^= 0xFF
+    with range_server(bytes(data)) as (url, server):
+        with pytest.raises(RuntimeError, match='CRC'):
+            downloader(url, tmp_path).download()
+    assert not (tmp_path / 'export.zip.part').exists()
+    assert not (tmp_path / 'export.zip.part.json').exists()
+    assert not (tmp_path / 'export.zip').exists()
@@ -0,0 +1,55 @@
+import pytest
+from medna_survey123.survey123_fgdb_backend import get_fgdb_reader, backend_available, FGDB_BACKENDS
+from fgdb_fixtures import FGDB_BUILDERS, ATTACH_ROWS
+
+FIELDS = ['ATTACHMENTID', 'REL_GLOBALID', 'ATT_NAME', 'DATA_SIZE', 'DATA']
+
+
+@pytest.fixture(params=sorted(FGDB_BUILDERS))
+def attach_table(request, tmp_path):
+    """
+    Attachment table of a file geodatabase built with each backend that can be imported.
+    """
+    return FGDB_BUILDERS[request.param](str(tmp_path / 'survey.gdb'))
+
+
+def read(backend, table_path, fields=FIELDS, where_clause=None):
+    if not backend_available(backend):
+        pytest.skip(backend + " cannot be imported")
+    # arcpy returns blobs as memoryview and GDAL as bytes
+    return [tuple(bytes(value) if isinstance(value, memoryview) else value for value in row)
+            for row in get_fgdb_reader(backend).search(table_path, fields, where_clause=where_clause)]
+
+
+def expected_rows(attachment_ids):
+    return [(attachment_id, rel_globalid, att_name, len(data), data)
+            for attachment_id, (rel_globalid, content_type, att_name, data) in enumerate(ATTACH_ROWS, start=1)
+            if attachment_id in attachment_ids]
+
+
+@pytest.mark.parametrize('backend', FGDB_BACKENDS)
+def test_reader_returns_every_attachment(attach_table, backend):
+    assert read(backend, attach_table) == expected_rows(range(1, len(ATTACH_ROWS) + 1))
+
+
+@pytest.mark.parametrize('backend', FGDB_BACKENDS)
+def test_reader_filters_on_attachment_id(attach_table, backend):
+    # the where clause of extract_attachments_incremental
+    assert read(backend, attach_table, where_clause="ATTACHMENTID IN (2,4)") == expected_rows([2, 4])
+
+
+def test_arcpy_and_gdal_read_the_same_rows(attach_table):
+    for where_clause in (None, "ATTACHMENTID IN (1,3)", "ATT_NAME = 'photo1.jpg'"):
+        assert read('arcpy', attach_table, where_clause=where_clause) == \
+            read('gdal', attach_table, where_clause=where_clause)
+
+
+def test_unknown_backend():
+    with pytest.raises(ValueError, match='unknown file geodatabase backend'):
+        get_fgdb_reader('shapefile')
+
+
+def test_auto_without_a_backend(monkeypatch):
+    monkeypatch.setattr('medna_survey123.survey123_fgdb_backend.backend_available', lambda backend: False)
+    with pytest.raises(RuntimeError, match='needs arcpy or GDAL'):
+        get_fgdb_reader('auto')
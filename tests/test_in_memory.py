@@ -0,0 +1,51 @@
+from zipfile import ZipFile
+import pytest
+
+pytest.importorskip('gspread')
+pytest.importorskip('oauth2client')
+pytest.importorskip('googleapiclient')
+pytest.importorskip('PIL')
+pytest.importorskip('arcgis')
+from medna_survey123.medna_survey123_clean import DownloadCleanJoinData  # noqa: E402
+from medna_survey123.survey123_schema import get_table_schema  # noqa: E402
+
+TABLE_FILES = {'survey': 'eDNA_Sampling_v14_0.csv', 'rep_crew': 'rep_crew_1.csv',
+               'rep_envmeas': 'rep_envmeas_2.csv', 'rep_collection': 'rep_collection_3.csv',
+               'rep_filter': 'rep_filter_4.csv'}
+
+
+def write_export(zip_file_path, table_names):
+    with ZipFile(zip_file_path, mode='w') as zip_file:
+        for table_name in table_names:
+            sources = [source for source, target, dtype in get_table_schema(table_name, 'v14').columns]
+            zip_file.writestr(TABLE_FILES[table_name], ','.join(sources) + '\n')
+
+
+def download_result(tmp_path):
+    return DownloadCleanJoinData('CSV', in_memory=True, survey123_version='v14',
+                                 main_input_dir=str(tmp_path) + '/', main_input_strip_dir=str(tmp_path) + '/',
+                                 main_output_dir=str(tmp_path) + '/',
+                                 **{argument: str(tmp_path / file_name) for argument, file_name in
+                                    zip(['survey_data', 'rep_crew', 'rep_envmeas', 'rep_collection', 'rep_filter'],
+                                        TABLE_FILES.values())})
+
+
+def test_read_zip_tables_reads_every_table(tmp_path):
+    write_export(str(tmp_path / 'export.zip'), TABLE_FILES)
+    tables = download_result(tmp_path).read_zip_tables(str(tmp_path / 'export.zip'))
+    assert sorted(tables) == sorted(TABLE_FILES)
+    assert 'survey_global_id' in tables['survey'].columns
+
+
+def test_read_zip_tables_fails_on_missing_table(tmp_path):
+    write_export(str(tmp_path / 'export.zip'), ['survey', 'rep_crew', 'rep_envmeas', 'rep_collection'])
+    # a stale cleaned CSV on disk must not be joined in place of the missing table
+    (tmp_path / 'rep_filter_4.csv').write_text('stale\n')
+    with pytest.raises(RuntimeError, match='export.zip has no rep_filter_4.csv'):
+        download_result(tmp_path).read_zip_tables(str(tmp_path / 'export.zip'))
+
+
+def test_join_data_fails_on_partial_tables(tmp_path):
+    with pytest.raises(RuntimeError, match='tables rep_filter were not provided'):
+        download_result(tmp_path).join_data({'survey': None, 'rep_crew': None, 'rep_envmeas': None,
+                                              'rep_collection': None})
@@ -0,0 +1,32 @@
+import pandas as pd
+import pytest
+
+pytest.importorskip('PIL')
+pytest.importorskip('pyarrow')
+from medna_survey123.survey123_photo_metadata import join_photo_survey, PhotoSpatialIndex  # noqa: E402
+
+
+def photo_join():
+    metadata_df = pd.DataFrame({'att_name': ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg'],
+                                'photo_lat': [44.101, 44.102, 43.5, None],
+                                'photo_long': [-69.501, -69.502, -70.2, None]})
+    attachment_index_df = pd.DataFrame({'att_name': ['a.jpg', 'b.jpg', 'c.jpg', 'd.jpg'],
+                                        'attachment_id': [1, 2, 3, 4],
+                                        'survey_global_id': ['s1', 's1', 's2', 's2'],
+                                        'collection_global_id': [None] * 4, 'filter_barcode': [None] * 4})
+    survey_sub_df = pd.DataFrame({'survey_global_id': ['{S1}', '{S2}'], 'site_id': ['eSB_L01', 'eCB_L02'],
+                                  'lat_manual': [44.1, 44.1], 'long_manual': [-69.5, -69.5]})
+    return join_photo_survey(metadata_df, attachment_index_df, survey_sub_df)
+
+
+def test_join_flags_photos_far_from_their_site():
+    assert photo_join()['far_from_site'].tolist() == [False, False, True, False]
+
+
+def test_saved_join_is_queried_by_bbox_and_site(tmp_path):
+    photo_survey_join_file = str(tmp_path / 'photo_survey_join.parquet')
+    photo_join().to_parquet(photo_survey_join_file, engine='pyarrow', index=False)
+    photo_index = PhotoSpatialIndex.read(photo_survey_join_file)
+    assert photo_index.query_bbox(-69.6, 44.0, -69.4, 44.2)['att_name'].tolist() == ['a.jpg', 'b.jpg']
+    assert photo_index.query_bbox(-71, 43, -69, 45)['att_name'].tolist() == ['a.jpg', 'b.jpg', 'c.jpg']
+    assert photo_index.query_site('eCB_L02')['att_name'].tolist() == ['c.jpg', 'd.jpg']
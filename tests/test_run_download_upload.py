@@ -0,0 +1,91 @@
+from concurrent.futures import Future
+import pytest
+
+pytest.importorskip('gspread')
+pytest.importorskip('oauth2client')
+pytest.importorskip('googleapiclient')
+pytest.importorskip('PIL')
+pytest.importorskip('arcgis')
+from medna_survey123 import medna_survey123_clean  # noqa: E402
+
+
+class RecordingResult:
+    """
+    Stands in for DownloadCleanJoinData and records the stages run_download_upload calls on each format.
+    Formats in exported_formats are exported, the others, e.g., an incremental CSV, are not.
+    """
+    calls = []
+    exported_formats = ['File Geodatabase']
+
+    def __init__(self, fmt, *args, **kwargs):
+        self.download_format = fmt
+        self.agol_session = kwargs.get('agol_session')
+        self.prefetched_file_path = None
+        self.stage_skips = {}
+
+    def record(self, stage):
+        self.calls.append((stage, self.download_format))
+
+    def needs_export(self):
+        return self.download_format in self.exported_formats
+
+    def submit_export(self, export_job_manager):
+        self.record('submit_export')
+        future = Future()
+        future.set_result(self.download_format + '.zip')
+        return future
+
+    def download_data(self):
+        self.record('download_data')
+
+    def backup_upload_data(self):
+        self.record('backup_upload_data')
+
+    def finish_attachments(self):
+        self.record('finish_attachments')
+
+    def record_fingerprints(self):
+        self.record('record_fingerprints')
+
+
+class StandInJobManager:
+    max_workers = []
+
+    def __init__(self, *args, **kwargs):
+        self.max_workers.append(kwargs['max_workers'])
+
+    def shutdown(self, wait=True):
+        pass
+
+
+@pytest.fixture
+def recorded_calls(monkeypatch):
+    RecordingResult.calls = []
+    RecordingResult.exported_formats = ['File Geodatabase']
+    StandInJobManager.max_workers = []
+    monkeypatch.setattr(medna_survey123_clean, 'DownloadCleanJoinData', RecordingResult)
+    monkeypatch.setattr(medna_survey123_clean, 'ExportJobManager', StandInJobManager)
+    monkeypatch.setattr(medna_survey123_clean, 'agol_login', lambda *args, **kwargs: 'agol_session')
+    return RecordingResult.calls
+
+
+def test_concurrent_export_finishes_every_format(recorded_calls):
+    medna_survey123_clean.run_download_upload(['File Geodatabase', 'CSV'], upload=False, concurrent_export=True)
+    # the exported FGDB is finished and recorded as well as the CSV processed without an export
+    for stage in ('download_data', 'finish_attachments', 'record_fingerprints'):
+        assert sorted(fmt for name, fmt in recorded_calls if name == stage) == ['CSV', 'File Geodatabase']
+    assert [fmt for name, fmt in recorded_calls if name == 'backup_upload_data'] == ['CSV']
+
+
+def test_backup_upload_data_backs_up_the_csv_format(recorded_calls):
+    medna_survey123_clean.run_download_upload(['CSV', 'File Geodatabase'], upload=False)
+    assert [fmt for name, fmt in recorded_calls if name == 'backup_upload_data'] == ['CSV']
+
+
+def test_exports_are_submitted_before_any_format_is_processed(recorded_calls):
+    RecordingResult.exported_formats = ['CSV', 'File Geodatabase']
+    medna_survey123_clean.run_download_upload(['CSV', 'File Geodatabase'], upload=False, backup=False)
+    # one export builds at a time, and the CSV export is pending while the first format is processed
+    assert StandInJobManager.max_workers == [1]
+    assert recorded_calls[:4] == [('submit_export', 'CSV'), ('submit_export', 'File Geodatabase'),
+                                  ('download_data', 'CSV'), ('download_data', 'File Geodatabase')]
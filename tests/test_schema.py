@@ -0,0 +1,37 @@
+import os
+import logging
+import importlib.util
+from importlib.machinery import SourceFileLoader
+import pytest
+from medna_survey123.survey123_schema import get_table_schema
+
+
+def test_registered_version():
+    assert get_table_schema('survey', 'v14').columns[0] == ('GlobalID', 'survey_global_id', 'object')
+
+
+@pytest.mark.parametrize('survey123_version', ['survey123_version', 'v15'])
+def test_unregistered_version_raises(survey123_version):
+    with pytest.raises(ValueError, match='no schema for survey version ' + survey123_version):
+        get_table_schema('survey', survey123_version)
+
+
+def test_fallback_is_opt_in():
+    assert get_table_schema('survey', 'v15', fallback_version='v14').columns == \
+        get_table_schema('survey', 'v14').columns
+    with pytest.raises(ValueError):
+        get_table_schema('survey', 'v15', fallback_version='v13')
+
+
+def test_fallback_logs_a_warning(caplog):
+    with caplog.at_level(logging.WARNING, logger='api_logger'):
+        get_table_schema('survey', 'v15', fallback_version='v14')
+    assert 'no schema for survey version v15, using v14' in caplog.text
+
+
+def test_settings_template_reads_a_registered_schema():
+    template_path = os.path.join(os.path.dirname(__file__), '..', 'requirements', 'settings.py.txt')
+    loader = SourceFileLoader('settings_template', template_path)
+    template = importlib.util.module_from_spec(importlib.util.spec_from_loader(loader.name, loader))
+    loader.exec_module(template)
+    assert get_table_schema('survey', template.SURVEY123_VERSION, fallback_version=template.SURVEY123_SCHEMA_FALLBACK)
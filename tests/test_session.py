@@ -0,0 +1,134 @@
+import io
+import json
+import time
+from zipfile import ZipFile
+import pytest
+
+pytest.importorskip('arcgis')
+from medna_survey123.survey123_session import AGOLTokenCache, AGOLSession  # noqa: E402
+from medna_survey123.survey123_export_jobs import ExportJobManager  # noqa: E402
+from stand_ins import PortalHandler, serve  # noqa: E402
+
+ITEMS = {'item1': {'id': 'item1', 'owner': 'medna', 'title': 'eDNA Sampling', 'type': 'Feature Service',
+                   'url': 'https://services/FeatureServer'},
+         'export1': {'id': 'export1', 'owner': 'medna', 'title': 'eDNA Sampling', 'type': 'File Geodatabase'}}
+
+
+def portal(**state):
+    state = dict({'items': ITEMS, 'tokens': {}, 'token_seconds': 7200, 'statuses': [], 'deleted': [],
+                  'export_data': b''}, **state)
+    return serve(PortalHandler, **state)
+
+
+def agol_session(url, tmp_path, **kwargs):
+    token_cache = AGOLTokenCache(str(tmp_path / 'agol_token_cache.json'), portal_url=url, **kwargs)
+    return AGOLSession(token_cache, 'medna', 'secret')
+
+
+def test_tokens_are_cached_on_disk_per_instance(tmp_path):
+    with portal() as (url, server):
+        first_cache = AGOLTokenCache(str(tmp_path / 'agol_token_cache.json'), portal_url=url)
+        assert first_cache.get_token('medna', 'secret') == 'token1'
+        assert first_cache.get_token('medna', 'secret') == 'token1'
+        assert first_cache.stats == {'hits': 1, 'misses': 1, 'refreshes': 0}
+        # a later run reads the token from disk, and its counts start over
+        second_cache = AGOLTokenCache(str(tmp_path / 'agol_token_cache.json'), portal_url=url)
+        assert second_cache.get_token('medna', 'secret') == 'token1'
+        assert second_cache.stats == {'hits': 1, 'misses': 0, 'refreshes': 0}
+        assert second_cache.session is not first_cache.session
+        # another cache file does not see the tokens of the first
+        other_cache = AGOLTokenCache(str(tmp_path / 'other_token_cache.json'), portal_url=url)
+        assert other_cache.get_token('medna', 'secret') == 'token2'
+
+
+def test_requests_send_token_and_referer(tmp_path):
+    with portal(export_data=b'PK export') as (url, server):
+        session = agol_session(url, tmp_path)
+        response = session.get(session.item_data_url('export1'))
+        assert response.content == b'PK export'
+        assert server.requests[-1][2]['token'] == 'token1'
+
+
+def test_gis_is_reopened_once_the_token_is_refreshed(tmp_path):
+    with portal(token_seconds=1) as (url, server):
+        session = agol_session(url, tmp_path, refresh_margin=0)
+        agol_gis = session.gis()
+        assert session.gis() is agol_gis
+        assert session.item('item1').title == 'eDNA Sampling'
+        time.sleep(1.1)
+        # the stand-in rejects the expired token1, so this only succeeds on a GIS with a refreshed token
+        assert session.gis() is not agol_gis
+        assert session.item('item1').title == 'eDNA Sampling'
+        assert session.gis_token == 'token2'
+
+
+def test_export_job_polls_and_downloads(tmp_path):
+    with portal(statuses=['processing', 'processing'], export_data=b'PK export') as (url, server):
+        session = agol_session(url, tmp_path)
+        export_job_manager = ExportJobManager(session, 'item1', poll_interval=0.01)
+        future = export_job_manager.submit('File Geodatabase', str(tmp_path) + '/', 'export.zip')
+        assert future.result(timeout=10) == str(tmp_path) + '/export.zip'
+        export_job_manager.shutdown()
+        assert (tmp_path / 'export.zip').read_bytes() == b'PK export'
+        export_params = [params for method, path, params in server.requests if path.endswith('/export')][0]
+        assert export_params['title'] == 'eDNA Sampling'
+        assert export_params['exportFormat'] == 'File Geodatabase'
+        assert export_job_manager.jobs[0].status == 'completed'
+
+
+@pytest.mark.parametrize('statuses, error', [(['processing', 'failed'], 'export failed'),
+                                              (['processing'] * 100, 'did not complete within')])
+def test_failed_and_timed_out_exports_are_deleted(tmp_path, statuses, error):
+    with portal(statuses=statuses) as (url, server):
+        session = agol_session(url, tmp_path)
+        export_job_manager = ExportJobManager(session, 'item1', poll_interval=0.01, max_poll_interval=0.01,
+                                              deadline=0.2)
+        future = export_job_manager.submit('CSV', str(tmp_path) + '/', 'export.zip')
+        with pytest.raises(RuntimeError, match=error):
+            future.result(timeout=10)
+        export_job_manager.shutdown()
+        assert server.deleted == ['export1']
+        assert not (tmp_path / 'export.zip').exists()
+
+
+def zip_bytes():
+    data = io.BytesIO()
+    with ZipFile(data, mode='w') as zip_file:
+        zip_file.writestr('eDNA_Sampling_v14_0.csv', 'GlobalID\na1\n')
+    return data.getvalue()
+
+
+def test_failed_segmented_download_resumes_the_same_export_on_the_next_run(tmp_path):
+    with portal(export_data=b'not a zip') as (url, server):
+        session = agol_session(url, tmp_path)
+        export_job_manager = ExportJobManager(session, 'item1', poll_interval=0.01, segmented_download=True)
+        with pytest.raises(RuntimeError, match='not a valid zip'):
+            export_job_manager.submit('CSV', str(tmp_path) + '/', 'export.zip').result(timeout=10)
+        export_job_manager.shutdown()
+        assert server.deleted == []
+        resume = json.loads((tmp_path / 'export.zip.export.json').read_text())
+        assert resume == {'item_id': 'item1', 'export_format': 'CSV', 'job_id': 'job1', 'export_item_id': 'export1'}
+
+        # the next run downloads export1 instead of exporting again
+        server.export_data = zip_bytes()
+        server.requests.clear()
+        export_job_manager = ExportJobManager(session, 'item1', poll_interval=0.01, segmented_download=True)
+        export_job_manager.submit('CSV', str(tmp_path) + '/', 'export.zip').result(timeout=10)
+        export_job_manager.shutdown()
+        assert not [path for method, path, params in server.requests if path.endswith('/export')]
+        assert export_job_manager.jobs[0].status == 'resumed'
+        assert (tmp_path / 'export.zip').read_bytes() == server.export_data
+        assert not (tmp_path / 'export.zip.export.json').exists()
+
+
+def test_unavailable_earlier_export_is_deleted_and_exported_again(tmp_path):
+    (tmp_path / 'export.zip.export.json').write_text(json.dumps(
+        {'item_id': 'item1', 'export_format': 'CSV', 'job_id': 'job0', 'export_item_id': 'export1'}))
+    with portal(statuses=['failed'], export_data=zip_bytes()) as (url, server):
+        session = agol_session(url, tmp_path)
+        export_job_manager = ExportJobManager(session, 'item1', poll_interval=0.01, segmented_download=True)
+        export_job_manager.submit('CSV', str(tmp_path) + '/', 'export.zip').result(timeout=10)
+        export_job_manager.shutdown()
+        assert server.deleted == ['export1']
+        assert [path for method, path, params in server.requests if path.endswith('/export')]
+        assert export_job_manager.jobs[0].status == 'completed'
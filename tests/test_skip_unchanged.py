@@ -0,0 +1,52 @@
+import json
+from zipfile import ZipFile
+import pytest
+
+pytest.importorskip('gspread')
+pytest.importorskip('oauth2client')
+pytest.importorskip('googleapiclient')
+pytest.importorskip('PIL')
+pytest.importorskip('arcgis')
+from medna_survey123.medna_survey123_clean import DownloadCleanJoinData  # noqa: E402
+
+
+def download_csv(tmp_path, monkeypatch):
+    input_dir = tmp_path / 'zip'
+    strip_dir = tmp_path / 'strip'
+    input_dir.mkdir(exist_ok=True)
+    strip_dir.mkdir(exist_ok=True)
+    download_result = DownloadCleanJoinData('CSV', overwrite=True, extract_attachments=False, join_tables=False,
+                                            backup=False, attachments_backup=False, skip_unchanged=True,
+                                            main_input_dir=str(input_dir) + '/',
+                                            main_input_strip_dir=str(strip_dir) + '/',
+                                            main_output_dir=str(tmp_path) + '/')
+
+    def download_export():
+        fmt_name, output_file_name, output_file_path = download_result.export_file_path()
+        with ZipFile(output_file_path, mode='w') as zip_file:
+            zip_file.writestr('rep_crew_1.csv', 'GlobalID,Notes\na1,"two\nlines"\n')
+        return output_file_path
+    monkeypatch.setattr(download_result, 'download_export', download_export)
+    download_result.download_data()
+    return download_result
+
+
+def successful_runs(tmp_path):
+    manifest_file = tmp_path / 'zip' / 'export_fingerprints.json'
+    if not manifest_file.exists():
+        return {}
+    return json.loads(manifest_file.read_text())['successful_runs']
+
+
+def test_fingerprints_recorded_only_after_the_run_succeeds(tmp_path, monkeypatch):
+    download_result = download_csv(tmp_path, monkeypatch)
+    assert (tmp_path / 'strip' / 'rep_crew_1.csv').read_text() == 'GlobalID,Notes\na1,"two lines"\n'
+    # backup and upload have not run yet, so a failure now must not mark the export as processed
+    assert successful_runs(tmp_path) == {}
+    download_result = download_csv(tmp_path, monkeypatch)
+    assert download_result.stage_skips == {}
+
+    download_result.record_fingerprints()
+    assert list(successful_runs(tmp_path)) == ['CSV']
+    download_result = download_csv(tmp_path, monkeypatch)
+    assert set(download_result.stage_skips) >= {'clean_data', 'backup_upload_data', 'upload_data'}
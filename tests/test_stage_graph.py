@@ -0,0 +1,51 @@
+import pytest
+from medna_survey123.survey123_stage_graph import StageGraph
+
+
+def test_stage_graph_runs_targets_with_their_ancestors():
+    calls = []
+    graph = StageGraph(max_workers=2)
+    graph.add_stage('download', lambda: calls.append('download') or 'zip')
+    graph.add_stage('clean', lambda zip_file: calls.append('clean') or zip_file + ':clean', inputs=['download'])
+    graph.add_stage('upload', lambda cleaned: calls.append('upload'), inputs=['clean'])
+    graph.add_stage('attachments', lambda zip_file: calls.append('attachments'), inputs=['download'])
+    values = graph.run(['clean'])
+    assert values['clean'] == 'zip:clean'
+    assert calls == ['download', 'clean']
+
+
+def test_stage_graph_rejects_unknown_inputs():
+    graph = StageGraph()
+    graph.add_stage('clean', lambda zip_file: zip_file, inputs=['download'])
+    with pytest.raises(RuntimeError, match='input download of stage clean is not produced by any stage'):
+        graph.run()
+
+
+def clean_module():
+    for module_name in ('gspread', 'oauth2client', 'googleapiclient', 'PIL', 'arcgis'):
+        pytest.importorskip(module_name)
+    from medna_survey123 import medna_survey123_clean
+    return medna_survey123_clean
+
+
+def test_build_stage_graph_passes_options():
+    medna_survey123_clean = clean_module()
+    graph = medna_survey123_clean.build_stage_graph(['CSV', 'File Geodatabase'], upload=False,
+                                                    attachment_index=True, table_store='parquet',
+                                                    csv_engine='pyarrow', dtype_plan=True, segmented_download=True,
+                                                    survey_project_filename='project_bridge')
+    csv_result = graph.stages['download_csv'].func.__self__
+    fgdb_result = graph.stages['download_fgdb'].func.__self__
+    assert (csv_result.table_store.fmt, csv_result.csv_engine, csv_result.dtype_plan) == ('parquet', 'pyarrow', True)
+    assert fgdb_result.segmented_download and fgdb_result.attachment_index
+    assert csv_result.survey_project_filename == 'project_bridge'
+    assert graph.stages['attachment_index'].inputs == ['extract_attachments', 'subset_survey', 'subset_collection',
+                                                       'subset_filter']
+
+
+@pytest.mark.parametrize('option', ['incremental', 'skip_unchanged', 'in_memory', 'concurrent_export',
+                                    'attachments_process'])
+def test_stage_graph_rejects_unsupported_options(option):
+    medna_survey123_clean = clean_module()
+    with pytest.raises(RuntimeError, match='stage_graph does not support ' + option):
+        medna_survey123_clean.run_download_upload(['CSV'], stage_graph=True, **{option: True})